@@ -0,0 +1,183 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+import orjson
+from logging_config import get_logger
+from metrics import ADMISSION_IN_USE, ADMISSION_QUEUED, ADMISSION_QUEUE_SECONDS, ADMISSION_REJECTED
+
+logger = get_logger(__name__)
+
+# Concurrency limits per priority class and worker process. A class runs at most
+# *_MAX_CONCURRENT requests; up to *_MAX_QUEUE more wait, for at most
+# ADMISSION_QUEUE_TIMEOUT_S (below the frontend's 10 s timeout). Anything beyond is
+# answered 429 with Retry-After at once. Each class has its own slots, so general
+# questions never wait behind RAG work, and routes in no class (/status/, /health/,
+# /jobs/, /metrics) are never limited.
+RAG_MAX_CONCURRENT = int(os.getenv("RAG_MAX_CONCURRENT", "8"))
+RAG_MAX_QUEUE = int(os.getenv("RAG_MAX_QUEUE", "32"))
+GENERAL_MAX_CONCURRENT = int(os.getenv("GENERAL_MAX_CONCURRENT", "16"))
+GENERAL_MAX_QUEUE = int(os.getenv("GENERAL_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "8"))
+
+# Route path -> priority class
+ADMISSION_ROUTES = {
+    "/document-query/": "rag",
+    "/document-query/stream/": "rag",
+    "/general-query/": "general",
+    "/general-query/stream/": "general",
+}
+
+
+class AdmissionRejected(Exception):
+    """The class's queue is full, or the request waited too long for a slot."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    Admits at most `max_concurrent` requests at a time, queues up to `max_queue` more
+    in arrival order, and rejects the rest. A released slot is handed straight to the
+    oldest waiter, so a newcomer can never overtake the queue.
+
+    Used from a single event loop (one per worker process).
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        """
+        Args:
+            name: Priority class, used in metrics and logs.
+            max_concurrent: Requests served at the same time.
+            max_queue: Requests allowed to wait for a slot.
+            queue_timeout: Seconds a request may wait before it is rejected.
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        # Moving average of how long a request holds its slot, for Retry-After
+        self.service_seconds = 1.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained, at least 1."""
+        return max(1, math.ceil(self.service_seconds * (self.queued + 1) / self.max_concurrent))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        logger.warning(
+            "Request rejected by admission control. class=%s reason=%s active=%d queued=%d",
+            self.name, reason, self.active, self.queued,
+        )
+        return AdmissionRejected(reason, self.retry_after())
+
+    async def acquire(self) -> float:
+        """Waits for a slot; returns the seconds spent queued.
+
+        Raises:
+            AdmissionRejected: The queue is full or the wait exceeded queue_timeout.
+        """
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return 0.0
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.labels(self.name).inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended; pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("queue_timeout") from None
+            raise
+        finally:
+            ADMISSION_QUEUED.labels(self.name).dec()
+        return time.perf_counter() - start
+
+    def release(self, held_seconds: float | None = None) -> None:
+        """Frees a slot, handing it to the oldest waiter if there is one."""
+        if held_seconds is not None:
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * held_seconds
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds a slot for the duration of the block; yields the seconds spent queued."""
+        queued = await self.acquire()
+        ADMISSION_QUEUE_SECONDS.labels(self.name).observe(queued)
+        ADMISSION_IN_USE.labels(self.name).inc()
+        start = time.perf_counter()
+        try:
+            yield queued
+        finally:
+            ADMISSION_IN_USE.labels(self.name).dec()
+            self.release(time.perf_counter() - start)
+
+
+def default_limiters() -> dict[str, ConcurrencyLimiter]:
+    return {
+        "rag": ConcurrencyLimiter("rag", RAG_MAX_CONCURRENT, RAG_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_S),
+        "general": ConcurrencyLimiter("general", GENERAL_MAX_CONCURRENT, GENERAL_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_S),
+    }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying a ConcurrencyLimiter per priority class (see ADMISSION_ROUTES).
+    A slot is held until the last byte of the response, so a streamed answer counts until
+    it has finished. Rejected requests get 429 with Retry-After and a JSON `detail`.
+    """
+
+    def __init__(self, app, limiters: dict[str, ConcurrencyLimiter] | None = None, routes: dict[str, str] | None = None):
+        self.app = app
+        self.limiters = limiters if limiters is not None else default_limiters()
+        self.routes = routes if routes is not None else ADMISSION_ROUTES
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get(self.routes.get(scope["path"])) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            async with limiter.slot():
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            await _too_many_requests(send, e)
+
+
+async def _too_many_requests(send, error: AdmissionRejected) -> None:
+    body = orjson.dumps({"detail": f"Server busy ({error.reason}); retry in {error.retry_after} s."})
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(error.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
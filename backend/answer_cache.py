@@ -0,0 +1,158 @@
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+import numpy as np
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form used as the exact-match key: case-folded, punctuation and
+    repeated whitespace removed ("What's the refund policy?" -> "whats the refund policy")."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = _PUNCTUATION.sub("", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    embedding: np.ndarray | None = None
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of finished answers, keyed by (namespace, normalized question).
+
+    The namespace carries the document version (document ID and content hash, or
+    "general"), so answers never leak across documents or re-uploads. When a
+    `semantic_threshold` is set, a lookup that misses exactly falls back to the cached
+    question in the same namespace whose embedding has the highest cosine similarity,
+    if it reaches the threshold.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, semantic_threshold: float | None = None):
+        """
+        Args:
+            max_entries: Maximum number of cached answers; least recently used are evicted.
+            ttl_seconds: Seconds an answer stays valid.
+            semantic_threshold: Minimum cosine similarity for a semantic hit; None disables it.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self) -> bool:
+        return self.semantic_threshold is not None
+
+    def get(self, namespace: str, question: str, embedding=None) -> Any | None:
+        """Returns the cached answer for a question, or None on a miss.
+
+        Args:
+            namespace: Document version the answer belongs to.
+            question: The question as asked.
+            embedding: Question embedding, used for semantic matching when enabled.
+        """
+        key = (namespace, normalize_question(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                self.hits += 1
+                return entry.value
+            if self.semantic and embedding is not None:
+                match = self._nearest(namespace, _unit(embedding), now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return self._entries[match].value
+            self.misses += 1
+            return None
+
+    def get_exact(self, namespace: str, question: str) -> Any | None:
+        """Returns the answer cached for exactly this normalized question, or None. Only a
+        hit is counted: a miss is expected to be followed by a full get()."""
+        with self._lock:
+            entry = self._live_entry((namespace, normalize_question(question)), time.monotonic())
+            if entry is None:
+                return None
+            self.hits += 1
+            return entry.value
+
+    def _live_entry(self, key: tuple[str, str], now: float) -> _Entry | None:
+        """The unexpired entry for a key, marked as recently used; expired ones are dropped."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            del self._entries[key]
+            return None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, namespace: str, question: str, value: Any, embedding=None) -> None:
+        """Caches an answer, evicting the least recently used entries over the limit."""
+        key = (namespace, normalize_question(question))
+        entry = _Entry(
+            value=value,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            embedding=_unit(embedding) if self.semantic and embedding is not None else None,
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace_prefix: str) -> int:
+        """Drops every answer whose namespace starts with the prefix; returns how many."""
+        with self._lock:
+            stale = [key for key in self._entries if key[0].startswith(namespace_prefix)]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info("Answer cache invalidated. namespace=%s entries=%d", namespace_prefix, len(stale))
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
+
+    def _nearest(self, namespace: str, vector: np.ndarray, now: float) -> tuple[str, str] | None:
+        """Returns the key of the most similar live question in a namespace above the threshold."""
+        best_key, best_score = None, self.semantic_threshold
+        for key, entry in self._entries.items():
+            if key[0] != namespace or entry.embedding is None or entry.expires_at <= now:
+                continue
+            score = float(np.dot(vector, entry.embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is not None:
+            logger.info("Answer cache semantic hit. namespace=%s similarity=%.3f", namespace, best_score)
+        return best_key
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,103 @@
+"""
+Azure AI inference clients wired for resilience (see resilience.py). Imported on first use
+by chat.py: the Azure SDK is the slowest import of the backend.
+"""
+import asyncio
+import os
+import aiohttp
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from azure.core.pipeline.transport import AioHttpTransport
+from llama_index.llms.azure_inference import AzureAICompletionsModel
+from resilience import CircuitBreaker, DeadlineExceeded, call_timeout, remaining_budget
+
+# Keep-alive pool shared by the async LLM calls of one event loop
+AZURE_POOL_SIZE = int(os.getenv("AZURE_POOL_SIZE", "100"))
+AZURE_KEEPALIVE_S = float(os.getenv("AZURE_KEEPALIVE_S", "60"))
+
+# Failed responses: throttling (429) is left to the retry policy and does not count
+_FAILURE_STATUS_CODES = {408, 500, 502, 503, 504}
+
+_sessions: dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+
+class ResiliencePolicy(SansIOHTTPPolicy):
+    """
+    Pipeline policy applied to every attempt (it runs after the retry policy), in both the
+    sync and the async clients: fails fast while the breaker is open, bounds the attempt's
+    connect and read timeouts by the request's remaining deadline, and reports the outcome
+    to the breaker.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, connect_timeout: float, read_timeout: float):
+        self.breaker = breaker
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def on_request(self, request) -> None:
+        options = request.context.options
+        options["connection_timeout"] = call_timeout(self.connect_timeout, self.breaker.name)
+        options["read_timeout"] = call_timeout(self.read_timeout, self.breaker.name)
+        self.breaker.check()
+
+    def on_response(self, request, response) -> None:
+        if response.http_response.status_code in _FAILURE_STATUS_CODES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def on_exception(self, request) -> None:
+        # Connection errors and timeouts; the exception being handled is re-raised after this
+        remaining = remaining_budget()
+        self.breaker.record_failure()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(
+                f"The request's deadline passed during the {self.breaker.name} call.", self.breaker.name
+            )
+
+
+def resilient_client_kwargs(
+    breaker: CircuitBreaker, connect_timeout: float, read_timeout: float, retry_total: int
+) -> dict:
+    """client_kwargs for the llama_index Azure models: the ResiliencePolicy and a bounded
+    retry policy (the SDK defaults to 10 retries with up to 120 s of backoff)."""
+    return {
+        "custom_hook_policy": ResiliencePolicy(breaker, connect_timeout, read_timeout),
+        "retry_total": retry_total,
+        "retry_backoff_max": 4,
+    }
+
+
+def shared_session() -> aiohttp.ClientSession:
+    """The running event loop's keep-alive session, created on first use."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        # Configured as AioHttpTransport configures the sessions it owns
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=AZURE_POOL_SIZE, keepalive_timeout=AZURE_KEEPALIVE_S),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            trust_env=True,
+            auto_decompress=False,
+        )
+        _sessions[loop] = session
+    return session
+
+
+async def close_sessions() -> None:
+    """Closes the running event loop's shared session, if it has one."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+class PooledCompletionsModel(AzureAICompletionsModel):
+    """
+    AzureAICompletionsModel whose async calls reuse keep-alive connections. The base class
+    creates and closes a client, and with it an aiohttp session, for every async request,
+    so each call paid a new TCP and TLS handshake; here those clients all send through
+    the event loop's shared session, which they do not close.
+    """
+
+    def _create_async_client(self):
+        transport = AioHttpTransport(session=shared_session(), session_owner=False)
+        return self._async_client_class(**self._async_client_kwargs, transport=transport)
@@ -0,0 +1,89 @@
+"""
+Ingestion embedding benchmark against a local fake embedding server.
+
+Starts an HTTP server that speaks the Azure AI inference /embeddings protocol and sleeps
+for `base latency + per-text latency` on every request, then embeds the same chunks with:
+
+  * the previous path (VectorStoreIndex default: batches of 10, one request at a time)
+  * the concurrent ingestion stage (ingestion.embed_and_store) at several settings
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_ingestion --chunks 1500 --latency-ms 150
+
+The speedup grows with the server's latency. At --chunks 600 --latency-ms 150 (and the
+default --per-text-ms 1), the shipped defaults ran x3.1 faster than the previous path.
+At --chunks 200 --latency-ms 20 they ran x1.3 faster. The README lists the full figures.
+"""
+import argparse
+import json
+import time
+from llama_index.core import VectorStoreIndex, StorageContext
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.embeddings.azure_inference import AzureAIEmbeddingsModel
+from ingestion import embed_and_store
+from benchmarks.fakes import start_fake_embedding_server
+
+
+def make_nodes(count: int):
+    return [TextNode(text=f"Chunk {i}: " + "lorem ipsum dolor sit amet " * 60) for i in range(count)]
+
+
+def bench_default(endpoint: str, chunks: int) -> float:
+    """Previous behaviour: VectorStoreIndex embeds sequentially in batches of 10."""
+    model = AzureAIEmbeddingsModel(endpoint=endpoint, credential="fake", model_name="fake-embed")
+    storage_context = StorageContext.from_defaults(vector_store=SimpleVectorStore())
+    start = time.perf_counter()
+    VectorStoreIndex(make_nodes(chunks), storage_context=storage_context, embed_model=model)
+    return time.perf_counter() - start
+
+
+def bench_concurrent(endpoint: str, chunks: int, batch_size: int, max_in_flight: int) -> float:
+    model = AzureAIEmbeddingsModel(
+        endpoint=endpoint, credential="fake", model_name="fake-embed", embed_batch_size=batch_size
+    )
+    start = time.perf_counter()
+    embed_and_store(
+        make_nodes(chunks), model, SimpleVectorStore(),
+        batch_size=batch_size, max_in_flight=max_in_flight, base_delay=0.05,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=600)
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="fixed latency per request")
+    parser.add_argument("--per-text-ms", type=float, default=1.0, help="extra latency per text in a request")
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every Nth request with 429")
+    args = parser.parse_args()
+
+    server, endpoint = start_fake_embedding_server(
+        args.latency_ms / 1000, args.per_text_ms / 1000, args.throttle_every
+    )
+    results = {"chunks": args.chunks, "latency_ms": args.latency_ms, "per_text_ms": args.per_text_ms, "runs": []}
+    try:
+        baseline = bench_default(endpoint, args.chunks)
+        results["runs"].append({"mode": "default", "batch_size": 10, "max_in_flight": 1, "seconds": baseline})
+        for batch_size, max_in_flight in [(10, 1), (96, 1), (32, 4), (96, 4), (32, 8)]:
+            seconds = bench_concurrent(endpoint, args.chunks, batch_size, max_in_flight)
+            results["runs"].append({
+                "mode": "concurrent", "batch_size": batch_size, "max_in_flight": max_in_flight, "seconds": seconds,
+            })
+    finally:
+        server.shutdown()
+
+    for run in results["runs"]:
+        run["speedup"] = round(baseline / run["seconds"], 2)
+        run["chunks_per_s"] = round(args.chunks / run["seconds"], 1)
+        run["seconds"] = round(run["seconds"], 3)
+        print(
+            f"{run['mode']:>10}  batch={run['batch_size']:>3}  in_flight={run['max_in_flight']}  "
+            f"{run['seconds']:>7.3f}s  {run['chunks_per_s']:>8.1f} chunks/s  x{run['speedup']}"
+        )
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+End-to-end ingestion and document query benchmark, fully offline.
+
+Replaces the Azure models with the deterministic fakes in benchmarks.fakes (FakeLLM,
+HashEmbedding) and keeps every store in a temporary directory, then for each document
+size runs the real create_index_from_document -> get_document_answer path and records:
+
+  * ingestion   seconds per stage (parse, chunk, embed, store), pages/s and chunks/s
+  * queries     mean and p95 latency per stage, as measured by metrics.track_stages for
+                the timings field of /document-query/ (cache_lookup, index_load,
+                retrieve, embed, rerank, synthesize) and in total
+  * memory      resident set size after ingestion and after the queries, and the peak
+
+Every question is distinct and the answer cache is off unless --answer-cache is given,
+so each query runs the full pipeline. Results are printed as JSON; --output also writes
+them to a file and --compare prints the relative change of every timing against a
+previous results file, e.g. one produced on the parent commit:
+
+    python -m benchmarks.bench_pipeline --output before.json
+    git switch my-branch
+    python -m benchmarks.bench_pipeline --compare before.json
+
+Run from the backend directory.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from metrics import track_stages
+from benchmarks.fakes import VOCABULARY, FakeLLM, HashEmbedding, write_pdf
+
+QUERY_STAGES = ("cache_lookup", "index_load", "retrieve", "embed", "rerank", "synthesize", "total")
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), else the peak reported by getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def questions(pages: int, count: int) -> list[str]:
+    """Distinct questions: most are vague topic questions, every fourth names a page's reference code."""
+    rng = random.Random(pages)
+    result = []
+    for i in range(count):
+        page = rng.randint(1, pages)
+        if i % 4 == 3:
+            result.append(f"What does reference RX-{page:05d} say? ({i})")
+        else:
+            first, second = rng.sample(VOCABULARY, 2)
+            result.append(f"How does the {first} relate to the {second} in section {i}?")
+    return result
+
+
+def summarize(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))] * 1000, 2),
+    }
+
+
+def ingest(main, path: str, pages: int) -> tuple[str, dict]:
+    marks = []
+    start = time.perf_counter()
+    document_id = main.create_index_from_document(
+        path, os.path.basename(path), content_hash=str(pages),
+        progress=lambda stage, **counts: marks.append((stage, time.perf_counter())),
+    )
+    seconds = time.perf_counter() - start
+    # Each stage runs from its progress report to the next one (the last until the end)
+    stage_seconds = {}
+    for (stage, at), (_, until) in zip(marks, marks[1:] + [("end", start + seconds)]):
+        stage_seconds[stage] = round(stage_seconds.get(stage, 0.0) + until - at, 4)
+    chunks = main.index_registry.record(document_id).chunk_count
+    return document_id, {
+        "seconds": round(seconds, 3),
+        "chunks": chunks,
+        "pages_per_s": round(pages / seconds, 1),
+        "chunks_per_s": round(chunks / seconds, 1),
+        "stages_s": stage_seconds,
+    }
+
+
+async def run_queries(main, document_id: str, pages: int, count: int, reranker: str) -> dict:
+    per_stage = {stage: [] for stage in QUERY_STAGES}
+    for question in questions(pages, count):
+        with track_stages("benchmark") as timings:
+            await main.get_document_answer(question, document_id, reranker)
+        for stage in QUERY_STAGES:
+            per_stage[stage].append(timings.seconds.get(stage, 0.0))
+    return {stage: summarize(samples) for stage, samples in per_stage.items()}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """Prints the relative change of ingestion time, per-stage query latency and memory against a previous run."""
+    previous = {run["pages"]: run for run in baseline.get("runs", [])}
+    for run in results["runs"]:
+        before = previous.get(run["pages"])
+        if before is None:
+            continue
+        rows = [("ingest seconds", before["ingest"]["seconds"], run["ingest"]["seconds"])]
+        rows += [
+            (f"query {stage} mean_ms", before["query"][stage]["mean_ms"], run["query"][stage]["mean_ms"])
+            for stage in QUERY_STAGES if stage in before["query"]
+        ]
+        rows.append(("rss_after_queries_mb", before["memory"]["rss_after_queries_mb"], run["memory"]["rss_after_queries_mb"]))
+        print(f"pages={run['pages']} vs {baseline.get('commit') or 'baseline'}")
+        for name, old, new in rows:
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"  {name:<28} {old:>10} -> {new:>10}  {change}")
+
+
+def run_sizes(args, app_main, workdir: str, results: dict) -> None:
+    for pages in args.pages:
+        path = write_pdf(os.path.join(workdir, f"document_{pages}.pdf"), pages)
+        rss_before = rss_mb()
+        document_id, ingest_stats = ingest(app_main, path, pages)
+        rss_ingested = rss_mb()
+        query_stats = asyncio.run(run_queries(app_main, document_id, pages, args.queries, args.reranker))
+        memory = {
+            "rss_before_mb": round(rss_before, 1),
+            "rss_after_ingest_mb": round(rss_ingested, 1),
+            "rss_after_queries_mb": round(rss_mb(), 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+        results["runs"].append({"pages": pages, "ingest": ingest_stats, "query": query_stats, "memory": memory})
+        print(
+            f"pages={pages:>4}  chunks={ingest_stats['chunks']:>5}  ingest={ingest_stats['seconds']:>7.2f}s "
+            f"({ingest_stats['pages_per_s']} pages/s, {ingest_stats['chunks_per_s']} chunks/s)  "
+            f"query mean={query_stats['total']['mean_ms']}ms p95={query_stats['total']['p95_ms']}ms  "
+            f"rss={memory['rss_after_queries_mb']}MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200], help="document sizes to run")
+    parser.add_argument("--queries", type=int, default=20, help="questions per document")
+    parser.add_argument("--reranker", default="bm25", help="reranker backend for the queries")
+    parser.add_argument("--llm-first-token-ms", type=float, default=200.0)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=50.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="per embedding call")
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.5, help="extra per embedded text")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--compare", help="results file of a previous run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="keep the application's INFO logs")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    # chat.py refuses to import without the Azure settings; the fakes below replace the models
+    for name in ("AZURE_META_API", "AZURE_META_ENDPOINT", "AZURE_COHERE_API", "AZURE_COHERE_ENDPOINT"):
+        os.environ.setdefault(name, "https://offline.invalid" if name.endswith("ENDPOINT") else "offline")
+    os.environ["CHROMA_DB_PATH"] = os.path.join(workdir, "chroma_db")
+    os.environ["NUMPY_STORE_DIR"] = os.path.join(workdir, "vector_store")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite3")
+    os.environ["REGISTRY_DB_PATH"] = os.path.join(workdir, "registry.sqlite3")
+    os.environ["ANSWER_CACHE_MODE"] = "semantic" if args.answer_cache else "off"
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    llm = FakeLLM(first_token_latency_s=args.llm_first_token_ms / 1000, tokens_per_s=args.llm_tokens_per_s)
+    embed_model = HashEmbedding(latency_s=args.embed_latency_ms / 1000, per_text_latency_s=args.embed_per_text_ms / 1000)
+    import chat
+    chat.initialize_llm = lambda: llm
+    chat.initialize_embed_model = lambda: embed_model
+    import main as app_main
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose")},
+        "runs": [],
+    }
+    try:
+        run_sizes(args, app_main, workdir, results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Per-request query engine overhead, before and after caching engines per index.
+
+Builds a hybrid index over synthetic chunks with a mock embedding model and a mock LLM,
+then times getting a query engine (MMR retriever, response synthesizer, BM25 reranker)
+for a request:
+
+  * uncached  index.as_query_engine(...) on every request (previous behaviour)
+  * cached    query_type._build_query_engine (built once per index and configuration)
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_query_engine --requests 2000
+"""
+import argparse
+import json
+import statistics
+import time
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQueryMode
+from hybrid_retrieval import HybridIndex, LexicalIndex
+from query_type import _build_query_engine
+from rerankers import BM25Rerank
+
+
+def make_index(chunks: int) -> HybridIndex:
+    nodes = [
+        TextNode(text=f"Section {i}: refund policy clause {i} " + "lorem ipsum dolor sit amet " * 40, id_=f"n{i}")
+        for i in range(chunks)
+    ]
+    vector_index = VectorStoreIndex(nodes, embed_model=MockEmbedding(embed_dim=256))
+    return HybridIndex(vector_index, LexicalIndex(nodes))
+
+
+def build_uncached(index, llm, reranker):
+    return index.as_query_engine(
+        llm=llm,
+        similarity_top_k=10,
+        vector_store_query_mode=VectorStoreQueryMode.MMR,
+        node_postprocessors=[reranker],
+    )
+
+
+def time_calls(fn, requests: int) -> dict:
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_us": round(statistics.mean(samples) * 1e6, 1),
+        "p95_us": round(samples[int(0.95 * (len(samples) - 1))] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=200)
+    args = parser.parse_args()
+
+    index = make_index(args.chunks)
+    llm = MockLLM(max_tokens=16)
+    reranker = BM25Rerank(top_n=3)
+
+    results = {
+        "requests": args.requests,
+        "chunks": args.chunks,
+        "uncached": time_calls(lambda: build_uncached(index, llm, reranker), args.requests),
+        "cached": time_calls(lambda: _build_query_engine(index, llm, reranker), args.requests),
+    }
+    results["saved_us"] = round(results["uncached"]["mean_us"] - results["cached"]["mean_us"], 1)
+    print(
+        f"uncached={results['uncached']['mean_us']:.1f}us  cached={results['cached']['mean_us']:.1f}us  "
+        f"saved={results['saved_us']:.1f}us/request"
+    )
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
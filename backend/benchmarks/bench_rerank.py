@@ -0,0 +1,130 @@
+"""
+Reranker latency and quality on the fixed evaluation set in rerank_eval.json.
+
+Every backend reranks the same ten candidates per question down to the top 3:
+
+  * none          retrieval order
+  * bm25          local BM25 blended with the retrieval score (rerankers.BM25Rerank)
+  * llm-serial    llama_index LLMRerank, choice batches sent one after another
+  * llm-parallel  rerankers.ParallelLLMRerank, choice batches sent concurrently
+
+Offline (default) the LLM backends use a fake LLM that sleeps --llm-latency-ms (1200) per
+call, so only their latency is meaningful and their quality is reported as null. With
+--live they call the configured Azure LLM (AZURE_META_* variables) and quality is measured
+too. No live results have been recorded, so the set makes no claim about LLM rerank quality.
+
+Offline results (10 candidates and 2 choice batches per question, top 3 kept):
+
+  backend        mean latency  hit@1  hit@3  mrr
+  none           0.0 ms        0.417  0.917  0.639
+  bm25           0.8 ms        0.917  1.0    0.944
+  llm-serial     2403 ms       -      -      -
+  llm-parallel   1205 ms       -      -      -
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_rerank
+    python -m benchmarks.bench_rerank --live
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from llama_index.core.postprocessor.llm_rerank import LLMRerank
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from rerankers import BM25Rerank, ParallelLLMRerank
+from benchmarks.fakes import FakeLLM
+
+EVAL_SET = os.path.join(os.path.dirname(__file__), "rerank_eval.json")
+TOP_N = 3
+CHOICE_BATCH_SIZE = 5
+
+
+class RetrievalOrder:
+    """The "none" backend: keeps the first-stage order."""
+
+    async def apostprocess_nodes(self, nodes, query_bundle=None):
+        return nodes[:TOP_N]
+
+
+class SerialLLMRerank:
+    """Previous behaviour: LLMRerank's synchronous path, one batch after another."""
+
+    def __init__(self, llm):
+        self._reranker = LLMRerank(llm=llm, choice_batch_size=CHOICE_BATCH_SIZE, top_n=TOP_N)
+
+    async def apostprocess_nodes(self, nodes, query_bundle=None):
+        return self._reranker.postprocess_nodes(nodes, query_bundle)
+
+
+def load_eval_set():
+    with open(EVAL_SET) as f:
+        data = json.load(f)
+    cases = []
+    for query in data["queries"]:
+        # Descending similarity scores, as a vector retriever would return them
+        nodes = [
+            NodeWithScore(node=TextNode(text=data["passages"][pid], id_=pid), score=1.0 - 0.02 * rank)
+            for rank, pid in enumerate(query["candidates"])
+        ]
+        cases.append((query["question"], query["relevant"], nodes))
+    return cases
+
+
+async def evaluate(reranker, cases):
+    latencies, hits_at_1, hits_at_n, reciprocal_ranks = [], 0, 0, []
+    for question, relevant, nodes in cases:
+        start = time.perf_counter()
+        kept = await reranker.apostprocess_nodes(list(nodes), QueryBundle(question))
+        latencies.append(time.perf_counter() - start)
+        ids = [n.node.id_ for n in kept]
+        hits_at_1 += bool(ids) and ids[0] == relevant
+        hits_at_n += relevant in ids
+        reciprocal_ranks.append(1 / (ids.index(relevant) + 1) if relevant in ids else 0.0)
+    latencies.sort()
+    return {
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+        "hit_at_1": round(hits_at_1 / len(cases), 3),
+        f"hit_at_{TOP_N}": round(hits_at_n / len(cases), 3),
+        "mrr": round(statistics.mean(reciprocal_ranks), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="use the configured Azure LLM for the llm backends")
+    parser.add_argument("--llm-latency-ms", type=float, default=1200.0, help="fake LLM latency per call (offline)")
+    args = parser.parse_args()
+
+    if args.live:
+        from chat import initialize_llm
+        llm = initialize_llm()
+    else:
+        # Every choice-select prompt is answered with the batch's first chunk
+        llm = FakeLLM(response="Doc: 1, Relevance: 5", first_token_latency_s=args.llm_latency_ms / 1000, tokens_per_s=0)
+
+    backends = {
+        "none": RetrievalOrder(),
+        "bm25": BM25Rerank(top_n=TOP_N),
+        "llm-serial": SerialLLMRerank(llm),
+        "llm-parallel": ParallelLLMRerank(llm=llm, choice_batch_size=CHOICE_BATCH_SIZE, top_n=TOP_N),
+    }
+    cases = load_eval_set()
+    results = {"queries": len(cases), "top_n": TOP_N, "live": args.live, "runs": []}
+    for name, reranker in backends.items():
+        run = {"backend": name, **asyncio.run(evaluate(reranker, cases))}
+        if name.startswith("llm") and not args.live:
+            run.update({"hit_at_1": None, f"hit_at_{TOP_N}": None, "mrr": None})
+        results["runs"].append(run)
+        print(
+            f"{name:>13}  mean={run['mean_ms']:>9.2f}ms  p95={run['p95_ms']:>9.2f}ms  "
+            f"hit@1={run['hit_at_1']}  hit@{TOP_N}={run[f'hit_at_{TOP_N}']}  mrr={run['mrr']}"
+        )
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
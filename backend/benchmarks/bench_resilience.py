@@ -0,0 +1,112 @@
+"""
+Tail latency of the Azure clients against a fake inference server with latency spikes.
+
+  * embeddings  sequential query embeddings through the real AzureAIEmbeddingsModel, with
+                and without hedging (HedgedEmbeddingModel); every --spike-every-th request
+                to the server stalls for --spike-ms
+  * llm         sequential async chat calls through AzureAICompletionsModel and through
+                PooledCompletionsModel; reports latency and TCP connections opened
+
+    python -m benchmarks.bench_resilience --queries 500 --spike-every 25 --spike-ms 800
+
+Run from the backend directory.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from llama_index.core.llms import ChatMessage
+from llama_index.embeddings.azure_inference import AzureAIEmbeddingsModel
+from llama_index.llms.azure_inference import AzureAICompletionsModel
+from azure_clients import PooledCompletionsModel, close_sessions, resilient_client_kwargs
+from benchmarks.fakes import start_fake_embedding_server
+from resilience import CircuitBreaker, HedgedEmbeddingModel, HedgePolicy
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(int(q * len(samples)), len(samples) - 1)] * 1000, 2)
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(samples[-1] * 1000, 2)}
+
+
+def client_kwargs(name: str) -> dict:
+    return resilient_client_kwargs(CircuitBreaker(name), 5.0, 30.0, retry_total=2)
+
+
+def bench_embeddings(args, hedged: bool) -> dict:
+    server, url = start_fake_embedding_server(
+        args.latency_ms / 1000, 0.0, spike_every=args.spike_every, spike_s=args.spike_ms / 1000
+    )
+    model = AzureAIEmbeddingsModel(
+        endpoint=url, credential="fake", model_name="fake-embed", client_kwargs=client_kwargs("embeddings")
+    )
+    if hedged:
+        model = HedgedEmbeddingModel(model, HedgePolicy("embeddings", max_ratio=args.hedge_ratio))
+
+    async def run():
+        latencies = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            await model.aget_query_embedding(f"question {i}")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    latencies = asyncio.run(run())
+    server.shutdown()
+    return {
+        "hedged": hedged,
+        **percentiles(latencies),
+        "server_requests": server.request_counter["requests"],
+    }
+
+
+def bench_llm(args, pooled: bool) -> dict:
+    server, url = start_fake_embedding_server(args.latency_ms / 1000, 0.0)
+    model_class = PooledCompletionsModel if pooled else AzureAICompletionsModel
+    llm = model_class(endpoint=url, credential="fake", model_name="fake-llm", client_kwargs=client_kwargs("llm"))
+
+    async def run():
+        latencies = []
+        for _ in range(args.llm_calls):
+            start = time.perf_counter()
+            await llm.achat([ChatMessage(role="user", content="question")])
+            latencies.append(time.perf_counter() - start)
+        await close_sessions()
+        return latencies
+
+    latencies = asyncio.run(run())
+    server.shutdown()
+    return {
+        "pooled": pooled,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "connections": server.request_counter["connections"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=300, help="query embeddings per run")
+    parser.add_argument("--llm-calls", type=int, default=50, help="async chat calls per run")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="base server latency")
+    parser.add_argument("--spike-every", type=int, default=25, help="every Nth request is slow")
+    parser.add_argument("--spike-ms", type=float, default=800.0, help="length of a latency spike")
+    parser.add_argument("--hedge-ratio", type=float, default=0.1, help="EMBED_HEDGE_MAX_RATIO")
+    args = parser.parse_args()
+
+    results = {
+        "embeddings": [bench_embeddings(args, hedged) for hedged in (False, True)],
+        "llm": [bench_llm(args, pooled) for pooled in (False, True)],
+    }
+    for row in results["embeddings"]:
+        print(
+            f"embeddings hedged={row['hedged']!s:<5}  p50={row['p50_ms']}ms  p99={row['p99_ms']}ms"
+            f"  max={row['max_ms']}ms  server_requests={row['server_requests']}"
+        )
+    for row in results["llm"]:
+        print(f"llm pooled={row['pooled']!s:<5}  mean={row['mean_ms']}ms  connections={row['connections']}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
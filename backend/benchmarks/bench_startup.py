@@ -0,0 +1,172 @@
+"""
+Cold start: import-time report and time to the first healthy response, fully offline.
+
+  * imports     `python -X importtime -c "import main"` in a fresh interpreter: total
+                import time and the slowest top-level imports (cumulative, so a module's
+                own dependencies are included in its figure)
+  * startup     spawns uvicorn serving main:app in a fresh process, with the Azure models
+                replaced by the fakes in benchmarks.fakes, and polls GET /health/ until it
+                answers 200 (time to healthy) and until it reports warm=true (time to warm)
+
+Every store lives in a temporary directory. Compare --warmup on and off to see what the
+background warm-up costs the first response:
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --runs 5 --no-warmup
+
+Run from the backend directory.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+OFFLINE_ENV = {
+    "AZURE_META_API": "offline",
+    "AZURE_META_ENDPOINT": "https://offline.invalid",
+    "AZURE_COHERE_API": "offline",
+    "AZURE_COHERE_ENDPOINT": "https://offline.invalid",
+}
+
+
+def offline_env(workdir: str, warmup: bool) -> dict:
+    env = {**os.environ, **OFFLINE_ENV}
+    env.update({
+        "CHROMA_DB_PATH": os.path.join(workdir, "chroma_db"),
+        "NUMPY_STORE_DIR": os.path.join(workdir, "vector_store"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite3"),
+        "REGISTRY_DB_PATH": os.path.join(workdir, "registry.sqlite3"),
+        "WARMUP_ON_STARTUP": "1" if warmup else "0",
+    })
+    return env
+
+
+def import_report(env: dict, top: int) -> dict:
+    """Parses -X importtime for `import main`: total milliseconds and the slowest imports."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative), depth, name.strip()))
+    top_level = [(us, name) for us, depth, name in rows if depth == 0]
+    return {
+        "total_ms": round(sum(us for us, _ in top_level) / 1000, 1),
+        "slowest": [
+            {"module": name, "cumulative_ms": round(us / 1000, 1)}
+            for us, name in sorted(
+                ((us, name) for us, depth, name in rows if depth <= 1), reverse=True
+            )[:top]
+        ],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_health(port: int) -> dict | None:
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+        connection.request("GET", "/health/")
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return json.loads(body) if response.status == 200 else None
+    except OSError:
+        return None
+
+
+def time_startup(env: dict, timeout: float) -> dict:
+    """Seconds from spawning the server to its first healthy and first warm /health/ response."""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--serve", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    healthy = warm = None
+    try:
+        while time.perf_counter() - start < timeout and warm is None:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            health = get_health(port)
+            now = time.perf_counter() - start
+            if health is not None:
+                healthy = healthy if healthy is not None else now
+                if health["warm"]:
+                    warm = now
+                elif env["WARMUP_ON_STARTUP"] == "0":
+                    break
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {"healthy_s": healthy, "warm_s": warm}
+
+
+def serve(port: int) -> None:
+    """Child process: the app with the fake models, as bench_pipeline uses them."""
+    from benchmarks.fakes import FakeLLM, HashEmbedding
+    import chat
+    chat.initialize_llm = lambda: FakeLLM(first_token_latency_s=0.0, tokens_per_s=0)
+    chat.initialize_embed_model = lambda: HashEmbedding()
+    import uvicorn
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def summarize(samples: list) -> dict | None:
+    samples = [s for s in samples if s is not None]
+    if not samples:
+        return None
+    return {"mean_s": round(statistics.mean(samples), 3), "min_s": round(min(samples), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="server starts to time")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="set WARMUP_ON_STARTUP=0")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for one server")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as workdir:
+        env = offline_env(workdir, args.warmup)
+        imports = import_report(env, args.top)
+        runs = [time_startup(env, args.timeout) for _ in range(args.runs)]
+
+    results = {
+        "warmup": args.warmup,
+        "imports": imports,
+        "healthy": summarize([run["healthy_s"] for run in runs]),
+        "warm": summarize([run["warm_s"] for run in runs]),
+        "runs": runs,
+    }
+    for row in imports["slowest"]:
+        print(f"  {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+    print(
+        f"import main={imports['total_ms']}ms  healthy={results['healthy']}  warm={results['warm']}"
+    )
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
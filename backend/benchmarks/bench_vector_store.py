@@ -0,0 +1,95 @@
+"""
+Vector search latency per query: Chroma (SQLite + HNSW) against the NumPy store.
+
+Both stores hold the same random unit vectors (1024-d like the Cohere embeddings) and
+answer the same queries:
+
+  * chroma        ChromaVectorStore on a persistent client in a temporary directory
+  * numpy         numpy_vector_store.NumpyVectorStore, exact search on the memory-mapped matrix
+  * *_mmr         the same with VectorStoreQueryMode.MMR
+
+recall@k is the overlap of each backend's top-k with the exact top-k.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_vector_store --chunks 3000
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+import numpy as np
+import chromadb
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryMode
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from numpy_vector_store import NumpyVectorStore
+
+
+def make_nodes(vectors: np.ndarray, offset: int) -> list[TextNode]:
+    return [
+        TextNode(text=f"chunk {i}", id_=f"n{i}", metadata={"page_label": str(i)}, embedding=vector.tolist())
+        for i, vector in enumerate(vectors, start=offset)
+    ]
+
+
+def time_queries(store, queries: np.ndarray, top_k: int, mode) -> tuple[dict, list[list[str]]]:
+    samples, ids = [], []
+    for query in queries:
+        request = VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=top_k, mode=mode)
+        start = time.perf_counter()
+        result = store.query(request)
+        samples.append(time.perf_counter() - start)
+        ids.append(result.ids)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1e3, 3),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))] * 1e3, 3),
+    }, ids
+
+
+def recall(found: list[list[str]], exact: list[list[str]]) -> float:
+    return round(statistics.mean(len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    exact = [[f"n{i}" for i in np.argsort(-(vectors @ q))[:args.top_k]] for q in queries]
+
+    results = {"chunks": args.chunks, "dim": args.dim, "queries": args.queries}
+    with tempfile.TemporaryDirectory() as tmp:
+        collection = chromadb.PersistentClient(path=f"{tmp}/chroma").get_or_create_collection("bench")
+        chroma = ChromaVectorStore(chroma_collection=collection)
+        numpy_store = NumpyVectorStore.create(f"{tmp}/numpy", {})
+        for start in range(0, args.chunks, 1000):
+            batch = make_nodes(vectors[start:start + 1000], start)
+            chroma.add(batch)
+            numpy_store.add(batch)
+        numpy_store.flush()
+        numpy_store = NumpyVectorStore.open(numpy_store.path)
+
+        for name, store in (("chroma", chroma), ("numpy", numpy_store)):
+            timing, ids = time_queries(store, queries, args.top_k, VectorStoreQueryMode.DEFAULT)
+            results[name] = {**timing, "recall_at_k": recall(ids, exact)}
+            results[f"{name}_mmr"], _ = time_queries(store, queries, args.top_k, VectorStoreQueryMode.MMR)
+
+    print(
+        f"chroma={results['chroma']['mean_ms']:.2f}ms  numpy={results['numpy']['mean_ms']:.2f}ms  "
+        f"chroma_mmr={results['chroma_mmr']['mean_ms']:.2f}ms  numpy_mmr={results['numpy_mmr']['mean_ms']:.2f}ms"
+    )
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
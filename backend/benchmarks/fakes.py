@@ -0,0 +1,312 @@
+"""
+Deterministic stand-ins for the Azure models, shared by the benchmarks.
+
+  * FakeLLM                 completions whose text depends only on the prompt, with a
+                            configurable time-to-first-token and token rate
+  * HashEmbedding           feature-hashed bag-of-words vectors, so texts that share words
+                            are similar and retrieval behaves plausibly; optional latency
+  * start_fake_embedding_server
+                            an HTTP server speaking the Azure AI inference /embeddings (and
+                            /chat/completions) protocol, for benchmarking the real clients:
+                            batching, latency spikes, failures and connection reuse
+  * write_pdf               a PDF of N pages of reproducible prose
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, List, Optional, Sequence
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.generic_utils import (
+    async_stream_completion_response_to_chat_response,
+    completion_response_to_chat_response,
+)
+from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+EMBED_DIM = 1024
+
+VOCABULARY = (
+    "refund warranty invoice shipment clause liability contract supplier delivery payment "
+    "policy customer order product defect repair replacement service period notice term "
+    "agreement schedule price discount account report section annex review audit safety "
+    "maintenance inspection component assembly module voltage pressure temperature sensor "
+    "calibration tolerance material batch storage transport label certificate standard"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def hash_embedding(text: str, dim: int = EMBED_DIM) -> List[float]:
+    """Unit vector of hashed word counts: each word adds +-1 to one of `dim` buckets."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split():
+        seed = _seed(word)
+        vector[seed % dim] += 1.0 if (seed >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[_seed(text) % dim] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class FakeLLM(CustomLLM):
+    """
+    Completion model whose answer is a pseudo-random sentence seeded by the prompt (or the
+    fixed `response`), produced after `first_token_latency_s` and then `tokens_per_s`
+    words per second. Streaming yields one word at a time at that rate.
+    """
+
+    first_token_latency_s: float = 0.2
+    tokens_per_s: float = 50.0
+    answer_tokens: int = 40
+    response: Optional[str] = None
+    calls: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=8192, num_output=512, model_name="fake-llm")
+
+    def _tokens(self, prompt: str) -> List[str]:
+        if self.response is not None:
+            words = self.response.split(" ")
+        else:
+            rng = random.Random(_seed(prompt))
+            words = [rng.choice(VOCABULARY) for _ in range(self.answer_tokens)]
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self.calls += 1
+        tokens = self._tokens(prompt)
+        time.sleep(self.first_token_latency_s + self._token_delay() * (len(tokens) - 1))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        self.calls += 1
+        tokens = self._tokens(prompt)
+
+        def gen():
+            text = ""
+            for i, token in enumerate(tokens):
+                time.sleep(self.first_token_latency_s if i == 0 else self._token_delay())
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self.calls += 1
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self.first_token_latency_s + self._token_delay() * (len(tokens) - 1))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        self.calls += 1
+        tokens = self._tokens(prompt)
+
+        async def gen():
+            text = ""
+            for i, token in enumerate(tokens):
+                await asyncio.sleep(self.first_token_latency_s if i == 0 else self._token_delay())
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence, **kwargs: Any):
+        response = await self.acomplete(self.messages_to_prompt(messages), formatted=True)
+        return completion_response_to_chat_response(response)
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence, **kwargs: Any):
+        stream = await self.astream_complete(self.messages_to_prompt(messages), formatted=True)
+        return async_stream_completion_response_to_chat_response(stream)
+
+
+class HashEmbedding(BaseEmbedding):
+    """hash_embedding vectors after `latency_s` per call plus `per_text_latency_s` per text."""
+
+    dim: int = EMBED_DIM
+    latency_s: float = 0.0
+    per_text_latency_s: float = 0.0
+    calls: int = 0
+
+    def __init__(self, **kwargs: Any):
+        kwargs.setdefault("model_name", "fake-hash-embed")
+        super().__init__(**kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _delay(self, texts: int) -> float:
+        self.calls += 1
+        return self.latency_s + self.per_text_latency_s * texts
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        time.sleep(self._delay(1))
+        return hash_embedding(query, self.dim)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        await asyncio.sleep(self._delay(1))
+        return hash_embedding(query, self.dim)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._delay(len(texts)))
+        return [hash_embedding(text, self.dim) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(len(texts)))
+        return [hash_embedding(text, self.dim) for text in texts]
+
+
+def start_fake_embedding_server(
+    latency_s: float,
+    per_text_s: float,
+    throttle_every: int = 0,
+    spike_every: int = 0,
+    spike_s: float = 0.0,
+    fail_every: int = 0,
+):
+    """Starts a threaded fake /embeddings server; returns (server, endpoint URL).
+
+    Connections are kept alive. `server.request_counter` counts "requests" and
+    "connections". POSTs to /chat/completions are answered with a fixed completion
+    ("fake answer") after the same latency.
+
+    Args:
+        latency_s: Fixed latency added to every request.
+        per_text_s: Additional latency per input text.
+        throttle_every: If set, every Nth request is answered with 429 + Retry-After.
+        spike_every: If set, every Nth request is delayed by a further `spike_s`.
+        spike_s: Length of a latency spike.
+        fail_every: If set, every Nth request is answered with 503.
+    """
+    counter = {"requests": 0, "connections": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; with Nagle, a kept-alive connection would
+        # wait for the client's delayed ACK between them
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with lock:
+                counter["connections"] += 1
+
+        def _empty(self, status, headers=()):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                counter["requests"] += 1
+                request_number = counter["requests"]
+            if throttle_every and request_number % throttle_every == 0:
+                self._empty(429, [("Retry-After", "0.05")])
+                return
+            if fail_every and request_number % fail_every == 0:
+                self._empty(503)
+                return
+            spike = spike_s if spike_every and request_number % spike_every == 0 else 0.0
+            if self.path.split("?")[0].endswith("/chat/completions"):
+                time.sleep(latency_s + spike)
+                payload = json.dumps({
+                    "id": "fake",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "fake-llm",
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "fake answer"},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3},
+                }).encode()
+            else:
+                texts = body["input"]
+                time.sleep(latency_s + per_text_s * len(texts) + spike)
+                payload = json.dumps({
+                    "id": "fake",
+                    "object": "list",
+                    "model": "fake-embed",
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": hash_embedding(text)}
+                        for i, text in enumerate(texts)
+                    ],
+                    "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)},
+                }).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up (a timeout, or a hedged request that lost)
+                self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.request_counter = counter
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def page_text(number: int, words: int) -> str:
+    """Reproducible prose for page `number`, with a unique reference code per page."""
+    rng = random.Random(number)
+    body = " ".join(rng.choice(VOCABULARY) for _ in range(words))
+    return f"Page {number} reference RX-{number:05d}. {body}"
+
+
+def write_pdf(path: str, pages: int, words_per_page: int = 350) -> str:
+    """Writes a PDF whose page N holds page_text(N), wrapped to 12 words per line."""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for number in range(1, pages + 1):
+        words = page_text(number, words_per_page).split()
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        ops = ["BT /F1 10 Tf 14 TL 50 760 Td"] + [f"({line}) Tj T*" for line in lines] + ["ET"]
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+        content = DecodedStreamObject()
+        content.set_data("\n".join(ops).encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
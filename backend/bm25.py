@@ -0,0 +1,93 @@
+import re
+import math
+from collections import Counter
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its of on or "
+    "our so that the their there this to was we were what when where which who why will "
+    "with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word tokens without stopwords; a trailing plural "s" is stripped."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed corpus, stored as an inverted index of numpy posting arrays
+    so a query only touches the documents that contain its terms.
+    """
+
+    def __init__(self, corpus: list[str], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            corpus: Document texts; scores are returned in the same order.
+            k1: Term frequency saturation.
+            b: Document length normalisation.
+        """
+        self.k1 = k1
+        self.b = b
+        self.size = len(corpus)
+        lengths = np.zeros(self.size, dtype=np.float32)
+        postings: dict[str, tuple[list[int], list[int]]] = {}
+        for doc_idx, text in enumerate(corpus):
+            counts = Counter(tokenize(text))
+            lengths[doc_idx] = sum(counts.values())
+            for term, tf in counts.items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(doc_idx)
+                tfs.append(tf)
+        avg_length = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+        self._length_norm = k1 * (1 - b + b * lengths / avg_length)
+        self._postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (docs, tfs) in postings.items()
+        }
+
+    def _idf(self, doc_freq: int) -> float:
+        return math.log(1 + (self.size - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def scores(self, query: str) -> np.ndarray:
+        """Returns the BM25 score of every document for the query."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            scores[docs] += self._idf(len(docs)) * tfs * (self.k1 + 1) / (tfs + self._length_norm[docs])
+        return scores
+
+    def document_frequency(self, term: str) -> int:
+        """Number of documents containing an (already tokenized) term."""
+        posting = self._postings.get(term)
+        return 0 if posting is None else len(posting[0])
+
+    def contains(self, term: str, doc_idx: int) -> bool:
+        """True if the document contains the (already tokenized) term."""
+        posting = self._postings.get(term)
+        if posting is None:
+            return False
+        docs = posting[0]
+        position = np.searchsorted(docs, doc_idx)
+        return position < len(docs) and docs[position] == doc_idx
+
+    def top_k(self, query: str, k: int) -> list[tuple[int, float]]:
+        """Returns up to k (document index, score) pairs with a positive score, best first."""
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in ranked]
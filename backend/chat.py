@@ -1,12 +1,21 @@
+import asyncio
 import os
-from llama_index.llms.azure_inference import AzureAICompletionsModel
+import shutil
+import sys
+import threading
+import time
 from llama_index.core import VectorStoreIndex
 from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.core import StorageContext
 from llama_index.core import Settings
-from llama_index.embeddings.azure_inference import AzureAIEmbeddingsModel
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
 import chromadb
+from embedding_cache import EmbeddingCache, CachedEmbeddingModel
+from hybrid_retrieval import HybridIndex, LexicalIndex, lexical_index_from_collection
+from numpy_vector_store import NumpyVectorStore
+from ingestion import EMBED_BATCH_SIZE, split_documents, embed_and_store
+from chromadb.config import Settings as ChromaSettings
 from logging_config import get_logger
+from resilience import CircuitBreaker, HedgePolicy, HedgedEmbeddingModel
 
 logger = get_logger(__name__)
 
@@ -22,73 +31,432 @@ _REQUIRED_ENV_VARS = {
     "AZURE_COHERE_ENDPOINT": AZURE_COHERE_ENDPOINT,
 }
 
-missing = [name for name, value in _REQUIRED_ENV_VARS.items() if not value]
-if missing:
-    logger.error("Missing required environment variables: %s", ", ".join(missing))
-    raise EnvironmentError(
-        f"Missing required environment variables: {', '.join(missing)}. "
-        "Please set them in your .env file or container environment."
+
+def validate_environment():
+    """Raises EnvironmentError naming the required Azure settings that are not set."""
+    missing = [name for name, value in _REQUIRED_ENV_VARS.items() if not value]
+    if missing:
+        logger.error("Missing required environment variables: %s", ", ".join(missing))
+        raise EnvironmentError(
+            f"Missing required environment variables: {', '.join(missing)}. "
+            "Please set them in your .env file or container environment."
+        )
+
+
+# Resilience of the Azure clients (see resilience.py and azure_clients.py): every attempt
+# gets these timeouts, shortened to what is left of the request's deadline; retries are
+# bounded; and each endpoint has a circuit breaker that fails calls fast once
+# CIRCUIT_FAILURE_THRESHOLD consecutive attempts failed, for CIRCUIT_RESET_TIMEOUT_S.
+AZURE_CONNECT_TIMEOUT_S = float(os.getenv("AZURE_CONNECT_TIMEOUT_S", "5"))
+AZURE_LLM_READ_TIMEOUT_S = float(os.getenv("AZURE_LLM_READ_TIMEOUT_S", "60"))
+AZURE_EMBED_READ_TIMEOUT_S = float(os.getenv("AZURE_EMBED_READ_TIMEOUT_S", "10"))
+AZURE_RETRY_TOTAL = int(os.getenv("AZURE_RETRY_TOTAL", "2"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT_S = float(os.getenv("CIRCUIT_RESET_TIMEOUT_S", "30"))
+llm_breaker = CircuitBreaker("llm", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT_S)
+embed_breaker = CircuitBreaker("embeddings", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT_S)
+
+# Query embeddings still unanswered after the EMBED_HEDGE_QUANTILE of recent latencies
+# (clamped to the min/max delay) are sent a second time, for at most EMBED_HEDGE_MAX_RATIO
+# of queries; the first answer wins. EMBED_HEDGE=0 turns it off.
+EMBED_HEDGE = os.getenv("EMBED_HEDGE", "1") == "1"
+EMBED_HEDGE_QUANTILE = float(os.getenv("EMBED_HEDGE_QUANTILE", "0.95"))
+EMBED_HEDGE_MAX_RATIO = float(os.getenv("EMBED_HEDGE_MAX_RATIO", "0.1"))
+EMBED_HEDGE_MIN_DELAY_MS = float(os.getenv("EMBED_HEDGE_MIN_DELAY_MS", "50"))
+EMBED_HEDGE_MAX_DELAY_MS = float(os.getenv("EMBED_HEDGE_MAX_DELAY_MS", "2000"))
+
+# Memory budget for Chroma's in-process segment cache; least recently used collections
+# are unloaded first so many per-document collections can coexist.
+CHROMA_MEMORY_LIMIT_BYTES = int(os.getenv("CHROMA_MEMORY_LIMIT_MB", "512")) * 1024 * 1024
+
+# Every document gets its own collection named with this prefix plus its document ID
+COLLECTION_PREFIX = "doc_"
+# Collection metadata flag, False until every chunk is stored. Collections created before
+# the flag existed have no such key and count as complete.
+COMPLETE_KEY = "complete"
+
+# Vector backend per document: "chroma" (SQLite + HNSW, the default), "numpy" (memory-mapped
+# matrix with exact search, stored under NUMPY_STORE_DIR) or "auto", which uses numpy for
+# documents of at most NUMPY_BACKEND_MAX_CHUNKS chunks and Chroma for larger ones. Documents
+# already indexed keep the backend they were written to: stores are found by path, not setting.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+if VECTOR_BACKEND not in ("auto", "chroma", "numpy"):
+    raise EnvironmentError("VECTOR_BACKEND must be one of: auto, chroma, numpy.")
+NUMPY_BACKEND_MAX_CHUNKS = int(os.getenv("NUMPY_BACKEND_MAX_CHUNKS", "20000"))
+NUMPY_STORE_DIR = os.getenv("NUMPY_STORE_DIR", "./vector_store")
+
+# The Chroma client is created on first use (see get_chroma_client). An embedded client
+# (CHROMA_DB_PATH) must not be shared by several processes: run one worker with it
+# (WEB_CONCURRENCY=1), or set CHROMA_HOST so every worker goes through one Chroma server.
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "./chroma_db")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+_chroma_client = None
+_chroma_client_lock = threading.Lock()
+
+# Content-addressed embedding cache shared by ingestion and query embedding
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+
+_embed_model = None
+_embed_model_lock = threading.Lock()
+
+
+def chroma_enabled():
+    """Whether this process uses Chroma at all. With VECTOR_BACKEND=numpy and no CHROMA_HOST
+    it never opens the embedded store, so several workers can run side by side; documents
+    stored in Chroma earlier are then not served."""
+    return bool(CHROMA_HOST) or VECTOR_BACKEND != "numpy"
+
+
+def get_chroma_client():
+    """Returns the process's Chroma client, creating it on first use: a client of the
+    CHROMA_HOST server if one is set, otherwise an embedded one persisting to CHROMA_DB_PATH."""
+    global _chroma_client
+    if _chroma_client is None:
+        with _chroma_client_lock:
+            if _chroma_client is None:
+                _chroma_client = _create_chroma_client()
+    return _chroma_client
+
+
+def _create_chroma_client():
+    if CHROMA_HOST:
+        client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+        logger.info("ChromaDB client connected to %s:%d", CHROMA_HOST, CHROMA_PORT)
+        return client
+    client = chromadb.PersistentClient(
+        path=CHROMA_DB_PATH,
+        settings=ChromaSettings(
+            chroma_segment_cache_policy="LRU",
+            chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_BYTES,
+        ),
     )
+    logger.info("ChromaDB persistent client initialised at %s", CHROMA_DB_PATH)
+    return client
+
 
-logger.info("Azure environment variables validated successfully.")
+class ThreadedChromaVectorStore(ChromaVectorStore):
+    """ChromaVectorStore whose async queries run on a worker thread. ChromaVectorStore has
+    no aquery of its own; the inherited one would run the HNSW/SQLite lookup, and MMR over
+    the fetched candidates, on the event loop."""
 
-# Initialize chromadb_client
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-logger.info("ChromaDB persistent client initialised at ./chroma_db")
+    @classmethod
+    def class_name(cls) -> str:
+        return "ThreadedChromaVectorStore"
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        return await asyncio.to_thread(self.query, query, **kwargs)
 
 
 def initialize_llm():
-    """Initialize and return the Azure AI completions model."""
+    """Initialize and return the Azure AI completions model, with pooled connections."""
+    # Imported here: the Azure SDK is the slowest import of the backend
+    from azure_clients import PooledCompletionsModel, resilient_client_kwargs
+    validate_environment()
     logger.info("Initialising Azure AI completions model (Llama 3).")
-    return AzureAICompletionsModel(
+    return PooledCompletionsModel(
         endpoint=AZURE_META_ENDPOINT,
         credential=AZURE_META_API,
+        client_kwargs=resilient_client_kwargs(
+            llm_breaker, AZURE_CONNECT_TIMEOUT_S, AZURE_LLM_READ_TIMEOUT_S, AZURE_RETRY_TOTAL
+        ),
     )
 
 
 def initialize_embed_model():
-    """Initialize and return the Azure AI Embedding model."""
+    """Initialize and return the Azure AI Embedding model, hedging query embeddings unless
+    EMBED_HEDGE is off."""
+    from llama_index.embeddings.azure_inference import AzureAIEmbeddingsModel
+    from azure_clients import resilient_client_kwargs
+    validate_environment()
     logger.info("Initialising Azure AI embeddings model (Cohere).")
-    return AzureAIEmbeddingsModel(
+    model = AzureAIEmbeddingsModel(
         endpoint=AZURE_COHERE_ENDPOINT,
         credential=AZURE_COHERE_API,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        client_kwargs=resilient_client_kwargs(
+            embed_breaker, AZURE_CONNECT_TIMEOUT_S, AZURE_EMBED_READ_TIMEOUT_S, AZURE_RETRY_TOTAL
+        ),
+    )
+    if not EMBED_HEDGE:
+        return model
+    hedge = HedgePolicy(
+        "embeddings",
+        quantile=EMBED_HEDGE_QUANTILE,
+        min_delay=EMBED_HEDGE_MIN_DELAY_MS / 1000,
+        max_delay=EMBED_HEDGE_MAX_DELAY_MS / 1000,
+        max_ratio=EMBED_HEDGE_MAX_RATIO,
     )
+    return HedgedEmbeddingModel(model, hedge)
+
+
+async def close_http_sessions():
+    """Closes the LLM's pooled connections; a no-op if the LLM was never created."""
+    azure_clients = sys.modules.get("azure_clients")
+    if azure_clients is not None:
+        await azure_clients.close_sessions()
+
+
+def embed_model_ready():
+    """Whether the embedding model has been created (configure_index_settings then returns at once)."""
+    return _embed_model is not None
+
+
+def embedding_cache_stats():
+    """Returns the embedding cache's hit/miss counters, or None before the model is created."""
+    return _embed_model.cache.stats() if _embed_model is not None else None
+
 
+def collection_name(document_id):
+    """Returns the Chroma collection name holding a document's chunks."""
+    return f"{COLLECTION_PREFIX}{document_id}"
 
-def connect_chromadb_create_index(documents):
+
+def numpy_store_path(document_id):
+    """Returns the directory of a document's NumPy vector store."""
+    return os.path.join(NUMPY_STORE_DIR, collection_name(document_id))
+
+
+def choose_vector_backend(chunk_count):
+    """Picks the vector backend for a new document of `chunk_count` chunks."""
+    if VECTOR_BACKEND == "auto":
+        return "numpy" if chunk_count <= NUMPY_BACKEND_MAX_CHUNKS else "chroma"
+    return VECTOR_BACKEND
+
+
+def configure_index_settings():
+    """Sets (and returns) the embedding model and chunking used for ingestion and queries.
+
+    The embedding model is created once per process; building it probes the endpoint.
+    It is wrapped in the persistent embedding cache so unchanged chunks and repeated
+    questions are never re-sent to Cohere.
     """
-    Connects to chromaDB vector stores for persistent storage.
-    Creates and returns a VectorStore index from the documents.
+    global _embed_model
+    if _embed_model is None:
+        # Warm-up, ingestion threads and the first query may all get here at once
+        with _embed_model_lock:
+            if _embed_model is None:
+                cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+                _embed_model = CachedEmbeddingModel(initialize_embed_model(), cache)
+    Settings.embed_model = _embed_model
+    Settings.chunk_size = 512
+    Settings.chunk_overlap = 50
+    return _embed_model
+
+
+def connect_chromadb_create_index(documents, document_id, document_name=None, progress=None, content_hash=""):
+    """
+    Connects to the document's vector store (a Chroma collection, or a NumPy store for
+    documents within NUMPY_BACKEND_MAX_CHUNKS, see VECTOR_BACKEND) for persistent storage.
+    Creates and returns a hybrid (vector + BM25) index from the documents.
+
+    Args:
+        documents: Parsed llama_index documents.
+        document_id: ID of the uploaded document; selects the collection.
+        document_name: Original file name, stored as collection metadata.
+        progress: Optional callback progress(stage, chunks_total=..., chunks_done=...).
+        content_hash: sha256 of the uploaded file, stored as collection metadata.
+
+    Returns:
+        tuple[HybridIndex, int]: The index and the number of chunks stored.
     """
     if not documents:
         raise ValueError("Cannot create index: document list is empty.")
 
-    logger.info("Creating ChromaDB vector index from %d document(s).", len(documents))
+    logger.info(
+        "Creating ChromaDB vector index from %d document(s). document_id=%s",
+        len(documents), document_id
+    )
+    backend = None
     try:
-        chroma_collection = chroma_client.get_or_create_collection("given_doc")
-        Settings.embed_model = initialize_embed_model()
-        Settings.chunk_size = 512
-        Settings.chunk_overlap = 50
-        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        index = VectorStoreIndex.from_documents(documents, storage_context=storage_context)
-        logger.info("Vector index created successfully.")
-        return index
+        metadata = {
+            "document_name": document_name or document_id,
+            "created_at": time.time(),
+            "content_hash": content_hash,
+        }
+        embed_model = configure_index_settings()
+        progress = progress or (lambda stage, **counts: None)
+        progress("chunk")
+        nodes = split_documents(documents)
+        backend = choose_vector_backend(len(nodes))
+        if backend == "numpy":
+            vector_store = NumpyVectorStore.create(numpy_store_path(document_id), metadata)
+        else:
+            # Marked complete only after the store step, so a failed or interrupted upload
+            # is never restored as a document (the NumPy store's manifest plays this role)
+            chroma_collection = get_chroma_client().get_or_create_collection(
+                collection_name(document_id), metadata={**metadata, COMPLETE_KEY: False}
+            )
+            vector_store = ThreadedChromaVectorStore(chroma_collection=chroma_collection)
+        # Embed batches concurrently and write them to the store in bulk, rather than
+        # from_documents' one-batch-at-a-time round-trips
+        progress("embed", chunks_total=len(nodes), chunks_done=0)
+        embed_and_store(
+            nodes, embed_model, vector_store,
+            on_stored=lambda stored: progress("embed", chunks_done=stored),
+        )
+        progress("store")
+        if backend == "numpy":
+            vector_store.flush()
+            chunk_count = vector_store.count()
+        else:
+            chunk_count = chroma_collection.count()
+            chroma_collection.modify(metadata={**metadata, COMPLETE_KEY: True})
+        index = HybridIndex(VectorStoreIndex.from_vector_store(vector_store), LexicalIndex(nodes))
+        logger.info("Vector index created successfully. backend=%s chunks=%d", backend, chunk_count)
+        return index, chunk_count
     except ValueError:
         raise
     except chromadb.errors.ChromaError as e:
         logger.error("ChromaDB error while creating index: %s", e, exc_info=True)
+        _discard_partial_index(document_id, backend)
         raise RuntimeError(f"ChromaDB error while creating index: {e}") from e
     except Exception as e:
         logger.error("Unexpected error creating index: %s", e, exc_info=True)
+        _discard_partial_index(document_id, backend)
         raise RuntimeError(f"Unexpected error creating index: {e}") from e
 
 
-def clear_chromadb_db():
-    """Clear the chromadb database."""
-    logger.info("Clearing ChromaDB collection 'given_doc'.")
+def _discard_partial_index(document_id, backend):
+    """Best-effort removal of what a failed ingestion stored in `backend`; the failure
+    itself is already reported."""
+    try:
+        if backend == "numpy":
+            shutil.rmtree(numpy_store_path(document_id), ignore_errors=True)
+        elif backend == "chroma":
+            get_chroma_client().delete_collection(collection_name(document_id))
+            logger.info("Removed partial ChromaDB collection. document_id=%s", document_id)
+    except chromadb.errors.NotFoundError:
+        pass
+    except Exception as e:
+        logger.warning("Could not remove partial index. document_id=%s error=%s", document_id, e)
+
+
+def load_index_from_chromadb(document_id):
+    """Rebuilds a document's hybrid index handle from its existing collection (no re-embedding);
+    the BM25 index is rebuilt from the stored chunk texts."""
+    logger.info("Loading vector index. document_id=%s", document_id)
+    try:
+        store_path = numpy_store_path(document_id)
+        if NumpyVectorStore.exists(store_path):
+            configure_index_settings()
+            vector_store = NumpyVectorStore.open(store_path)
+            return HybridIndex(VectorStoreIndex.from_vector_store(vector_store), LexicalIndex(vector_store.nodes()))
+        if not chroma_enabled():
+            raise RuntimeError(f"Document {document_id} has no NumPy vector store and Chroma is disabled.")
+        chroma_collection = get_chroma_client().get_collection(collection_name(document_id))
+        configure_index_settings()
+        vector_store = ThreadedChromaVectorStore(chroma_collection=chroma_collection)
+        return HybridIndex(
+            VectorStoreIndex.from_vector_store(vector_store), lexical_index_from_collection(chroma_collection)
+        )
+    except chromadb.errors.ChromaError as e:
+        logger.error("ChromaDB error while loading index: %s", e, exc_info=True)
+        raise RuntimeError(f"ChromaDB error while loading index: {e}") from e
+    except Exception as e:
+        logger.error("Unexpected error loading index: %s", e, exc_info=True)
+        raise RuntimeError(f"Unexpected error loading index: {e}") from e
+
+
+def _is_complete(collection):
+    return (collection.metadata or {}).get(COMPLETE_KEY, True) is not False
+
+
+def _describe_collection(collection):
+    """Builds a document description from a collection's name and metadata."""
+    document_id = collection.name[len(COLLECTION_PREFIX):]
+    metadata = collection.metadata or {}
+    return {
+        "document_id": document_id,
+        "document_name": metadata.get("document_name", document_id),
+        "created_at": metadata.get("created_at", 0.0),
+        "chunk_count": collection.count(),
+        "content_hash": metadata.get("content_hash", ""),
+    }
+
+
+def _describe_numpy_store(document_id):
+    """Builds a document description from a NumPy store's manifest."""
+    manifest = NumpyVectorStore.read_manifest(numpy_store_path(document_id))
+    return {
+        "document_id": document_id,
+        "document_name": manifest.get("document_name", document_id),
+        "created_at": manifest.get("created_at", 0.0),
+        "chunk_count": manifest.get("chunk_count", 0),
+        "content_hash": manifest.get("content_hash", ""),
+    }
+
+
+def _numpy_document_ids():
+    if not os.path.isdir(NUMPY_STORE_DIR):
+        return []
+    return [
+        entry[len(COLLECTION_PREFIX):]
+        for entry in os.listdir(NUMPY_STORE_DIR)
+        if entry.startswith(COLLECTION_PREFIX) and NumpyVectorStore.exists(os.path.join(NUMPY_STORE_DIR, entry))
+    ]
+
+
+def list_document_collections():
+    """
+    Lists the documents persisted in ChromaDB and the NumPy stores, so a restarted worker
+    can restore them.
+
+    Returns:
+        list[dict]: document_id, document_name, created_at and chunk_count per document.
+    """
+    try:
+        collections = get_chroma_client().list_collections() if chroma_enabled() else []
+        descriptions = [
+            _describe_collection(c) for c in collections if c.name.startswith(COLLECTION_PREFIX) and _is_complete(c)
+        ]
+        return descriptions + [_describe_numpy_store(document_id) for document_id in _numpy_document_ids()]
+    except chromadb.errors.ChromaError as e:
+        logger.error("ChromaDB error while listing collections: %s", e, exc_info=True)
+        raise RuntimeError(f"ChromaDB error while listing collections: {e}") from e
+    except Exception as e:
+        logger.error("Unexpected error listing ChromaDB collections: %s", e, exc_info=True)
+        raise RuntimeError(f"Unexpected error listing ChromaDB collections: {e}") from e
+
+
+def describe_document_collection(document_id):
+    """Returns the persisted description of one document, or None if it has no complete collection."""
+    if NumpyVectorStore.exists(numpy_store_path(document_id)):
+        return _describe_numpy_store(document_id)
+    if not chroma_enabled():
+        return None
+    try:
+        collection = get_chroma_client().get_collection(collection_name(document_id))
+        return _describe_collection(collection) if _is_complete(collection) else None
+    except chromadb.errors.NotFoundError:
+        return None
+    except chromadb.errors.ChromaError as e:
+        logger.error("ChromaDB error while reading collection: %s", e, exc_info=True)
+        raise RuntimeError(f"ChromaDB error while reading collection: {e}") from e
+
+
+def clear_chromadb_db(document_id):
+    """Delete a document's chromadb collection (or NumPy store)."""
+    store_path = numpy_store_path(document_id)
+    if NumpyVectorStore.exists(store_path):
+        logger.info("Clearing NumPy vector store '%s'.", store_path)
+        try:
+            NumpyVectorStore.open(store_path).clear()
+            logger.info("NumPy vector store cleared successfully.")
+        except OSError as e:
+            logger.error("Error clearing NumPy vector store: %s", e, exc_info=True)
+            raise RuntimeError(f"Error clearing NumPy vector store: {e}") from e
+        except Exception as e:
+            logger.error("Unexpected error clearing NumPy vector store: %s", e, exc_info=True)
+            raise RuntimeError(f"Unexpected error clearing NumPy vector store: {e}") from e
+        return
+    if not chroma_enabled():
+        return
+    name = collection_name(document_id)
+    logger.info("Clearing ChromaDB collection '%s'.", name)
     try:
-        chroma_client.delete_collection("given_doc")
+        get_chroma_client().delete_collection(name)
         logger.info("ChromaDB collection cleared successfully.")
     except chromadb.errors.ChromaError as e:
         logger.error("ChromaDB error while clearing collection: %s", e, exc_info=True)
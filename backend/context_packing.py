@@ -0,0 +1,154 @@
+import os
+import re
+from typing import List, Optional
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from bm25 import tokenize
+from logging_config import get_logger
+from metrics import CONTEXT_TOKENS, current_timings
+
+logger = get_logger(__name__)
+
+# Most tokens of retrieved context sent to synthesis per query (0 disables packing). The
+# default fits the 3 chunks a reranker keeps; 5 unreranked 512-token chunks are trimmed.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Metadata key under which a packed chunk keeps its retrieved text, for source previews;
+# excluded from the synthesis prompt and from embeddings
+ORIGINAL_TEXT_KEY = "original_text"
+# Shortest shared text between two chunks treated as the splitter's overlap
+_MIN_OVERLAP_CHARS = 20
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of `first` that is also a prefix of `second`."""
+    if len(first) < _MIN_OVERLAP_CHARS or len(second) < _MIN_OVERLAP_CHARS:
+        return 0
+    # Only places where `second`'s opening characters occur in `first` can start one
+    anchor = second[:_MIN_OVERLAP_CHARS]
+    start = first.find(anchor, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(anchor, start + 1)
+    return 0
+
+
+def _strip_overlaps(text: str, kept: list[str]) -> str:
+    """Removes from `text` what it shares with the edges of chunks already kept: the
+    overlap with the chunk before it (its head) and with the chunk after it (its tail)."""
+    for other in kept:
+        head = _overlap(other, text)
+        if head:
+            text = text[head:].lstrip()
+        tail = _overlap(text, other)
+        if tail:
+            text = text[:-tail].rstrip()
+    return text
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Last postprocessor of a document query: fits the retrieved chunks into a token
+    budget before they reach the synthesis prompt.
+
+    - The text two chunks share (the splitter's overlap) and sentences already present
+      in a higher-ranked chunk are removed.
+    - If the context is still over budget, the sentences sharing the fewest terms with
+      the question are dropped, lowest-ranked chunk first.
+
+    Every chunk keeps its most relevant sentence, its metadata and its score, so the
+    answer cites the same pages as before. Sentences that stay keep their order, and
+    the retrieved text stays in metadata (ORIGINAL_TEXT_KEY) for the source previews.
+    """
+
+    token_budget: int = Field(default=CONTEXT_TOKEN_BUDGET, description="Most context tokens to keep; 0 disables.")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if not nodes or self.token_budget <= 0:
+            return nodes
+        count_tokens = get_tokenizer()
+        texts = [node.node.get_content() for node in nodes]
+        original = sum(len(count_tokens(text)) for text in texts)
+        query_terms = set(tokenize(query_bundle.query_str)) if query_bundle else set()
+        # (rank, position, relevance, tokens, text) per sentence that is not a repeat
+        sentences = []
+        best_of_chunk: dict[int, tuple] = {}
+        seen: set[str] = set()
+        kept_texts: list[str] = []
+        for rank, text in enumerate(texts):
+            unique_text = _strip_overlaps(text.strip(), kept_texts)
+            kept_texts.append(text.strip())
+            for position, sentence in enumerate(_SENTENCE_END.split(unique_text)):
+                key = _WHITESPACE.sub(" ", sentence).strip().lower()
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                relevance = len(query_terms.intersection(tokenize(sentence)))
+                entry = (rank, position, relevance, len(count_tokens(sentence)), sentence)
+                sentences.append(entry)
+                best = best_of_chunk.get(rank)
+                if best is None or relevance > best[2]:
+                    best_of_chunk[rank] = entry
+
+        total = sum(entry[3] for entry in sentences)
+        protected = {id(entry) for entry in best_of_chunk.values()}
+        dropped = set()
+        # Least relevant first; on ties, the lower-ranked chunk and the later sentence
+        for entry in sorted(sentences, key=lambda e: (e[2], -e[0], -e[1])):
+            if total <= self.token_budget:
+                break
+            if id(entry) not in protected:
+                dropped.add(id(entry))
+                total -= entry[3]
+
+        packed = []
+        for rank, node in enumerate(nodes):
+            kept = [entry[4] for entry in sentences if entry[0] == rank and id(entry) not in dropped]
+            if not kept:
+                # Every sentence repeats an earlier chunk; keep the opening one for the citation
+                kept = [_SENTENCE_END.split(texts[rank].strip())[0]]
+                total += len(count_tokens(kept[0]))
+            chunk = node.node.model_copy()
+            chunk.set_content(" ".join(kept))
+            chunk.metadata = {**chunk.metadata, ORIGINAL_TEXT_KEY: texts[rank]}
+            chunk.excluded_llm_metadata_keys = [*chunk.excluded_llm_metadata_keys, ORIGINAL_TEXT_KEY]
+            chunk.excluded_embed_metadata_keys = [*chunk.excluded_embed_metadata_keys, ORIGINAL_TEXT_KEY]
+            packed.append(NodeWithScore(node=chunk, score=node.score))
+        self._record(total, original - total)
+        logger.info(
+            "Packed query context. chunks=%d tokens=%d saved=%d budget=%d",
+            len(packed), total, original - total, self.token_budget,
+        )
+        return packed
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        # A few thousand tokens take about a millisecond; cheaper inline than on a thread
+        return self._postprocess_nodes(nodes, query_bundle)
+
+    @staticmethod
+    def _record(kept: int, saved: int) -> None:
+        CONTEXT_TOKENS.labels("kept").inc(kept)
+        CONTEXT_TOKENS.labels("saved").inc(max(saved, 0))
+        timings = current_timings()
+        if timings is not None:
+            timings.tokens["context_saved"] = timings.tokens.get("context_saved", 0) + max(saved, 0)
+
+
+context_packer = ContextPacker()
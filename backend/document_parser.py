@@ -0,0 +1,103 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pypdf
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# PDFs with at least this many pages are parsed on a process pool, in page-range shards
+PARSE_PARALLEL_MIN_PAGES = int(os.getenv("PARSE_PARALLEL_MIN_PAGES", "48"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PARSE_PAGES_PER_SHARD = int(os.getenv("PARSE_PAGES_PER_SHARD", "16"))
+
+# Same exclusions SimpleDirectoryReader applies, so both paths embed identical text
+_EXCLUDED_METADATA_KEYS = [
+    "file_name", "file_type", "file_size", "creation_date", "last_modified_date", "last_accessed_date",
+]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Returns the shared parsing pool, created on first use.
+
+    Workers are spawned rather than forked: the server process runs threads, and
+    forking a threaded process can deadlock the child.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info("PDF parsing pool started. workers=%d", PARSE_WORKERS)
+        return _pool
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> list[tuple[str, str]]:
+    """Extracts (page_label, text) for pages [start, end). Runs in a pool worker."""
+    pdf = pypdf.PdfReader(file_path)
+    return [(pdf.page_labels[page], pdf.pages[page].extract_text()) for page in range(start, end)]
+
+
+def _page_count(file_path: str) -> int:
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def load_document(file_path: str) -> list[Document]:
+    """
+    Parses an uploaded file into one Document per page (PDF) or per file (text).
+
+    Large PDFs are split into page-range shards parsed in parallel on a process pool and
+    merged back in page order, with the same `page_label`/`file_name` metadata the
+    single-process SimpleDirectoryReader path produces.
+
+    Args:
+        file_path: Path of the uploaded file.
+
+    Returns:
+        list[Document]: Parsed documents in page order.
+    """
+    if not file_path.lower().endswith(".pdf") or PARSE_WORKERS < 2:
+        return SimpleDirectoryReader(input_files=[file_path]).load_data()
+
+    num_pages = _page_count(file_path)
+    if num_pages < PARSE_PARALLEL_MIN_PAGES:
+        return SimpleDirectoryReader(input_files=[file_path]).load_data()
+
+    start = time.monotonic()
+    shards = [
+        (page, min(page + PARSE_PAGES_PER_SHARD, num_pages))
+        for page in range(0, num_pages, PARSE_PAGES_PER_SHARD)
+    ]
+    # map() yields results in submission order, which keeps pages in order
+    results = _get_pool().map(
+        extract_page_range,
+        [file_path] * len(shards),
+        [shard_start for shard_start, _ in shards],
+        [shard_end for _, shard_end in shards],
+    )
+
+    file_metadata = default_file_metadata_func(file_path)
+    documents = []
+    for pages in results:
+        for page_label, text in pages:
+            documents.append(Document(
+                text=text,
+                metadata={"page_label": page_label, **file_metadata},
+                excluded_embed_metadata_keys=list(_EXCLUDED_METADATA_KEYS),
+                excluded_llm_metadata_keys=list(_EXCLUDED_METADATA_KEYS),
+            ))
+
+    duration_ms = round((time.monotonic() - start) * 1000)
+    logger.info(
+        "Parsed PDF in parallel. pages=%d shards=%d workers=%d duration_ms=%d",
+        num_pages, len(shards), PARSE_WORKERS, duration_ms
+    )
+    return documents
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Any, List
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding store backed by SQLite.
+
+    Entries are keyed by sha256(model, text) and hold float32 vectors. The least recently
+    used entries are evicted once the cache grows past `max_entries`.
+
+    Reads do not write: the access times of hit entries are collected in memory and
+    written in one batch every ACCESS_FLUSH_KEYS keys or ACCESS_FLUSH_S seconds, and
+    before an eviction. The entry count is kept in memory too; since other workers write
+    to the same file, it is re-read from SQLite every RECOUNT_S seconds and before an
+    eviction.
+    """
+
+    ACCESS_FLUSH_KEYS = 256
+    ACCESS_FLUSH_S = 30.0
+    RECOUNT_S = 30.0
+    # An eviction frees this fraction of max_entries, so the next one is far away
+    EVICT_FRACTION = 0.1
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        """
+        Args:
+            path: SQLite database file (":memory:" for a process-local cache).
+            max_entries: Maximum number of cached vectors.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Gunicorn workers share the file; wait for the other writer instead of failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._recount()
+        self._accessed: dict[str, float] = {}
+        self._flushed_at = time.monotonic()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        """Returns the content address of a (model, text) pair."""
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[List[float] | None]:
+        """Returns the cached vector for each text, or None where it is not cached."""
+        keys = [self.key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._accessed.update((k, now) for k in found)
+                if (
+                    len(self._accessed) >= self.ACCESS_FLUSH_KEYS
+                    or time.monotonic() - self._flushed_at >= self.ACCESS_FLUSH_S
+                ):
+                    self._flush_access_times()
+                    self._conn.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return [
+            np.frombuffer(found[k], dtype=np.float32).tolist() if k in found else None
+            for k in keys
+        ]
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        """Stores vectors for texts, then evicts least recently used entries over the limit."""
+        now = time.time()
+        rows = [
+            (self.key(model, text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            # Keys are content addresses, so an existing row already holds the same vector
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            self._count += max(cursor.rowcount, 0)
+            if time.monotonic() - self._counted_at >= self.RECOUNT_S:
+                self._recount()
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the number of cached vectors."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._count}
+
+    def _recount(self) -> None:
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self._counted_at = time.monotonic()
+
+    def _flush_access_times(self) -> None:
+        """Writes the collected access times; the caller holds the lock and commits."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._accessed.items()],
+            )
+            self._accessed.clear()
+        self._flushed_at = time.monotonic()
+
+    def _evict(self) -> None:
+        """Deletes least recently used entries down to below max_entries; the caller holds
+        the lock and commits."""
+        self._recount()
+        if self._count <= self.max_entries:
+            return
+        self._flush_access_times()
+        excess = self._count - self.max_entries + int(self.max_entries * self.EVICT_FRACTION)
+        cursor = self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._count -= cursor.rowcount
+        logger.info("Embedding cache evicted entries. evicted=%d", cursor.rowcount)
+
+
+class CachedEmbeddingModel(BaseEmbedding):
+    """
+    Wraps an embedding model with an EmbeddingCache. Both ingestion (text batches) and
+    retrieval (query strings) check the cache first and only send misses to the model.
+    """
+
+    _model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, model: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any):
+        super().__init__(
+            model_name=model.model_name,
+            embed_batch_size=model.embed_batch_size,
+            **kwargs,
+        )
+        self._model = model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbeddingModel"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _lookup(self, texts: List[str]):
+        cached = self._cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        return cached, missing
+
+    def _fill(self, texts, cached, missing, computed) -> List[List[float]]:
+        self._cache.put_many(self.model_name, [texts[i] for i in missing], computed)
+        for i, vector in zip(missing, computed):
+            cached[i] = vector
+        return cached
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = self._lookup(texts)
+        if not missing:
+            return cached
+        computed = self._model.get_text_embedding_batch([texts[i] for i in missing])
+        return self._fill(texts, cached, missing, computed)
+
+    # The async paths run the SQLite work on a thread: the lock is shared with ingestion
+    # threads and a write may wait for another worker
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = await asyncio.to_thread(self._lookup, texts)
+        if not missing:
+            return cached
+        computed = await self._model.aget_text_embedding_batch([texts[i] for i in missing])
+        return await asyncio.to_thread(self._fill, texts, cached, missing, computed)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        cached, missing = self._lookup([query])
+        if not missing:
+            return cached[0]
+        return self._fill([query], cached, missing, [self._model.get_query_embedding(query)])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        cached, missing = await asyncio.to_thread(self._lookup, [query])
+        if not missing:
+            return cached[0]
+        computed = [await self._model.aget_query_embedding(query)]
+        return (await asyncio.to_thread(self._fill, [query], cached, missing, computed))[0]
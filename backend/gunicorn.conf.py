@@ -1,5 +1,7 @@
 # Gunicorn configuration file
 import multiprocessing
+import os
+import shutil
 
 max_requests = 500
 max_requests_jitter = 25
@@ -9,4 +11,33 @@ log_file = "-"
 bind = "0.0.0.0:8000"
 
 worker_class = "uvicorn.workers.UvicornWorker"
-workers = 1
\ No newline at end of file
+# Document records and job states live in the shared SQLite registry (REGISTRY_DB_PATH),
+# so any worker can serve any request; each loads the indexes it needs lazily.
+# An embedded Chroma store (CHROMA_DB_PATH) is not safe to share between processes, so
+# unless every worker uses a Chroma server (CHROMA_HOST) or only the NumPy backend, the
+# server runs a single worker.
+embedded_chroma = not os.getenv("CHROMA_HOST") and os.getenv("VECTOR_BACKEND", "chroma").lower() != "numpy"
+workers = int(os.getenv("WEB_CONCURRENCY", 1 if embedded_chroma else multiprocessing.cpu_count()))
+if embedded_chroma and workers > 1:
+    raise RuntimeError(
+        "WEB_CONCURRENCY > 1 needs CHROMA_HOST (a Chroma server shared by the workers) "
+        "or VECTOR_BACKEND=numpy; an embedded Chroma store supports one worker."
+    )
+
+# Metrics of all workers are aggregated through files in this directory. It must be set
+# before the workers import prometheus_client, and emptied when the server starts.
+if workers > 1:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,157 @@
+import os
+from typing import List
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import VectorStoreQueryMode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from bm25 import BM25Index, tokenize
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Reciprocal-rank fusion constant: a chunk's fused score is sum(1 / (RRF_K + rank))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Lexical fast path: answer from BM25 alone, skipping the query embedding, when at least
+# LEXICAL_FAST_PATH_MIN_COVERAGE of the query terms occur in the document, the best chunk
+# contains all of those, one of them is rare (in at most LEXICAL_FAST_PATH_MAX_DF chunks)
+# and the best score beats the runner-up by LEXICAL_FAST_PATH_MARGIN.
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "1") == "1"
+LEXICAL_FAST_PATH_MIN_COVERAGE = float(os.getenv("LEXICAL_FAST_PATH_MIN_COVERAGE", "0.5"))
+LEXICAL_FAST_PATH_MAX_DF = int(os.getenv("LEXICAL_FAST_PATH_MAX_DF", "3"))
+LEXICAL_FAST_PATH_MARGIN = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", "1.5"))
+
+_CHROMA_PAGE_SIZE = 5000
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over a document's chunks."""
+
+    def __init__(self, nodes: List[BaseNode]):
+        # Embeddings are not needed here and would double the memory held per chunk
+        self.nodes = [node.model_copy(update={"embedding": None}) for node in nodes]
+        self._bm25 = BM25Index([node.get_content() for node in self.nodes])
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def search(self, query: str, k: int) -> tuple[List[NodeWithScore], bool]:
+        """
+        Returns up to k chunks ranked by BM25 score, and whether the ranking is confident
+        enough to be used without vector search.
+        """
+        ranked = self._bm25.top_k(query, k)
+        hits = [NodeWithScore(node=self.nodes[i], score=score) for i, score in ranked]
+        return hits, self._is_confident(query, ranked)
+
+    def _is_confident(self, query: str, ranked: list[tuple[int, float]]) -> bool:
+        terms = set(tokenize(query))
+        if not ranked or not terms:
+            return False
+        known = [term for term in terms if self._bm25.document_frequency(term)]
+        if len(known) < LEXICAL_FAST_PATH_MIN_COVERAGE * len(terms):
+            return False
+        best, best_score = ranked[0]
+        if not all(self._bm25.contains(term, best) for term in known):
+            return False
+        if min(self._bm25.document_frequency(term) for term in known) > LEXICAL_FAST_PATH_MAX_DF:
+            return False
+        return len(ranked) == 1 or best_score >= LEXICAL_FAST_PATH_MARGIN * ranked[1][1]
+
+
+def lexical_index_from_collection(collection) -> LexicalIndex:
+    """Rebuilds a document's lexical index from the chunks persisted in its Chroma collection."""
+    nodes = []
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=_CHROMA_PAGE_SIZE, offset=offset)
+        for text, metadata in zip(page["documents"], page["metadatas"]):
+            nodes.append(metadata_dict_to_node(metadata, text=text))
+        if len(page["ids"]) < _CHROMA_PAGE_SIZE:
+            break
+        offset += _CHROMA_PAGE_SIZE
+    return LexicalIndex(nodes)
+
+
+def reciprocal_rank_fusion(rankings: List[List[NodeWithScore]], k: int = HYBRID_RRF_K) -> List[NodeWithScore]:
+    """Merges ranked lists: each chunk scores sum(1 / (k + rank)) over the lists it appears in."""
+    fused: dict[str, float] = {}
+    nodes: dict[str, BaseNode] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            node_id = hit.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+            nodes.setdefault(node_id, hit.node)
+    ordered = sorted(fused, key=fused.get, reverse=True)
+    return [NodeWithScore(node=nodes[node_id], score=fused[node_id]) for node_id in ordered]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves with BM25 and vector search and fuses both rankings with reciprocal-rank
+    fusion. Queries the lexical index answers confidently skip vector search, and with
+    it the embedding round-trip.
+    """
+
+    def __init__(self, vector_retriever: BaseRetriever, lexical_index: LexicalIndex, similarity_top_k: int):
+        super().__init__()
+        self._vector_retriever = vector_retriever
+        self._lexical_index = lexical_index
+        self._similarity_top_k = similarity_top_k
+
+    def _lexical(self, query_bundle: QueryBundle):
+        hits, confident = self._lexical_index.search(query_bundle.query_str, self._similarity_top_k)
+        fast = LEXICAL_FAST_PATH and confident
+        if fast:
+            logger.info("Lexical fast path taken; vector search skipped. hits=%d", len(hits))
+        return hits, fast
+
+    def _fuse(self, lexical_hits, vector_hits) -> List[NodeWithScore]:
+        return reciprocal_rank_fusion([vector_hits, lexical_hits])[:self._similarity_top_k]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        lexical_hits, fast = self._lexical(query_bundle)
+        if fast:
+            return lexical_hits
+        return self._fuse(lexical_hits, self._vector_retriever.retrieve(query_bundle))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        lexical_hits, fast = self._lexical(query_bundle)
+        if fast:
+            return lexical_hits
+        return self._fuse(lexical_hits, await self._vector_retriever.aretrieve(query_bundle))
+
+
+class HybridIndex:
+    """
+    A document's VectorStoreIndex paired with its lexical index. Offers the same
+    `as_query_engine` arguments as VectorStoreIndex, so query code is unchanged.
+    """
+
+    def __init__(self, vector_index, lexical_index: LexicalIndex):
+        self.vector_index = vector_index
+        self.lexical_index = lexical_index
+
+    def as_retriever(self, similarity_top_k: int = 5, vector_store_query_mode=VectorStoreQueryMode.DEFAULT):
+        vector_retriever = self.vector_index.as_retriever(
+            similarity_top_k=similarity_top_k, vector_store_query_mode=vector_store_query_mode
+        )
+        return HybridRetriever(vector_retriever, self.lexical_index, similarity_top_k)
+
+    def answers_lexically(self, query: str) -> bool:
+        """Whether retrieval for a query takes the lexical fast path, so it needs no query
+        embedding. Only the top two chunks decide, whatever the similarity_top_k."""
+        if not LEXICAL_FAST_PATH:
+            return False
+        _, confident = self.lexical_index.search(query, 2)
+        return confident
+
+    def as_query_engine(
+        self,
+        llm=None,
+        similarity_top_k: int = 5,
+        vector_store_query_mode=VectorStoreQueryMode.DEFAULT,
+        **kwargs,
+    ) -> RetrieverQueryEngine:
+        retriever = self.as_retriever(similarity_top_k, vector_store_query_mode)
+        return RetrieverQueryEngine.from_args(retriever, llm=llm, **kwargs)
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Rough resident cost of one loaded chunk: a 1024-d float32 Cohere vector plus its
+# 512-token text and node metadata. Used to bound the LRU by memory, not just count.
+APPROX_BYTES_PER_CHUNK = 8 * 1024
+
+
+@dataclass
+class DocumentRecord:
+    """Metadata for one uploaded document; kept for every document, loaded or not."""
+
+    document_id: str
+    document_name: str
+    chunk_count: int = 0
+    created_at: float = field(default_factory=time.time)
+    content_hash: str = ""  # sha256 of the uploaded bytes; identifies the document version
+
+    @property
+    def size_bytes(self) -> int:
+        return self.chunk_count * APPROX_BYTES_PER_CHUNK
+
+
+class IndexRegistry:
+    """
+    Registry of uploaded documents keyed by document ID.
+
+    Document records are cheap and always kept. Loaded VectorStoreIndex handles live in
+    an LRU bounded by entry count and estimated memory; evicted handles are reloaded
+    from the persistent vector store through `loader` on next use.
+
+    With a shared `store`, records are written through to it and re-read whenever
+    another worker process has changed it, so every worker sees every upload and drops
+    the handles of documents cleared or replaced elsewhere.
+    """
+
+    def __init__(self, loader, max_entries: int = 8, max_bytes: int = 512 * 1024 * 1024, store=None):
+        """
+        Args:
+            loader: Callable taking a document ID and returning its VectorStoreIndex.
+            max_entries: Maximum number of index handles kept loaded.
+            max_bytes: Maximum estimated memory of the loaded handles.
+            store: Optional RegistryStore shared with the other workers.
+        """
+        self._loader = loader
+        self._store = store
+        self._store_version = None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._records: dict[str, DocumentRecord] = {}
+        self._handles: OrderedDict[str, object] = OrderedDict()
+        self._loaded_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def register(self, record: DocumentRecord, index=None) -> None:
+        """Adds (or replaces) a document record, optionally with its freshly built index."""
+        with self._lock:
+            if self._store is not None:
+                self._store.put_document(record)
+            self._drop_handle(record.document_id)
+            self._records[record.document_id] = record
+            if index is not None:
+                self._store_handle(record.document_id, index)
+        logger.info(
+            "Document registered. document_id=%s document=%s chunks=%d",
+            record.document_id, record.document_name, record.chunk_count
+        )
+
+    def restore(self, record: DocumentRecord) -> bool:
+        """Adds a record recovered from the persistent store unless the document is already known.
+
+        Returns:
+            True if the record was added.
+        """
+        with self._lock:
+            self._sync()
+            if record.document_id in self._records:
+                return False
+            if self._store is not None and not self._store.put_document(record, replace=False):
+                return False
+            self._records[record.document_id] = record
+            return True
+
+    def get(self, document_id: str):
+        """
+        Returns the loaded index for a document, loading it on a cache miss.
+
+        Raises:
+            KeyError: if the document is not registered.
+        """
+        with self._lock:
+            self._sync()
+            if document_id not in self._records:
+                raise KeyError(document_id)
+            if document_id in self._handles:
+                self.hits += 1
+                self._handles.move_to_end(document_id)
+                return self._handles[document_id]
+            self.misses += 1
+
+        # Load outside the lock: it touches the vector store and may be slow
+        logger.info("Index cache miss, loading from vector store. document_id=%s", document_id)
+        index = self._loader(document_id)
+        with self._lock:
+            if document_id not in self._records:
+                raise KeyError(document_id)
+            if document_id in self._handles:
+                self._handles.move_to_end(document_id)
+                return self._handles[document_id]
+            self._store_handle(document_id, index)
+            return index
+
+    def record(self, document_id: str) -> DocumentRecord | None:
+        """Returns the record for a document, or None if it is unknown."""
+        with self._lock:
+            self._sync()
+            return self._records.get(document_id)
+
+    def latest(self) -> DocumentRecord | None:
+        """Returns the most recently uploaded document's record, or None."""
+        with self._lock:
+            self._sync()
+            if not self._records:
+                return None
+            return max(self._records.values(), key=lambda r: r.created_at)
+
+    def records(self) -> list[DocumentRecord]:
+        """Returns all document records, oldest first."""
+        with self._lock:
+            self._sync()
+            return sorted(self._records.values(), key=lambda r: r.created_at)
+
+    def remove(self, document_id: str) -> DocumentRecord | None:
+        """Forgets a document and releases its loaded handle."""
+        with self._lock:
+            if self._store is not None:
+                self._store.delete_document(document_id)
+            self._drop_handle(document_id)
+            return self._records.pop(document_id, None)
+
+    def stats(self) -> dict:
+        """Returns document/handle counts, estimated loaded memory and handle hits/misses."""
+        with self._lock:
+            return {
+                "documents": len(self._records),
+                "loaded": len(self._handles),
+                "loaded_bytes": self._loaded_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _sync(self) -> None:
+        """Re-reads the shared records if another worker changed them; call with the lock held."""
+        if self._store is None:
+            return
+        version = self._store.version()
+        if version == self._store_version:
+            return
+        self._store_version = version
+        records = {row["document_id"]: DocumentRecord(**row) for row in self._store.documents()}
+        for document_id, record in list(self._records.items()):
+            current = records.get(document_id)
+            # Cleared, or replaced by a new version, in another worker
+            if current is None or current.content_hash != record.content_hash or current.created_at != record.created_at:
+                self._drop_handle(document_id)
+        self._records = records
+
+    def _store_handle(self, document_id: str, index) -> None:
+        self._handles[document_id] = index
+        self._loaded_bytes += self._records[document_id].size_bytes
+        self._evict()
+
+    def _drop_handle(self, document_id: str) -> None:
+        if self._handles.pop(document_id, None) is not None:
+            self._loaded_bytes -= self._records[document_id].size_bytes
+
+    def _evict(self) -> None:
+        # Always keep the most recently used handle, even if it alone exceeds the budget
+        while len(self._handles) > 1 and (
+            len(self._handles) > self.max_entries or self._loaded_bytes > self.max_bytes
+        ):
+            evicted_id, _ = self._handles.popitem(last=False)
+            self._loaded_bytes -= self._records[evicted_id].size_bytes
+            logger.info("Evicted index handle. document_id=%s", evicted_id)
@@ -0,0 +1,143 @@
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from llama_index.core import Settings
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from logging_config import get_logger
+from resilience import CircuitOpenError
+
+logger = get_logger(__name__)
+
+# Texts per embedding request (Cohere accepts at most 96) and concurrent requests in flight
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "96"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_RETRY_BASE_DELAY = float(os.getenv("EMBED_RETRY_BASE_DELAY", "1.0"))
+# Embedded chunks are buffered and written to the vector store in bulk of at least this size
+STORE_FLUSH_SIZE = int(os.getenv("STORE_FLUSH_SIZE", "512"))
+
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def split_documents(documents):
+    """Splits documents into chunks using the globally configured chunk size and overlap."""
+    splitter = SentenceSplitter(chunk_size=Settings.chunk_size, chunk_overlap=Settings.chunk_overlap)
+    return splitter.get_nodes_from_documents(documents)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """True for throttling, transient server errors, dropped connections and an open circuit."""
+    if isinstance(error, CircuitOpenError):
+        return True
+    if isinstance(error, HttpResponseError):
+        return error.status_code in _RETRYABLE_STATUS_CODES
+    return isinstance(error, (ServiceRequestError, ServiceResponseError, TimeoutError, ConnectionError))
+
+
+def _retry_delay(error: Exception, attempt: int, base_delay: float) -> float:
+    """Honours Retry-After when the service sends it, waits out an open circuit, otherwise
+    jittered exponential backoff."""
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("Retry-After") if response is not None and response.headers else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return base_delay * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _embed_batch(embed_model, texts, max_retries, base_delay):
+    """Embeds one batch, retrying throttled and transient failures with backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return embed_model.get_text_embedding_batch(texts)
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt, base_delay)
+            logger.warning(
+                "Embedding batch throttled, retrying. attempt=%d delay_s=%.2f error=%s", attempt + 1, delay, e
+            )
+            time.sleep(delay)
+
+
+def embed_and_store(
+    nodes,
+    embed_model,
+    vector_store,
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+    max_retries: int = EMBED_MAX_RETRIES,
+    base_delay: float = EMBED_RETRY_BASE_DELAY,
+    flush_size: int = STORE_FLUSH_SIZE,
+    on_stored=None,
+) -> int:
+    """
+    Embeds chunks with up to `max_in_flight` concurrent batch requests and writes them to
+    the vector store in bulk as batches complete.
+
+    Batches run on a bounded thread pool using the model's synchronous client: the async
+    Azure clients hold an aiohttp session bound to the server's event loop, so they must
+    not be driven from the ingestion worker thread's own loop.
+
+    Args:
+        nodes: Chunks to embed; their `embedding` is set in place.
+        embed_model: llama_index embedding model.
+        vector_store: Vector store receiving the embedded chunks.
+        batch_size: Texts per embedding request.
+        max_in_flight: Maximum concurrent embedding requests.
+        max_retries: Retries per batch on throttling or transient errors.
+        base_delay: Base backoff delay in seconds.
+        flush_size: Minimum number of chunks per vector store write.
+        on_stored: Optional callback receiving the running count of stored chunks.
+
+    Returns:
+        int: Number of chunks stored.
+    """
+    if not nodes:
+        return 0
+    start = time.monotonic()
+    batches = [nodes[i:i + batch_size] for i in range(0, len(nodes), batch_size)]
+
+    def run(batch):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        embeddings = _embed_batch(embed_model, texts, max_retries, base_delay)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+        return batch
+
+    buffer = []
+    stored = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed") as pool:
+        futures = [pool.submit(run, batch) for batch in batches]
+        try:
+            for finished in as_completed(futures):
+                buffer.extend(finished.result())
+                if len(buffer) >= flush_size:
+                    vector_store.add(buffer)
+                    stored += len(buffer)
+                    buffer = []
+                    if on_stored:
+                        on_stored(stored)
+            if buffer:
+                vector_store.add(buffer)
+                stored += len(buffer)
+                if on_stored:
+                    on_stored(stored)
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    duration_ms = round((time.monotonic() - start) * 1000)
+    logger.info(
+        "Embedded and stored chunks. chunks=%d batches=%d max_in_flight=%d duration_ms=%d",
+        stored, len(batches), max_in_flight, duration_ms
+    )
+    return stored
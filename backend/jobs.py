@@ -0,0 +1,255 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+from fastapi import HTTPException
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+STAGES = ("queued", "parse", "chunk", "embed", "store", "done")
+
+# A worker refreshes the heartbeat of its queued and running jobs every JOB_HEARTBEAT_S.
+# A job whose heartbeat is older than JOB_STALE_S lost its worker (recycled by
+# max_requests, or killed after graceful_timeout) and is reported as failed.
+JOB_HEARTBEAT_S = float(os.getenv("JOB_HEARTBEAT_S", "10"))
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "60"))
+ORPHANED_JOB_ERROR = "The worker processing this document stopped before it finished. Please upload it again."
+
+
+@dataclass
+class IngestionJob:
+    """Progress of one background document ingestion."""
+
+    job_id: str
+    document_name: str
+    status: str = "queued"  # queued | running | completed | failed
+    stage: str = "queued"  # one of STAGES
+    chunks_total: int = 0
+    chunks_done: int = 0
+    document_id: str | None = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    embed_started_at: float | None = None
+    owner_pid: int = field(default_factory=os.getpid)
+    heartbeat_at: float = field(default_factory=time.time)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _on_change: Callable[["IngestionJob"], None] | None = field(default=None, repr=False)
+
+    def update(self, stage: str, chunks_total: int | None = None, chunks_done: int | None = None) -> None:
+        """Progress callback handed to the ingestion pipeline."""
+        with self._lock:
+            if stage == "embed" and self.embed_started_at is None:
+                self.embed_started_at = time.time()
+            self.stage = stage
+            if chunks_total is not None:
+                self.chunks_total = chunks_total
+            if chunks_done is not None:
+                self.chunks_done = chunks_done
+        self.changed()
+
+    def changed(self) -> None:
+        """Publishes the job's state, e.g. to the registry shared with the other workers."""
+        self.heartbeat_at = time.time()
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def state(self) -> dict:
+        """The persisted fields, as IngestionJob keyword arguments."""
+        with self._lock:
+            return {
+                name: getattr(self, name) for name in (
+                    "job_id", "document_name", "status", "stage", "chunks_total", "chunks_done",
+                    "document_id", "error", "created_at", "started_at", "finished_at", "embed_started_at",
+                    "owner_pid", "heartbeat_at",
+                )
+            }
+
+    def eta_seconds(self) -> float | None:
+        """Estimated seconds left, extrapolated from the embedding rate so far."""
+        if self.status == "completed":
+            return 0.0
+        if self.embed_started_at is None or not self.chunks_done or not self.chunks_total:
+            return None
+        rate = self.chunks_done / max(time.time() - self.embed_started_at, 1e-6)
+        return round((self.chunks_total - self.chunks_done) / rate, 1)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "document_name": self.document_name,
+                "status": self.status,
+                "stage": self.stage,
+                "chunks_total": self.chunks_total,
+                "chunks_done": self.chunks_done,
+                "eta_seconds": self.eta_seconds(),
+                "document_id": self.document_id,
+                "error": self.error,
+            }
+
+
+class JobManager:
+    """
+    Runs ingestion jobs on a bounded worker pool and keeps their progress for polling.
+
+    At most `max_workers` ingestions run at once and at most `max_pending` wait; further
+    submissions are rejected. Finished jobs are kept for `history_limit` lookups.
+
+    With a shared RegistryStore, every state change is written to it, so a job can be
+    polled through any worker process, not only the one running it. Active jobs also get
+    a heartbeat there; a job whose worker died is reported as failed instead of running
+    forever.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, history_limit: int = 200, store=None):
+        self.max_pending = max_pending
+        self._store = store
+        self.history_limit = history_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self._jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+    def submit(self, document_name: str, work) -> IngestionJob:
+        """
+        Queues `work(job)`, which must return the new document ID.
+
+        Raises:
+            HTTPException: 429 when the pending queue is full.
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if pending >= self.max_pending:
+                logger.warning("Rejected ingestion job — queue full. pending=%d", pending)
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many documents are being processed. Please retry shortly.",
+                    headers={"Retry-After": "10"},
+                )
+            job = IngestionJob(job_id=uuid.uuid4().hex, document_name=document_name, _on_change=self._publish)
+            job.changed()
+            self._jobs[job.job_id] = job
+            self._trim_history()
+            self._futures[job.job_id] = self._executor.submit(
+                contextvars.copy_context().run, self._run, job, work  # keeps the request ID in job logs
+            )
+            if self._store is not None and self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+                self._heartbeat.start()
+        logger.info("Ingestion job queued. job_id=%s document=%s", job.job_id, document_name)
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        """Returns a job of this process, or one another worker recorded in the shared store.
+        A job whose worker has stopped is reported (and recorded) as failed."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self._store is not None:
+            state = self._store.get_job(job_id)
+            if state is not None:
+                if self._orphaned(state):
+                    state = self._fail_orphan(state)
+                job = IngestionJob(**state)
+        return job
+
+    def fail_orphaned_jobs(self) -> int:
+        """Marks the queued and running jobs whose worker has stopped as failed; for a
+        worker (re)start. Returns how many were marked."""
+        if self._store is None:
+            return 0
+        try:
+            orphans = [state for state in self._store.active_jobs() if self._orphaned(state)]
+        except Exception as e:
+            logger.warning("Could not check for orphaned jobs. error=%s", e)
+            return 0
+        for state in orphans:
+            self._fail_orphan(state)
+        if orphans:
+            logger.warning("Marked orphaned ingestion jobs as failed. jobs=%d", len(orphans))
+        return len(orphans)
+
+    def wait(self, job_id: str, timeout: float | None = None) -> IngestionJob | None:
+        """Blocks until a job finishes; returns the job (mainly for tests and scripts)."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+        return self.get(job_id)
+
+    def _run(self, job: IngestionJob, work) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        job.changed()
+        try:
+            job.document_id = work(job)
+            job.update("done")
+            job.status = "completed"
+            logger.info(
+                "Ingestion job completed. job_id=%s document_id=%s duration_ms=%d",
+                job.job_id, job.document_id, round((time.time() - job.started_at) * 1000)
+            )
+        except HTTPException as e:
+            job.status = "failed"
+            job.error = str(e.detail)
+            logger.warning("Ingestion job failed. job_id=%s error=%s", job.job_id, job.error)
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"Unexpected error processing document: {e}"
+            logger.error("Ingestion job failed. job_id=%s error=%s", job.job_id, e, exc_info=True)
+        finally:
+            job.finished_at = time.time()
+            job.changed()
+            with self._lock:
+                self._futures.pop(job.job_id, None)
+
+    def _orphaned(self, state: dict) -> bool:
+        if state["status"] not in ("queued", "running"):
+            return False
+        with self._lock:
+            if state["job_id"] in self._jobs:
+                return False
+        # This process holds every job it is running, so one recorded under its PID
+        # belongs to an earlier process that had the same PID
+        if state.get("owner_pid") == os.getpid():
+            return True
+        return time.time() - state.get("heartbeat_at", state["created_at"]) > JOB_STALE_S
+
+    def _fail_orphan(self, state: dict) -> dict:
+        state = {**state, "status": "failed", "error": ORPHANED_JOB_ERROR, "finished_at": time.time()}
+        logger.warning("Ingestion job orphaned by its worker. job_id=%s owner_pid=%s", state["job_id"], state.get("owner_pid"))
+        self._publish_state(state)
+        return state
+
+    def _beat(self) -> None:
+        while True:
+            time.sleep(JOB_HEARTBEAT_S)
+            with self._lock:
+                active = [job for job in self._jobs.values() if job.status in ("queued", "running")]
+            for job in active:
+                job.changed()
+
+    def _publish(self, job: IngestionJob) -> None:
+        self._publish_state(job.state())
+
+    def _publish_state(self, state: dict) -> None:
+        if self._store is None:
+            return
+        try:
+            self._store.put_job(state["job_id"], state)
+        except Exception as e:
+            # Progress reporting must never fail the ingestion itself
+            logger.warning("Could not publish job state. job_id=%s error=%s", state["job_id"], e)
+
+    def _trim_history(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("completed", "failed")]
+        for job_id in finished[:max(0, len(self._jobs) - self.history_limit)]:
+            del self._jobs[job_id]
@@ -1,6 +1,29 @@
+import atexit
+import copy
 import logging
-import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
 from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+
+# Records are queued by the logging thread and formatted and written to stdout by one
+# background writer, so request handlers never block on log I/O. When the writer falls
+# LOG_QUEUE_SIZE records behind, new records are dropped and counted instead.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REQUEST_ID_HEADER = "x-request-id"
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+
+def current_request_id() -> str | None:
+    """ID of the HTTP request being handled, if any."""
+    return request_id_var.get()
 
 
 class JsonFormatter(logging.Formatter):
@@ -8,27 +31,162 @@ class JsonFormatter(logging.Formatter):
 
     def format(self, record: logging.LogRecord) -> str:
         log_entry = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            # The time the record was created, not written: formatting happens later on the writer
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             "level": record.levelname,
             "module": record.module,
             "message": record.getMessage(),
         }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            log_entry["request_id"] = request_id
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            log_entry["suppressed"] = suppressed
         if record.exc_info:
             log_entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_entry["exception"] = record.exc_text
         if hasattr(record, "extra"):
             log_entry.update(record.extra)
-        return json.dumps(log_entry)
+        return orjson.dumps(log_entry, default=str).decode()
+
+
+class _AsyncHandler(QueueHandler):
+    """Queues records for the writer thread after capturing what only the caller has."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._formatter = JsonFormatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments and render the traceback now: both may change or vanish
+        # before the writer gets to the record. The request ID lives in a contextvar.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped:
+                self.queue.put_nowait(self._dropped_record())
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _dropped_record(self) -> logging.LogRecord:
+        return logging.makeLogRecord({
+            "name": __name__, "module": "logging_config", "levelno": logging.WARNING, "levelname": "WARNING",
+            "msg": f"Log queue full, records dropped. dropped={self.dropped}", "created": time.time(),
+        })
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per message template: each distinct message of the logger passes at most
+    `per_second` times a second after an initial `burst`. Warnings and errors always pass.
+    The next record that passes carries the number suppressed since the last one.
+    """
 
+    def __init__(self, per_second: float, burst: int = 1):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst
+        self._buckets: dict[str, list] = {}
+        self._lock = threading.Lock()
 
-def get_logger(name: str) -> logging.Logger:
-    """Return a named logger with JSON structured output to stdout."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(str(record.msg), [float(self.burst), now, 0])
+            tokens, updated, suppressed = bucket
+            tokens = min(self.burst, tokens + (now - updated) * self.per_second)
+            if tokens < 1:
+                bucket[:] = [tokens, now, suppressed + 1]
+                return False
+            bucket[:] = [tokens - 1, now, 0]
+        record.suppressed = suppressed
+        return True
+
+
+_handler: _AsyncHandler | None = None
+_handler_lock = threading.Lock()
+
+
+def _async_handler() -> _AsyncHandler:
+    """The process-wide queue handler; starts the writer thread on first use."""
+    global _handler
+    with _handler_lock:
+        if _handler is None:
+            log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            stream = logging.StreamHandler(sys.stdout)
+            stream.setFormatter(JsonFormatter())
+            listener = QueueListener(log_queue, stream)
+            listener.start()
+            # Flush what is still queued when the process exits
+            atexit.register(listener.stop)
+            _handler = _AsyncHandler(log_queue)
+        return _handler
+
+
+def get_logger(name: str, rate_limit: float | None = None) -> logging.Logger:
+    """Return a named logger with JSON structured output to stdout.
+
+    Args:
+        name: Logger name, usually __name__.
+        rate_limit: If set, INFO and DEBUG messages are limited to this many per second
+            per message template (see RateLimitFilter), for hot, noisy loggers.
+    """
     logger = logging.getLogger(name)
 
     if not logger.handlers:
-        handler = logging.StreamHandler()
-        handler.setFormatter(JsonFormatter())
-        logger.addHandler(handler)
+        logger.addHandler(_async_handler())
         logger.setLevel(logging.INFO)
         logger.propagate = False
+        if rate_limit is not None:
+            logger.addFilter(RateLimitFilter(rate_limit))
 
     return logger
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware giving every request an ID, taken from a valid X-Request-ID header or
+    generated, stored in request_id_var for log records and echoed in the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode():
+                value = value.decode("latin-1")
+                if 0 < len(value) <= 128 and value.isprintable():
+                    request_id = value
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (REQUEST_ID_HEADER.encode(), request_id.encode())]}
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
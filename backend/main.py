@@ -1,70 +1,312 @@
 import os
+import json
+import hashlib
+import asyncio
 import tempfile
+import uuid
+import threading
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from llama_index.core import SimpleDirectoryReader
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from query_type import handle_general_query, handle_document_query
-from chat import initialize_llm, connect_chromadb_create_index, clear_chromadb_db
-from llama_index.core.postprocessor import LLMRerank
-from logging_config import get_logger
+from query_type import (
+    ahandle_general_query,
+    ahandle_document_query,
+    astream_general_query,
+    astream_document_query,
+    acondense_question,
+    asummarize_conversation,
+)
+from chat import (
+    validate_environment,
+    chroma_enabled,
+    get_chroma_client,
+    initialize_llm,
+    configure_index_settings,
+    embed_model_ready,
+    connect_chromadb_create_index,
+    load_index_from_chromadb,
+    list_document_collections,
+    describe_document_collection,
+    clear_chromadb_db,
+    embedding_cache_stats,
+    close_http_sessions,
+)
+from index_registry import IndexRegistry, DocumentRecord
+from hybrid_retrieval import HybridIndex
+from registry_store import RegistryStore
+from jobs import JobManager
+from answer_cache import AnswerCache, normalize_question
+from document_parser import load_document
+from rerankers import RERANKER_NAMES, build_rerankers
+from metrics import IngestionTimer, PrometheusMiddleware, register_cache, render_metrics, stage, track_stages
+from admission import AdmissionMiddleware
+from profiling import ProfilingMiddleware
+from single_flight import SingleFlight
+from sessions import SESSION_ID_PATTERN, SessionStore
+from resilience import DeadlineExceeded, UpstreamUnavailable, request_deadline
+from prometheus_client import CONTENT_TYPE_LATEST
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import MultipartParseError
+from logging_config import RequestIdMiddleware, get_logger
 
 load_dotenv()
 
 logger = get_logger(__name__)
+# The frontend polls /status/ on every rerun; its log lines are limited per message
+STATUS_LOG_PER_S = float(os.getenv("STATUS_LOG_PER_S", "0.2"))
+status_logger = get_logger("main.status", rate_limit=STATUS_LOG_PER_S)
+
+# Build the LLM, rerankers, embedding model and Chroma client in the background as soon
+# as the server starts, instead of on the first request that needs them
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Checks the configuration, then restores persisted documents and warms the clients in
+    the background, so the port is bound without waiting for either."""
+    validate_environment()
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    threading.Thread(target=rehydrate_registry, name="rehydrate-registry", daemon=True).start()
+    yield
+    await close_http_sessions()
+
 
 # --- FastAPI Setup ---
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend to access backend
 _default_origins = "https://ai-frontend-hrcwf4gfdhdadhgh.swedencentral-01.azurewebsites.net/,http://localhost:8501"
 origins = os.getenv("ALLOWED_ORIGINS", _default_origins).split(",")
 
+# Concurrency limit and bounded queue per priority class (see admission.py); innermost, so
+# its 429s still get CORS headers and are counted on /metrics
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id", "X-Request-ID", "Retry-After"],
 )
+# Opt-in per-request profiles (see profiling.py); unprofiled requests only pay for the check
+app.add_middleware(ProfilingMiddleware)
+# Added last so it wraps CORS too and sees every request
+app.add_middleware(PrometheusMiddleware)
+# Outermost, so every log line of a request, including the other middlewares', carries its ID
+app.add_middleware(RequestIdMiddleware)
 
-# Global variable to store the index (initialized when a document is uploaded)
-global_index = None
-global_document_name = None
+# Document records and job states shared by all gunicorn workers; each worker loads
+# index handles lazily and keeps its own LRU of them
+REGISTRY_DB_PATH = os.getenv("REGISTRY_DB_PATH", "./registry.sqlite3")
+registry_store = RegistryStore(REGISTRY_DB_PATH)
 
-# Initialize the Azure LLM globally
-logger.info("Initialising backend application.")
-llm = initialize_llm()
-logger.info("LLM initialised successfully.")
+# Uploaded documents keyed by document ID; loaded index handles are LRU-bounded
+INDEX_CACHE_MAX_ENTRIES = int(os.getenv("INDEX_CACHE_MAX_ENTRIES", "8"))
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_MB", "512")) * 1024 * 1024
+index_registry = IndexRegistry(
+    loader=load_index_from_chromadb,
+    max_entries=INDEX_CACHE_MAX_ENTRIES,
+    max_bytes=INDEX_CACHE_MAX_BYTES,
+    store=registry_store,
+)
+
+# Time budget of a query's Azure calls (embedding, reranking, answer); each call's timeout
+# is cut to what is left, and a query that runs out answers 504. A streamed answer's
+# budget ends once its sources are sent.
+QUERY_DEADLINE_S = float(os.getenv("QUERY_DEADLINE_S", "30"))
+
+# Rerankers, selectable per request: with one, the top-10 MMR chunks are narrowed to 3 by
+# Llama 3 ("llm", batches scored concurrently) or by local BM25 ("bm25"); "none" keeps the
+# top-5 MMR chunks.
+DEFAULT_RERANKER = os.getenv("RERANKER", "llm").lower()
+if DEFAULT_RERANKER not in RERANKER_NAMES:
+    raise ValueError(f"RERANKER must be one of: {', '.join(RERANKER_NAMES)}.")
 
-# Reranker: fetches top-10 chunks via MMR, then uses Llama 3 to score and keep the top 3
-reranker = LLMRerank(choice_batch_size=5, top_n=3, llm=llm)
-logger.info("LLM reranker initialised.")
+# The Azure LLM and the rerankers are created on first use (building the LLM reranker
+# probes the endpoint), or by warm_up right after startup
+_llm = None
+_rerankers = None
+_clients_lock = threading.RLock()
 
-MAX_FILE_SIZE_BYTES = 5 * 1024 * 1024  # 5MB
+# How many of the most recent documents get their index handle rebuilt eagerly at startup;
+# the rest are loaded on first query.
+WARM_START_PRELOAD = int(os.getenv("WARM_START_PRELOAD", "1"))
+
+# Uploads are parsed from the request body as it arrives and written to a temp file, on a
+# worker thread, every UPLOAD_WRITE_BUFFER_BYTES; peak RSS per upload is about that much
+# and reading stops at the cap. A Content-Length over the cap (plus the multipart
+# framing) is refused before reading.
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "100"))
+MAX_FILE_SIZE_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+UPLOAD_WRITE_BUFFER_BYTES = 1024 * 1024
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
 ALLOWED_EXTENSIONS = {".pdf", ".txt"}
 
+# Ingestion runs as background jobs on a small bounded pool, off the event loop; uploads
+# return a job ID immediately and clients poll /jobs/{job_id} for progress.
+INGESTION_MAX_WORKERS = int(os.getenv("INGESTION_MAX_WORKERS", "2"))
+INGESTION_MAX_PENDING = int(os.getenv("INGESTION_MAX_PENDING", "16"))
+job_manager = JobManager(
+    max_workers=INGESTION_MAX_WORKERS, max_pending=INGESTION_MAX_PENDING, store=registry_store
+)
+
+# Finished answers are cached per document version and normalized question.
+# ANSWER_CACHE_MODE: "semantic" also reuses answers to questions whose embedding's cosine
+# similarity reaches ANSWER_CACHE_SIMILARITY; "exact" matches normalized text only; "off".
+ANSWER_CACHE_MODE = os.getenv("ANSWER_CACHE_MODE", "semantic").lower()
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES if ANSWER_CACHE_MODE != "off" else 0,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    semantic_threshold=ANSWER_CACHE_SIMILARITY if ANSWER_CACHE_MODE == "semantic" else None,
+)
+GENERAL_ANSWER_NAMESPACE = "general"
+
+# Concurrent identical questions (same document version, reranker and normalized question)
+# share one in-flight answer instead of each running retrieval and synthesis; the answer
+# cache then serves the ones that arrive after it completes. Streamed answers are not
+# coalesced.
+document_answers_in_flight = SingleFlight("document_query")
+general_answers_in_flight = SingleFlight("general_query")
+
+# Chat sessions (session_id on the query endpoints): the recent turns and a rolling
+# summary of older ones, compacted in the background, within SESSION_TOKEN_BUDGET tokens.
+# Written through to the shared registry, so any worker can continue a conversation.
+chat_sessions = SessionStore(
+    summarize=lambda summary, turns, max_tokens: summarize_session(summary, turns, max_tokens),
+    store=registry_store,
+)
+
+# Hit rates on /metrics; the lambdas resolve the current objects at scrape time
+register_cache("answer", lambda: answer_cache.stats())
+register_cache("session", lambda: chat_sessions.stats())
+register_cache("index", lambda: index_registry.stats())
+register_cache("embedding", embedding_cache_stats)
+
+
+# --- Clients ---
+
+def get_llm():
+    """Returns the Azure LLM, creating it on first use."""
+    global _llm
+    with _clients_lock:
+        if _llm is None:
+            _llm = initialize_llm()
+            logger.info("LLM initialised successfully.")
+        return _llm
+
+
+def get_rerankers() -> dict:
+    """Returns the rerankers keyed by name, creating them on first use."""
+    global _rerankers
+    with _clients_lock:
+        if _rerankers is None:
+            _rerankers = build_rerankers(get_llm(), top_n=3, choice_batch_size=5)
+            logger.info("Rerankers initialised. default=%s", DEFAULT_RERANKER)
+        return _rerankers
+
+
+async def get_clients() -> tuple:
+    """Returns (llm, rerankers); the first call creates them off the event loop."""
+    if _rerankers is None:
+        await asyncio.to_thread(get_rerankers)
+    return get_llm(), get_rerankers()
+
+
+async def get_embed_model():
+    """Returns the embedding model; the first call creates it off the event loop (building
+    it probes the endpoint and opens the embedding cache)."""
+    if not embed_model_ready():
+        return await asyncio.to_thread(configure_index_settings)
+    return configure_index_settings()
+
+
+def warm_up() -> None:
+    """Creates every client a query needs, so no request pays for it."""
+    start = time.perf_counter()
+    try:
+        get_rerankers()
+        configure_index_settings()
+        if chroma_enabled():
+            get_chroma_client()
+        logger.info("Warm-up completed. duration_ms=%d", round((time.perf_counter() - start) * 1000))
+    except Exception as e:
+        # Not fatal: whatever failed is retried on first use
+        logger.warning("Warm-up failed. error=%s", e)
+
+
+def clients_ready() -> bool:
+    return _rerankers is not None
+
 
 # --- Document Processing ---
 
-def create_index_from_document(file_path: str) -> None:
+def normalise_document_metadata(documents, document_name: str) -> None:
+    """Replaces temp-file details with the upload's name and keeps the temp path out of
+    the embedded and prompted text, so identical uploads produce identical chunks (and
+    embedding cache hits)."""
+    for document in documents:
+        document.metadata["file_name"] = document_name
+        document.metadata.pop("file_path", None)
+        document.metadata.pop("creation_date", None)
+        document.metadata.pop("last_modified_date", None)
+
+
+def create_index_from_document(file_path: str, document_name: str, content_hash: str = "", progress=None) -> str:
     """Creates a vector index from the uploaded document using embedding model.
 
     Args:
         file_path: uploaded document file path.
+        document_name: original file name of the upload.
+        content_hash: sha256 of the uploaded bytes, kept as the document's version.
+        progress: optional callback progress(stage, chunks_total=..., chunks_done=...).
+
+    Returns:
+        The new document's ID.
 
     Raises:
         HTTPException on error.
     """
-    global global_index, global_document_name
-    logger.info("Processing document. file=%s", os.path.basename(file_path))
+    document_id = uuid.uuid4().hex
+    logger.info("Processing document. file=%s document_id=%s", document_name, document_id)
+    progress = IngestionTimer(progress)
     try:
-        reader = SimpleDirectoryReader(input_files=[file_path])
-        documents = reader.load_data()
-        global_index = connect_chromadb_create_index(documents)
-        global_document_name = os.path.basename(file_path)
-        logger.info("Document indexed successfully. file=%s", global_document_name)
+        progress("parse")
+        documents = load_document(file_path)
+        normalise_document_metadata(documents, document_name)
+        index, chunk_count = connect_chromadb_create_index(
+            documents, document_id, document_name, progress=progress, content_hash=content_hash
+        )
+        index_registry.register(
+            DocumentRecord(
+                document_id=document_id,
+                document_name=document_name,
+                chunk_count=chunk_count,
+                content_hash=content_hash,
+            ),
+            index=index,
+        )
+        progress.finish(chunk_count)
+        logger.info("Document indexed successfully. file=%s document_id=%s", document_name, document_id)
+        return document_id
     except ValueError as e:
         logger.warning("Validation error during document indexing: %s", e)
         raise HTTPException(status_code=422, detail=str(e)) from e
@@ -76,16 +318,246 @@ def create_index_from_document(file_path: str) -> None:
         raise HTTPException(status_code=500, detail=f"Unexpected error processing document: {str(e)}") from e
 
 
-# --- Querying ---
+def rehydrate_registry() -> None:
+    """Restores document records from the persisted Chroma collections after a (re)start.
+
+    Only metadata is read for every document, and records already in the shared registry
+    are kept. Index handles are rebuilt with from_vector_store for the most recent
+    WARM_START_PRELOAD documents, in every worker, and lazily for the rest, so a
+    recycled worker never re-embeds anything. Ingestion jobs left queued or running by a
+    worker that has stopped are marked as failed.
+    """
+    job_manager.fail_orphaned_jobs()
+    try:
+        descriptions = list_document_collections()
+    except RuntimeError as e:
+        logger.error("Warm restart failed to list persisted documents: %s", e)
+        return
+    restored = []
+    for description in descriptions:
+        record = DocumentRecord(**description)
+        if index_registry.restore(record):
+            restored.append(record)
+    logger.info("Warm restart restored documents. restored=%d persisted=%d", len(restored), len(descriptions))
+
+    for record in list(reversed(index_registry.records()))[:WARM_START_PRELOAD]:
+        try:
+            index_registry.get(record.document_id)
+        except (KeyError, RuntimeError) as e:
+            logger.warning("Warm restart could not preload index. document_id=%s error=%s", record.document_id, e)
 
-def get_document_answer(question: str) -> dict:
-    """Gets an answer and source citations for a question about the uploaded document."""
-    global global_index
-    if global_index is None:
+
+def lookup_document(document_id: str) -> DocumentRecord | None:
+    """Returns a document's record, falling back to the persisted store for documents the
+    background rehydration has not restored yet."""
+    record = index_registry.record(document_id)
+    if record is not None:
+        return record
+    try:
+        description = describe_document_collection(document_id)
+    except RuntimeError as e:
+        logger.error("Error looking up persisted document: %s", e)
+        return None
+    if description is None:
+        return None
+    index_registry.restore(DocumentRecord(**description))
+    return index_registry.record(document_id)
+
+
+def ingest_uploaded_file(job, file_path: str, document_name: str, content_hash: str = "") -> str:
+    """Background job body: indexes the uploaded temp file, then deletes it."""
+    try:
+        return create_index_from_document(file_path, document_name, content_hash, progress=job.update)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def find_document(document_id: str | None) -> DocumentRecord | None:
+    """Returns the record a request targets, or None; without an ID, the most recent upload.
+    Blocks on the shared registry and possibly the vector store: call it off the event loop."""
+    return lookup_document(document_id) if document_id else index_registry.latest()
+
+
+async def resolve_document(document_id: str | None) -> DocumentRecord:
+    """Returns the record a request targets; without an ID, the most recent upload."""
+    record = await asyncio.to_thread(find_document, document_id)
+    if record is None:
+        if document_id:
+            logger.warning("Unknown document requested. document_id=%s", document_id)
+            raise HTTPException(status_code=404, detail=f"Document '{document_id}' not found.")
         logger.warning("Document query attempted with no document loaded.")
         raise HTTPException(status_code=400, detail="No document has been uploaded yet.")
+    return record
+
+
+async def get_document_index(document_id: str | None):
+    """Returns the loaded index for a document, reloading it off the event loop on a cache miss."""
+    record = await resolve_document(document_id)
+    try:
+        return await asyncio.to_thread(index_registry.get, record.document_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Document '{record.document_id}' not found.") from e
+    except RuntimeError as e:
+        logger.error("Error loading document index: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error loading document index: {str(e)}") from e
+
+
+# --- Querying ---
+
+def document_namespace(document_id: str, content_hash: str = "", reranker: str = "") -> str:
+    """Answer cache namespace for one version of a document (and the reranker used)."""
+    namespace = f"document:{document_id}:{content_hash}"
+    return f"{namespace}:{reranker}" if reranker else namespace
+
+
+def select_reranker(name: str | None) -> str:
+    """Resolves a request's reranker choice, defaulting to RERANKER."""
+    name = (name or DEFAULT_RERANKER).lower()
+    if name not in RERANKER_NAMES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown reranker '{name}'. Choose one of: {', '.join(RERANKER_NAMES)}."
+        )
+    return name
+
+
+def upstream_unavailable(e: UpstreamUnavailable) -> HTTPException:
+    """504 when the query's deadline ran out, otherwise 503 (a circuit breaker is open)
+    with Retry-After."""
+    logger.warning("Azure call failed fast. client=%s error=%s", e.client, e)
+    if isinstance(e, DeadlineExceeded):
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(round(e.retry_after))})
+
+
+async def embed_question(question: str):
+    """Embeds a question for semantic answer cache lookups; None when semantic matching is
+    off or the embedding call fails. The embedding cache makes the retriever's own query
+    embedding a hit afterwards, so document queries that need one pay nothing extra."""
+    if not answer_cache.semantic:
+        return None
+    try:
+        return await (await get_embed_model()).aget_query_embedding(question)
+    except Exception as e:
+        logger.warning("Could not embed question for answer cache lookup: %s", e)
+        return None
+
+
+async def replay_answer(answer: str):
+    """Token generator for a cached answer: the whole text as one token."""
+    yield answer
+
+
+async def cache_streamed_answer(tokens, namespace: str, question: str, embedding, sources=None):
+    """Passes tokens through and caches the full answer once the stream completes."""
+    parts = []
+    async for token in tokens:
+        parts.append(token)
+        yield token
+    answer = "".join(parts)
+    if answer:
+        value = answer if sources is None else {"answer": answer, "sources": sources}
+        answer_cache.put(namespace, question, value, embedding)
+
+
+async def open_session(session_id: str | None):
+    """The chat session a request continues, or None for a standalone question."""
+    return await chat_sessions.get(session_id) if session_id else None
+
+
+async def summarize_session(summary: str, turns: list[tuple[str, str]], max_tokens: int) -> str:
+    """Folds older turns of a chat session into its summary (run in the background)."""
+    llm, _ = await get_clients()
+    return await asummarize_conversation(summary, turns, llm, max_tokens)
+
+
+async def standalone_question(question: str, session) -> str:
+    """The question to retrieve with. A follow-up in a session is first rewritten to stand
+    on its own, which also lets the answer cache and coalescing match it; if that fails,
+    the question is used as asked."""
+    history = session.history() if session else []
+    if not history:
+        return question
+    with stage("condense"):
+        try:
+            llm, _ = await get_clients()
+            standalone = await acondense_question(question, history, llm)
+        except UpstreamUnavailable as e:
+            raise upstream_unavailable(e) from e
+        except Exception as e:
+            logger.warning("Could not rewrite follow-up question, using it as asked. error=%s", e)
+            return question
+    logger.info("Follow-up question rewritten. session_id=%s", session.session_id)
+    return standalone
+
+
+async def remember_streamed_turn(tokens, session, question: str):
+    """Passes tokens through and adds the turn to the session once the stream completes."""
+    parts = []
+    async for token in tokens:
+        parts.append(token)
+        yield token
+    await chat_sessions.record(session, question, "".join(parts))
+
+
+async def cached_document_answer(question: str, record: DocumentRecord, namespace: str):
+    """Looks a document question up in the answer cache, embedding it only when needed. An
+    exact match is tried first, before the index is loaded. A question the lexical fast
+    path retrieves is never embedded, since its retrieval will not need the embedding
+    either; it can then only match exactly.
+
+    Returns:
+        (cached answer or None, loaded index or None, question embedding or None)
+    """
+    with stage("cache_lookup"):
+        cached = answer_cache.get_exact(namespace, question)
+    if cached is not None:
+        return cached, None, None
+    with stage("index_load"):
+        index = await get_document_index(record.document_id)
+    embedding = None
+    with stage("cache_lookup"):
+        if not (isinstance(index, HybridIndex) and index.answers_lexically(question)):
+            embedding = await embed_question(question)
+        cached = answer_cache.get(namespace, question, embedding)
+    return cached, index, embedding
+
+
+async def get_document_answer(
+    question: str, document_id: str | None = None, reranker: str | None = None, session=None
+) -> dict:
+    """Gets an answer and source citations for a question about an uploaded document,
+    in the context of a chat session if one is given. Identical questions in flight for
+    the same document version and reranker share one answer."""
+    reranker = select_reranker(reranker)
+    record = await resolve_document(document_id)
+    namespace = document_namespace(record.document_id, record.content_hash, reranker)
+    standalone = await standalone_question(question, session)
+    result = await document_answers_in_flight.run(
+        (namespace, normalize_question(standalone)),
+        lambda: answer_document_question(standalone, record, namespace, reranker),
+    )
+    if session is not None:
+        await chat_sessions.record(session, question, result["answer"])
+    return dict(result)
+
+
+async def answer_document_question(question: str, record: DocumentRecord, namespace: str, reranker: str) -> dict:
+    """Answers a document question from the answer cache, or with retrieval, reranking and
+    synthesis, caching the answer."""
+    cached, index, embedding = await cached_document_answer(question, record, namespace)
+    if cached is not None:
+        logger.info("Answer cache hit. document_id=%s", record.document_id)
+        return cached
     try:
-        return handle_document_query(global_index, question, llm, reranker)
+        llm, rerankers = await get_clients()
+        result = await ahandle_document_query(index, question, llm, rerankers[reranker])
+        if result["answer"]:
+            answer_cache.put(namespace, question, result, embedding)
+        return result
+    except UpstreamUnavailable as e:
+        raise upstream_unavailable(e) from e
     except ValueError as e:
         logger.warning("Validation error on document query: %s", e)
         raise HTTPException(status_code=422, detail=str(e)) from e
@@ -97,10 +569,40 @@ def get_document_answer(question: str) -> dict:
         raise HTTPException(status_code=500, detail=f"Unexpected error querying document: {str(e)}") from e
 
 
-def get_general_answer(question: str) -> str:
-    """Gets an answer to a general question."""
+async def get_general_answer(question: str, session=None) -> str:
+    """Gets an answer to a general question, in the context of a chat session if one is
+    given. Identical questions in flight share one answer unless they follow earlier turns."""
+    history = session.history() if session else []
+    if history:
+        answer = await answer_general_question(question, history)
+    else:
+        answer = await general_answers_in_flight.run(
+            normalize_question(question), lambda: answer_general_question(question)
+        )
+    if session is not None:
+        await chat_sessions.record(session, question, answer)
+    return answer
+
+
+async def answer_general_question(question: str, history=None) -> str:
+    """Answers a general question from the answer cache, or with the LLM, caching the answer.
+    A question following earlier turns depends on them, so it bypasses the cache."""
+    embedding = None
+    if not history:
+        with stage("cache_lookup"):
+            embedding = await embed_question(question)
+            cached = answer_cache.get(GENERAL_ANSWER_NAMESPACE, question, embedding)
+        if cached is not None:
+            logger.info("Answer cache hit. namespace=%s", GENERAL_ANSWER_NAMESPACE)
+            return cached
     try:
-        return handle_general_query(question, llm)
+        llm, _ = await get_clients()
+        answer = await ahandle_general_query(question, llm, history)
+        if answer and not history:
+            answer_cache.put(GENERAL_ANSWER_NAMESPACE, question, answer, embedding)
+        return answer
+    except UpstreamUnavailable as e:
+        raise upstream_unavailable(e) from e
     except ValueError as e:
         logger.warning("Validation error on general query: %s", e)
         raise HTTPException(status_code=422, detail=str(e)) from e
@@ -112,84 +614,378 @@ def get_general_answer(question: str) -> str:
         raise HTTPException(status_code=500, detail=f"Unexpected error with general query: {str(e)}") from e
 
 
-# --- FastAPI Endpoints ---
+async def open_document_stream(
+    question: str, document_id: str | None = None, reranker: str | None = None, session=None
+):
+    """Runs retrieval for a streamed document query; returns (sources, token generator).
+    A follow-up in a chat session is rewritten to stand on its own first."""
+    reranker = select_reranker(reranker)
+    record = await resolve_document(document_id)
+    namespace = document_namespace(record.document_id, record.content_hash, reranker)
+    question = await standalone_question(question, session)
+    cached, index, embedding = await cached_document_answer(question, record, namespace)
+    if cached is not None:
+        logger.info("Answer cache hit. document_id=%s", record.document_id)
+        return cached["sources"], replay_answer(cached["answer"])
+    try:
+        llm, rerankers = await get_clients()
+        sources, tokens = await astream_document_query(index, question, llm, rerankers[reranker])
+        return sources, cache_streamed_answer(tokens, namespace, question, embedding, sources)
+    except UpstreamUnavailable as e:
+        raise upstream_unavailable(e) from e
+    except ValueError as e:
+        logger.warning("Validation error on document stream: %s", e)
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    except RuntimeError as e:
+        logger.error("Error querying document: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error querying document: {str(e)}") from e
+    except Exception as e:
+        logger.error("Unexpected error querying document: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Unexpected error querying document: {str(e)}") from e
 
-@app.post("/upload-document/")
-async def upload_document(file: UploadFile = File(...)):
-    """Uploads a document and creates an index from it."""
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in ALLOWED_EXTENSIONS:
-        logger.warning("Rejected upload — unsupported file type. file=%s", file.filename)
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file type '{ext}'. Only PDF and TXT files are allowed."
-        )
 
-    contents = await file.read()
-    file_size_mb = len(contents) / (1024 * 1024)
+async def open_general_stream(question: str, history=None):
+    """Starts a streamed general answer; returns the token generator. A question following
+    earlier turns of a chat session bypasses the answer cache."""
+    if not history:
+        with stage("cache_lookup"):
+            embedding = await embed_question(question)
+            cached = answer_cache.get(GENERAL_ANSWER_NAMESPACE, question, embedding)
+        if cached is not None:
+            logger.info("Answer cache hit. namespace=%s", GENERAL_ANSWER_NAMESPACE)
+            return replay_answer(cached)
+    try:
+        llm, _ = await get_clients()
+        tokens = await astream_general_query(question, llm, history)
+        if history:
+            return tokens
+        return cache_streamed_answer(tokens, GENERAL_ANSWER_NAMESPACE, question, embedding)
+    except UpstreamUnavailable as e:
+        raise upstream_unavailable(e) from e
+    except ValueError as e:
+        logger.warning("Validation error on general stream: %s", e)
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    except RuntimeError as e:
+        logger.error("Error with general query: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error with general query: {str(e)}") from e
+    except Exception as e:
+        logger.error("Unexpected error with general query: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Unexpected error with general query: {str(e)}") from e
 
-    if len(contents) > MAX_FILE_SIZE_BYTES:
-        logger.warning(
-            "Rejected upload — file too large. file=%s size_mb=%.1f",
-            file.filename, file_size_mb
-        )
-        raise HTTPException(
-            status_code=413,
-            detail=f"File size exceeds the 5MB limit. Your file is {file_size_mb:.1f}MB."
-        )
 
-    logger.info("Received file upload. file=%s size_mb=%.2f", file.filename, file_size_mb)
+async def ndjson_events(sources: list, tokens):
+    """Encodes a streamed answer as NDJSON: one sources event, token events, then done.
 
-    tmp_file_path = None
+    Once the response has started the status code can no longer change, so failures
+    mid-stream are reported as a final error event instead.
+    """
+    yield json.dumps({"type": "sources", "sources": sources}) + "\n"
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
-            tmp_file.write(contents)
-            tmp_file_path = tmp_file.name
+        async for token in tokens:
+            yield json.dumps({"type": "token", "content": token}) + "\n"
+    except Exception as e:
+        logger.error("Error while streaming answer: %s", e, exc_info=True)
+        yield json.dumps({"type": "error", "detail": f"Error while streaming answer: {str(e)}"}) + "\n"
+        return
+    yield json.dumps({"type": "done"}) + "\n"
+
+
+class _UploadedFile:
+    """
+    Callbacks for python-multipart's MultipartParser that collect the `file` part of an
+    upload, enforcing the size limit and hashing as it arrives. Other form fields are
+    ignored. The callbacks only buffer the data; `write` and `finish` put it in the temp
+    file and are meant to run on a worker thread, since disk writes block.
+    """
+
+    def __init__(self):
+        self.filename: str | None = None
+        self.path: str | None = None
+        self.size = 0
+        self.error: HTTPException | None = None
+        self._digest = hashlib.sha256()
+        self._suffix = ""
+        self._receiving = False
+        self._buffer = bytearray()
+        self._file = None
+        self._headers: dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def take(self) -> bytes:
+        """Returns and empties the data received since the last call."""
+        data, self._buffer = bytes(self._buffer), bytearray()
+        return data
 
-        create_index_from_document(tmp_file_path)
-        return JSONResponse(content={"message": f"Document '{file.filename}' uploaded and processed successfully."})
-    except HTTPException:
+    def write(self, data: bytes) -> None:
+        """Appends data to the temp file, creating it on first use. Blocks on disk."""
+        if self._file is None:
+            self._file = tempfile.NamedTemporaryFile(delete=False, suffix=self._suffix)
+            self.path = self._file.name
+        self._file.write(data)
+
+    def finish(self, data: bytes) -> None:
+        """Writes the last data and closes the temp file. Blocks on disk."""
+        self.write(data)
+        self._file.close()
+        self._file = None
+
+    def discard(self) -> None:
+        """Closes and removes the temp file, if one was started."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") != b"file" or self.filename is not None or self.error:
+            return
+        self.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+        ext = os.path.splitext(self.filename)[1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            logger.warning("Rejected upload — unsupported file type. file=%s", self.filename)
+            self.error = HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type '{ext}'. Only PDF and TXT files are allowed."
+            )
+            return
+        self._suffix = ext
+        self._receiving = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._receiving or self.error:
+            return
+        self.size += end - start
+        if self.size > MAX_FILE_SIZE_BYTES:
+            logger.warning("Rejected upload — file too large. file=%s limit_mb=%d", self.filename, MAX_UPLOAD_MB)
+            self.error = _upload_too_large()
+            return
+        chunk = data[start:end]
+        self._digest.update(chunk)
+        self._buffer += chunk
+
+    def _on_part_end(self) -> None:
+        self._receiving = False
+
+
+def _upload_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File size exceeds the {MAX_UPLOAD_MB}MB limit.")
+
+
+async def receive_upload(request: Request) -> _UploadedFile:
+    """Parses a multipart upload from the request body as it arrives, writing its `file`
+    part to a temp file on a worker thread. Starlette's form parsing would spool the whole
+    body before the handler runs; here an oversized upload stops being read at the limit.
+
+    Returns:
+        The received file: original name, temp file path, size and sha256.
+
+    Raises:
+        HTTPException 413 up front when Content-Length is over the limit, or as soon as
+        the file exceeds it; 400 for an unsupported file type or a body that is not a
+        multipart form; 422 without a `file` field. No temp file is left behind.
+    """
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > MAX_FILE_SIZE_BYTES + MULTIPART_OVERHEAD_BYTES:
+        logger.warning("Rejected upload — declared body too large. bytes=%s limit_mb=%d", declared, MAX_UPLOAD_MB)
+        raise _upload_too_large()
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload with a 'file' field.")
+
+    upload = _UploadedFile()
+    parser = MultipartParser(params[b"boundary"], upload.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if upload.error:
+                raise upload.error
+            if upload.buffered >= UPLOAD_WRITE_BUFFER_BYTES:
+                await asyncio.to_thread(upload.write, upload.take())
+        parser.finalize()
+        if upload.filename is None:
+            raise HTTPException(status_code=422, detail="The upload has no 'file' field.")
+        await asyncio.to_thread(upload.finish, upload.take())
+    except MultipartParseError as e:
+        upload.discard()
+        raise HTTPException(status_code=400, detail=f"Malformed multipart upload: {e}") from e
+    except BaseException:
+        upload.discard()
         raise
+    return upload
+
+
+# --- FastAPI Endpoints ---
+
+@app.post("/upload-document/", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_document(request: Request):
+    """Uploads a document and starts a background job that creates an index from it."""
+    upload = await receive_upload(request)
+    try:
+        logger.info(
+            "Received file upload. file=%s size_mb=%.2f sha256=%s",
+            upload.filename, upload.size / (1024 * 1024), upload.sha256[:12]
+        )
+
+        job = job_manager.submit(
+            upload.filename, lambda job: ingest_uploaded_file(job, upload.path, upload.filename, upload.sha256)
+        )
+        return JSONResponse(status_code=202, content={
+            "message": f"Document '{upload.filename}' uploaded; processing has started.",
+            "job_id": job.job_id,
+        })
     except Exception as e:
-        logger.error("Error during document upload. file=%s error=%s", file.filename, e, exc_info=True)
+        logger.error("Error during document upload. file=%s error=%s", upload.filename, e, exc_info=True)
+        upload.discard()
         raise HTTPException(status_code=500, detail=f"Error during document upload or processing: {str(e)}") from e
-    finally:
-        if tmp_file_path and os.path.exists(tmp_file_path):
-            os.remove(tmp_file_path)
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Reports an ingestion job's status, stage (parse/chunk/embed/store), chunk counts and ETA."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return JSONResponse(content=job.to_dict())
 
 
 @app.post("/document-query/")
-async def document_query(question: str = Query(..., min_length=1, description="Question about the uploaded document")):
+async def document_query(
+    question: str = Query(..., min_length=1, description="Question about the uploaded document"),
+    document_id: str | None = Query(None, description="Uploaded document to query; defaults to the latest upload"),
+    reranker: str | None = Query(None, description="Reranker: llm, bm25 or none; defaults to the RERANKER setting"),
+    timings: bool = Query(False, description="Include per-stage latencies and token counts in the response"),
+    session_id: str | None = Query(
+        None, pattern=SESSION_ID_PATTERN, description="Chat session to continue; follow-ups are answered in its context"
+    ),
+):
     """Asks a question about the uploaded document."""
     if not question.strip():
         logger.warning("Rejected document query — blank question.")
         raise HTTPException(status_code=422, detail="Question cannot be blank.")
     logger.info("Document query received. question_length=%d", len(question.strip()))
-    result = get_document_answer(question)
+    with track_stages("document_query") as stages, request_deadline(QUERY_DEADLINE_S):
+        session = await open_session(session_id)
+        result = await get_document_answer(question, document_id, reranker, session)
+    if timings:
+        result = {**result, "timings": stages.to_dict()}
     return JSONResponse(content=result)
 
 
 @app.post("/general-query/")
-async def general_query(question: str = Query(..., min_length=1, description="General question for the LLM")):
+async def general_query(
+    question: str = Query(..., min_length=1, description="General question for the LLM"),
+    timings: bool = Query(False, description="Include per-stage latencies and token counts in the response"),
+    session_id: str | None = Query(
+        None, pattern=SESSION_ID_PATTERN, description="Chat session to continue; follow-ups are answered in its context"
+    ),
+):
     """Asks a general question without document context."""
     if not question.strip():
         logger.warning("Rejected general query — blank question.")
         raise HTTPException(status_code=422, detail="Question cannot be blank.")
     logger.info("General query received. question_length=%d", len(question.strip()))
-    answer = get_general_answer(question)
-    return JSONResponse(content={"answer": answer})
+    with track_stages("general_query") as stages, request_deadline(QUERY_DEADLINE_S):
+        session = await open_session(session_id)
+        answer = await get_general_answer(question, session)
+    content = {"answer": answer}
+    if timings:
+        content["timings"] = stages.to_dict()
+    return JSONResponse(content=content)
+
+
+@app.post("/document-query/stream/")
+async def document_query_stream(
+    question: str = Query(..., min_length=1, description="Question about the uploaded document"),
+    document_id: str | None = Query(None, description="Uploaded document to query; defaults to the latest upload"),
+    reranker: str | None = Query(None, description="Reranker: llm, bm25 or none; defaults to the RERANKER setting"),
+    session_id: str | None = Query(
+        None, pattern=SESSION_ID_PATTERN, description="Chat session to continue; follow-ups are answered in its context"
+    ),
+):
+    """Streams the answer to a document question as NDJSON events (sources first, then tokens)."""
+    if not question.strip():
+        logger.warning("Rejected document stream — blank question.")
+        raise HTTPException(status_code=422, detail="Question cannot be blank.")
+    logger.info("Document stream received. question_length=%d", len(question.strip()))
+    # Stages up to the first token; the token stream itself is timed in query_type
+    with track_stages("document_stream"), request_deadline(QUERY_DEADLINE_S):
+        session = await open_session(session_id)
+        sources, tokens = await open_document_stream(question, document_id, reranker, session)
+    if session is not None:
+        tokens = remember_streamed_turn(tokens, session, question)
+    return StreamingResponse(ndjson_events(sources, tokens), media_type="application/x-ndjson")
+
+
+@app.post("/general-query/stream/")
+async def general_query_stream(
+    question: str = Query(..., min_length=1, description="General question for the LLM"),
+    session_id: str | None = Query(
+        None, pattern=SESSION_ID_PATTERN, description="Chat session to continue; follow-ups are answered in its context"
+    ),
+):
+    """Streams the answer to a general question as NDJSON events."""
+    if not question.strip():
+        logger.warning("Rejected general stream — blank question.")
+        raise HTTPException(status_code=422, detail="Question cannot be blank.")
+    logger.info("General stream received. question_length=%d", len(question.strip()))
+    with track_stages("general_stream"), request_deadline(QUERY_DEADLINE_S):
+        session = await open_session(session_id)
+        tokens = await open_general_stream(question, session.history() if session else None)
+    if session is not None:
+        tokens = remember_streamed_turn(tokens, session, question)
+    return StreamingResponse(ndjson_events([], tokens), media_type="application/x-ndjson")
 
 
 @app.get("/clear-index/")
-async def clear_index():
-    """Clears the document index (resets the document-specific chat)."""
-    global global_index, global_document_name
-    logger.info("Clear index requested. current_document=%s", global_document_name)
+async def clear_index(
+    document_id: str | None = Query(None, description="Document to clear; defaults to the latest upload"),
+):
+    """Clears a document's index (resets the document-specific chat)."""
+    record = await asyncio.to_thread(find_document, document_id)
+    if record is None:
+        logger.info("Clear index requested with no matching document. document_id=%s", document_id)
+        return JSONResponse(content={"message": "Document index cleared."})
+    logger.info("Clear index requested. document_id=%s document=%s", record.document_id, record.document_name)
     try:
-        global_index = None
-        global_document_name = None
-        clear_chromadb_db()
-        logger.info("Index cleared successfully.")
+        await asyncio.to_thread(clear_chromadb_db, record.document_id)
+        await asyncio.to_thread(index_registry.remove, record.document_id)
+        answer_cache.invalidate(document_namespace(record.document_id))
+        logger.info("Index cleared successfully. document_id=%s", record.document_id)
         return JSONResponse(content={"message": "Document index cleared."})
     except RuntimeError as e:
         logger.error("Error clearing index: %s", e, exc_info=True)
@@ -200,10 +996,31 @@ async def clear_index():
 
 
 @app.get("/status/")
-async def status():
-    """Check if document has been uploaded."""
-    if global_document_name is not None:
-        logger.info("Status check — document loaded. document=%s", global_document_name)
-        return JSONResponse(content={"message": f"Document '{global_document_name}' is uploaded.", "status": True})
-    logger.info("Status check — no document loaded.")
+async def status(
+    document_id: str | None = Query(None, description="Document to check; defaults to the latest upload"),
+):
+    """Check if a document has been uploaded."""
+    record = await asyncio.to_thread(find_document, document_id)
+    if record is not None:
+        status_logger.info("Status check — document loaded. document=%s", record.document_name)
+        return JSONResponse(content={
+            "message": f"Document '{record.document_name}' is uploaded.",
+            "status": True,
+            "document_id": record.document_id,
+        })
+    status_logger.info("Status check — no document loaded.")
     return JSONResponse(content={"message": "No Document uploaded.", "status": False})
+
+
+@app.get("/health/")
+async def health():
+    """Liveness: answers as soon as the server is up. `warm` reports whether the LLM and
+    rerankers exist yet; requests before that create them on first use."""
+    return JSONResponse(content={"status": "ok", "warm": clients_ready()})
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request and stage latency histograms, in-flight requests, LLM
+    tokens, cache hits and misses, and ingested chunks."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,332 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.utils import get_tokenizer
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.routing import Match
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Set (by gunicorn.conf.py) when several worker processes serve the app: each writes its
+# samples to files in this directory and /metrics aggregates them across workers.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+REQUEST_SECONDS = Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency, including streamed bodies.",
+    ["method", "route", "status"], buckets=_LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "rag_http_requests_in_flight", "HTTP requests being served.", ["route"], multiprocess_mode="livesum",
+)
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "Latency of one pipeline stage of a query or ingestion.",
+    ["operation", "stage"], buckets=_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter("rag_llm_tokens", "Tokens sent to and generated by the LLM.", ["kind"])
+CONTEXT_TOKENS = Counter(
+    "rag_context_tokens", "Retrieved-context tokens kept for synthesis, and those removed by packing.", ["kind"],
+)
+INGESTED_CHUNKS = Counter("rag_ingested_chunks", "Chunks embedded and stored by ingestion.")
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "rag_admission_queue_seconds", "Time a request waited for a slot of its priority class.",
+    ["priority_class"], buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+ADMISSION_IN_USE = Gauge(
+    "rag_admission_in_use", "Requests holding a slot of their priority class.",
+    ["priority_class"], multiprocess_mode="livesum",
+)
+ADMISSION_QUEUED = Gauge(
+    "rag_admission_queued", "Requests waiting for a slot of their priority class.",
+    ["priority_class"], multiprocess_mode="livesum",
+)
+ADMISSION_REJECTED = Counter(
+    "rag_admission_rejected", "Requests answered 429 because their class's queue was full or too slow.",
+    ["priority_class", "reason"],
+)
+COALESCED_REQUESTS = Counter(
+    "rag_coalesced_requests", "Queries answered by an identical query already in flight.", ["operation"],
+)
+SESSION_COMPACTIONS = Counter(
+    "rag_session_compactions", "Background foldings of older chat turns into a session's summary.", ["outcome"],
+)
+DOCUMENT_CHUNKS = Histogram(
+    "rag_document_chunks", "Chunks per ingested document.",
+    buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 50000),
+)
+# Resilience of the Azure clients (see resilience.py). With several workers the circuit
+# state reported is the worst one.
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "rag_upstream_circuit_state", "Circuit breaker state per Azure client: 0 closed, 1 half-open, 2 open.",
+    ["client"], multiprocess_mode="max",
+)
+UPSTREAM_REJECTED = Counter(
+    "rag_upstream_rejected", "Azure calls failed fast by an open circuit or a spent deadline.", ["client", "reason"],
+)
+UPSTREAM_HEDGES = Counter(
+    "rag_upstream_hedged_requests", "Duplicate Azure calls sent after the hedge delay, and those that answered first.",
+    ["client", "outcome"],
+)
+
+# Query stages derived from llama_index instrumentation events: event name -> (stage,
+# +1 for start / -1 for end). Nested retrievers and wrapped embedding models emit their
+# own pairs, so only outermost spans count. Postprocessors (rerankers) run between the
+# end of retrieval and the start of synthesis.
+_EVENT_SPANS = {
+    "RetrievalStartEvent": ("retrieve", 1),
+    "RetrievalEndEvent": ("retrieve", -1),
+    "EmbeddingStartEvent": ("embed", 1),
+    "EmbeddingEndEvent": ("embed", -1),
+    "SynthesizeStartEvent": ("synthesize", 1),
+    "SynthesizeEndEvent": ("synthesize", -1),
+}
+
+_current: ContextVar["StageTimings | None"] = ContextVar("stage_timings", default=None)
+
+
+class StageTimings:
+    """Stage durations and LLM token counts of one request."""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.seconds: dict[str, float] = {}
+        self.tokens = {"prompt": 0, "completion": 0}
+        self._depth: dict[str, int] = {}
+        self._opened: dict[str, float] = {}
+        self._retrieved_at: float | None = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def event(self, name: str, at: float) -> None:
+        span = _EVENT_SPANS.get(name)
+        if span is None:
+            return
+        stage, step = span
+        depth = self._depth.get(stage, 0)
+        if step > 0:
+            if depth == 0:
+                self._opened[stage] = at
+                if stage == "synthesize" and self._retrieved_at is not None:
+                    self.add("rerank", at - self._retrieved_at)
+                    self._retrieved_at = None
+            self._depth[stage] = depth + 1
+        elif depth > 0:
+            self._depth[stage] = depth - 1
+            if depth == 1:
+                self.add(stage, at - self._opened[stage])
+                if stage == "retrieve":
+                    self._retrieved_at = at
+
+    def finish(self, total: float) -> None:
+        """Adds the total and records every stage in STAGE_SECONDS."""
+        self.seconds["total"] = total
+        for stage, seconds in self.seconds.items():
+            STAGE_SECONDS.labels(self.operation, stage).observe(seconds)
+
+    def to_dict(self) -> dict:
+        """Milliseconds per stage, plus token counts when the LLM was called."""
+        timings = {f"{stage}_ms": round(seconds * 1000, 2) for stage, seconds in self.seconds.items()}
+        if any(self.tokens.values()):
+            timings.update({f"{kind}_tokens": count for kind, count in self.tokens.items()})
+        return timings
+
+
+def current_timings() -> StageTimings | None:
+    """The StageTimings of the request being served, if it is tracked."""
+    return _current.get()
+
+
+@contextmanager
+def track_stages(operation: str):
+    """Times the stages of one request; yields its StageTimings, recorded on exit."""
+    timings = StageTimings(operation)
+    token = _current.set(timings)
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        timings.finish(time.perf_counter() - start)
+
+
+@contextmanager
+def stage(name: str):
+    """Adds the duration of the block to the current request's timings, if any."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.add(name, time.perf_counter() - start)
+
+
+def observe_stage(operation: str, stage_name: str, seconds: float) -> None:
+    """Records a stage measured outside a tracked request (e.g. while a response streams)."""
+    STAGE_SECONDS.labels(operation, stage_name).observe(seconds)
+
+
+class IngestionTimer:
+    """Progress callback wrapper timing each ingestion stage from its first report to the next stage's."""
+
+    def __init__(self, progress=None):
+        self._progress = progress
+        self._stage = None
+        self._started = self._stage_started = time.perf_counter()
+
+    def __call__(self, stage_name: str, **counts) -> None:
+        if stage_name != self._stage:
+            self._close_stage()
+            self._stage, self._stage_started = stage_name, time.perf_counter()
+        if self._progress:
+            self._progress(stage_name, **counts)
+
+    def _close_stage(self) -> None:
+        if self._stage is not None:
+            observe_stage("ingest", self._stage, time.perf_counter() - self._stage_started)
+
+    def finish(self, chunk_count: int) -> None:
+        self._close_stage()
+        self._stage = None
+        observe_stage("ingest", "total", time.perf_counter() - self._started)
+        INGESTED_CHUNKS.inc(chunk_count)
+        DOCUMENT_CHUNKS.observe(chunk_count)
+
+
+def _usage(raw) -> tuple[int, int] | None:
+    """(prompt, completion) token counts reported by the model, if any."""
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if not usage:
+        return None
+    read = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    prompt, completion = read("prompt_tokens"), read("completion_tokens")
+    return (prompt or 0, completion or 0) if prompt is not None or completion is not None else None
+
+
+class _EventHandler(BaseEventHandler):
+    """Feeds llama_index events into the current request's timings and counts LLM tokens."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MetricsEventHandler"
+
+    def handle(self, event, **kwargs) -> None:
+        name = type(event).__name__
+        timings = _current.get()
+        if timings is not None:
+            timings.event(name, time.perf_counter())
+        if name in ("LLMChatEndEvent", "LLMCompletionEndEvent") and event.response is not None:
+            try:
+                self._count_tokens(event, timings)
+            except Exception as e:
+                logger.warning("Could not count LLM tokens: %s", e)
+
+    @staticmethod
+    def _count_tokens(event, timings) -> None:
+        counts = _usage(event.response.raw)
+        if counts is None:
+            # Not reported (e.g. streamed): count with the tokenizer llama_index uses
+            tokenizer = get_tokenizer()
+            prompt = event.prompt if hasattr(event, "prompt") else "\n".join(str(m.content) for m in event.messages)
+            text = event.response.text if hasattr(event.response, "text") else event.response.message.content
+            counts = (len(tokenizer(prompt)), len(tokenizer(text or "")))
+        for kind, count in zip(("prompt", "completion"), counts):
+            LLM_TOKENS.labels(kind).inc(count)
+            if timings is not None:
+                timings.tokens[kind] += count
+
+
+class _CacheCollector:
+    """
+    Reports hit/miss counters and sizes of the application caches at scrape time. The
+    caches are per process, so with several workers the values are those of the worker
+    answering the scrape, labelled with its pid.
+    """
+
+    def __init__(self):
+        self.sources: dict[str, Callable[[], dict | None]] = {}
+
+    def collect(self):
+        labels = ["cache", "pid"] if MULTIPROCESS else ["cache"]
+        extra = [str(os.getpid())] if MULTIPROCESS else []
+        hits = CounterMetricFamily("rag_cache_hits", "Cache lookups that found an entry.", labels=labels)
+        misses = CounterMetricFamily("rag_cache_misses", "Cache lookups that found nothing.", labels=labels)
+        entries = GaugeMetricFamily("rag_cache_entries", "Entries held by the cache.", labels=labels)
+        for name, stats in list(self.sources.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning("Could not read cache stats. cache=%s error=%s", name, e)
+                continue
+            if not values:
+                continue
+            hits.add_metric([name, *extra], values.get("hits", 0))
+            misses.add_metric([name, *extra], values.get("misses", 0))
+            entries.add_metric([name, *extra], values.get("entries", values.get("loaded", 0)))
+        yield from (hits, misses, entries)
+
+
+_cache_collector = _CacheCollector()
+REGISTRY.register(_cache_collector)
+get_dispatcher().add_event_handler(_EventHandler())
+
+
+def register_cache(name: str, stats: Callable[[], dict | None]) -> None:
+    """Exports a cache's stats() (hits, misses, entries) as rag_cache_* metrics."""
+    _cache_collector.sources[name] = stats
+
+
+def render_metrics() -> bytes:
+    """The exposition text for /metrics, aggregated over all workers in multiprocess mode."""
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_cache_collector)
+    return generate_latest(registry)
+
+
+def _route_template(scope) -> str:
+    """The matched route's path template, so /jobs/{job_id} is one label value."""
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording in-flight requests and latency per route, until the last body byte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = _route_template(scope)
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            REQUEST_SECONDS.labels(scope["method"], route, str(status["code"])).observe(time.perf_counter() - start)
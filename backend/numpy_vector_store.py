@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+from typing import Any, List, Sequence
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+NODES_FILE = "nodes.json"
+# Written last, so a store without it is an incomplete ingestion and is ignored
+MANIFEST_FILE = "manifest.json"
+
+# MMR re-ranks this many of the most similar chunks per requested result (at least 50)
+MMR_PREFETCH_FACTOR = 10
+DEFAULT_MMR_LAMBDA = 0.5
+# Async queries of stores with at least this many chunks search on a worker thread; below
+# it the matrix-vector product takes well under a millisecond, less than the thread hop
+ASYNC_QUERY_THREAD_MIN_CHUNKS = 5000
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def mmr_select(
+    similarities: np.ndarray,
+    embeddings: np.ndarray,
+    top_k: int,
+    lambda_mult: float = DEFAULT_MMR_LAMBDA,
+    prefetch: int | None = None,
+) -> np.ndarray:
+    """
+    Maximal marginal relevance over unit vectors, vectorized across candidates.
+
+    The `prefetch` most similar rows are compared pairwise with one matrix multiply; each
+    of the `top_k` picks is then one argmax over lambda * relevance - (1 - lambda) *
+    max similarity to the rows already picked.
+
+    Returns:
+        Row indices of the selected embeddings, in selection order.
+    """
+    candidates = top_k_indices(similarities, prefetch or max(50, top_k * MMR_PREFETCH_FACTOR))
+    relevance = similarities[candidates]
+    vectors = np.asarray(embeddings[candidates])
+    pairwise = vectors @ vectors.T
+
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    selected = []
+    for step in range(min(top_k, len(candidates))):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        redundancy = pairwise[:, pick] if step == 0 else np.maximum(redundancy, pairwise[:, pick])
+    return candidates[selected]
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Exact-search vector store for one document: unit-normalised float32 embeddings in a
+    memory-mapped .npy matrix plus a JSON sidecar with each chunk's text and metadata.
+
+    Search is a single matrix-vector product, which beats an HNSW index for the few
+    thousand chunks of a typical document. Chunks added with `add` are buffered and
+    written by `flush`, which also writes the manifest that marks the store complete.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+    path: str
+
+    _embeddings: np.ndarray | None = PrivateAttr(default=None)
+    _rows: list = PrivateAttr(default_factory=list)
+    _pending_vectors: list = PrivateAttr(default_factory=list)
+    _pending_rows: list = PrivateAttr(default_factory=list)
+    _manifest: dict = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @classmethod
+    def create(cls, path: str, manifest: dict) -> "NumpyVectorStore":
+        """Starts a new, empty store at `path`; `manifest` is saved on flush."""
+        os.makedirs(path, exist_ok=True)
+        store = cls(path=path)
+        store._manifest = dict(manifest)
+        return store
+
+    @classmethod
+    def open(cls, path: str) -> "NumpyVectorStore":
+        """Opens a flushed store, memory-mapping its embeddings."""
+        store = cls(path=path)
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            store._manifest = json.load(f)
+        with open(os.path.join(path, NODES_FILE)) as f:
+            store._rows = json.load(f)
+        store._embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        return store
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    @staticmethod
+    def read_manifest(path: str) -> dict:
+        """Returns the manifest with the stored chunk count, without loading the store."""
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def manifest(self) -> dict:
+        return dict(self._manifest)
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[str]:
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        rows = [
+            {
+                "id": node.node_id,
+                "text": node.get_content(),
+                "metadata": node_to_metadata_dict(node, remove_text=True, flat_metadata=False),
+            }
+            for node in nodes
+        ]
+        with self._lock:
+            self._pending_vectors.append(_unit_rows(vectors))
+            self._pending_rows.extend(rows)
+        return [row["id"] for row in rows]
+
+    def flush(self) -> None:
+        """Writes buffered chunks to disk and re-maps the matrix. Files are replaced atomically."""
+        with self._lock:
+            if not self._pending_rows and self._embeddings is not None:
+                return
+            parts = [np.asarray(self._embeddings)] if self._embeddings is not None and len(self._rows) else []
+            parts += self._pending_vectors
+            matrix = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+            self._rows = self._rows + self._pending_rows
+            self._write(matrix)
+            self._pending_vectors, self._pending_rows = [], []
+
+    def _write(self, matrix: np.ndarray) -> None:
+        embeddings_path = os.path.join(self.path, EMBEDDINGS_FILE)
+        with open(embeddings_path + ".tmp", "wb") as f:
+            np.save(f, matrix.astype(np.float32, copy=False))
+        os.replace(embeddings_path + ".tmp", embeddings_path)
+        for name, payload in ((NODES_FILE, self._rows), (MANIFEST_FILE, {**self._manifest, "chunk_count": len(self._rows)})):
+            target = os.path.join(self.path, name)
+            with open(target + ".tmp", "w") as f:
+                json.dump(payload, f)
+            os.replace(target + ".tmp", target)
+        self._embeddings = np.load(embeddings_path, mmap_mode="r")
+        logger.info("NumPy vector store written. chunks=%d path=%s", len(self._rows), self.path)
+
+    def nodes(self) -> List[BaseNode]:
+        """Returns every stored chunk (without embeddings)."""
+        return [metadata_dict_to_node(row["metadata"], text=row["text"]) for row in self._rows]
+
+    def get_nodes(self, node_ids=None, filters=None) -> List[BaseNode]:
+        if filters is not None:
+            raise NotImplementedError("Metadata filters are not supported by the NumPy vector store.")
+        nodes = self.nodes()
+        if node_ids is None:
+            return nodes
+        wanted = set(node_ids)
+        return [node for node in nodes if node.node_id in wanted]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            keep = [i for i, row in enumerate(self._rows) if row["metadata"].get("ref_doc_id") != ref_doc_id]
+            if len(keep) == len(self._rows):
+                return
+            matrix = np.asarray(self._embeddings)[keep]
+            self._rows = [self._rows[i] for i in keep]
+            self._write(matrix)
+
+    def clear(self) -> None:
+        """Deletes the store from disk.
+
+        Raises:
+            OSError: The files could not be removed. The manifest goes first, so a store
+                left half-deleted is treated as absent.
+        """
+        with self._lock:
+            self._embeddings = None
+            self._rows = []
+            manifest_path = os.path.join(self.path, MANIFEST_FILE)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError("Metadata filters are not supported by the NumPy vector store.")
+        if self._embeddings is None or not len(self._rows) or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = _unit_rows(np.asarray(query.query_embedding, dtype=np.float32))
+        similarities = self._embeddings @ query_vector
+        if query.mode == VectorStoreQueryMode.MMR:
+            lambda_mult = kwargs.get("mmr_threshold") or query.mmr_threshold or DEFAULT_MMR_LAMBDA
+            indices = mmr_select(similarities, self._embeddings, query.similarity_top_k, lambda_mult)
+        else:
+            indices = top_k_indices(similarities, query.similarity_top_k)
+
+        rows = [self._rows[i] for i in indices]
+        return VectorStoreQueryResult(
+            nodes=[metadata_dict_to_node(row["metadata"], text=row["text"]) for row in rows],
+            similarities=[float(similarities[i]) for i in indices],
+            ids=[row["id"] for row in rows],
+        )
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Runs `query` on a worker thread for large stores, keeping the scan off the event loop."""
+        if len(self._rows) >= ASYNC_QUERY_THREAD_MIN_CHUNKS:
+            return await asyncio.to_thread(self.query, query, **kwargs)
+        return self.query(query, **kwargs)
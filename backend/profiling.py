@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from logging_config import current_request_id, get_logger
+
+logger = get_logger(__name__)
+
+# A request is profiled when it carries PROFILE_HEADER set to PROFILE_TOKEN (the header is
+# ignored while no token is configured), or at random with probability PROFILE_SAMPLE_RATE.
+# Only one request is profiled at a time; others arriving meanwhile run unprofiled. The
+# sampler and tracemalloc are process-wide, though: while a profile runs, every allocation
+# of every concurrent request records a PROFILE_ALLOC_FRAMES-deep traceback, which slows
+# allocation-heavy code severalfold and holds the traces in memory until the snapshot.
+PROFILE_HEADER = "x-profile"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_ALLOC_FRAMES = int(os.getenv("PROFILE_ALLOC_FRAMES", "25"))
+PROFILE_EXCLUDED_PATHS = ("/metrics",)
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(code) -> str:
+    # ";" separates frames in the collapsed format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Wall-clock sampler: a background thread records the stack of every other thread each
+    `interval` seconds, so time spent blocked (network, locks, the event loop's select)
+    counts as much as time on the CPU. Coroutines suspended in an await are not on any
+    thread's stack; their waiting shows up under the event loop thread's select call.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+            self.samples += 1
+
+
+def _allocation_stacks(snapshot) -> Counter:
+    """Live allocation bytes per collapsed allocation traceback."""
+    stacks: Counter = Counter()
+    for stat in snapshot.statistics("traceback"):
+        labels = [
+            f"{os.path.basename(frame.filename)}:{frame.lineno}".replace(";", ":")
+            for frame in reversed(stat.traceback)
+        ]
+        stacks[";".join(labels)] += stat.size
+    return stacks
+
+
+def _write_collapsed(path: str, stacks: Counter) -> None:
+    with open(path, "w") as f:
+        for stack, weight in stacks.most_common():
+            f.write(f"{stack} {weight}\n")
+
+
+class RequestProfile:
+    """Wall-clock stacks and allocations of one request, written under PROFILE_DIR as:
+
+      <id>.wall.collapsed   sample counts per stack (flamegraph.pl / speedscope)
+      <id>.alloc.collapsed  bytes allocated and still live at the end, per allocation stack
+      <id>.json             request, duration, sample counts and the top allocation sites
+    """
+
+    def __init__(self, profile_id: str, method: str, path: str, reason: str):
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.request_id = current_request_id()
+        self.status = None
+        self._sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+        self._started_tracemalloc = False
+        self._snapshot = None
+        self._start = 0.0
+        self.duration = 0.0
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_ALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._start = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """Stops sampling and tracing. Blocks for up to a sampler interval and copies every
+        live trace, so async callers run it in a thread."""
+        self.duration = time.perf_counter() - self._start
+        self._sampler.stop()
+        if tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def write(self, directory: str = None) -> str:
+        """Writes the artifacts; returns the path prefix."""
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, self.profile_id)
+        _write_collapsed(f"{prefix}.wall.collapsed", self._sampler.stacks)
+        top_allocations = []
+        if self._snapshot is not None:
+            snapshot = self._snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            _write_collapsed(f"{prefix}.alloc.collapsed", _allocation_stacks(snapshot))
+            top_allocations = [
+                {"site": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count}
+                for stat in snapshot.statistics("lineno")[:20]
+            ]
+        with open(f"{prefix}.json", "w") as f:
+            json.dump({
+                "profile_id": self.profile_id,
+                "request_id": self.request_id,
+                "method": self.method,
+                "path": self.path,
+                "status": self.status,
+                "reason": self.reason,
+                "duration_ms": round(self.duration * 1000, 2),
+                "samples": self._sampler.samples,
+                "interval_ms": PROFILE_INTERVAL_MS,
+                "top_allocations": top_allocations,
+            }, f, indent=2)
+        return prefix
+
+
+def _profile_reason(scope) -> str | None:
+    """Why this request should be profiled, or None. Costs a header scan and a random draw."""
+    if scope["path"] in PROFILE_EXCLUDED_PATHS:
+        return None
+    if PROFILE_TOKEN:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER.encode() and value.decode("latin-1") == PROFILE_TOKEN:
+                return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def _write_profile(profile: RequestProfile) -> None:
+    try:
+        prefix = profile.write()
+        logger.info(
+            "Request profile written. profile_id=%s path=%s duration_ms=%d files=%s.*",
+            profile.profile_id, profile.path, round(profile.duration * 1000), prefix,
+        )
+    except Exception as e:
+        logger.error("Could not write request profile. profile_id=%s error=%s", profile.profile_id, e)
+    finally:
+        _profile_lock.release()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling opted-in requests end to end, one at a time. The profile ID
+    is returned in the X-Profile-Id response header. The allocation snapshot is taken on
+    a worker thread and filtered and written after the response on a background thread,
+    so none of it runs on the event loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reason = _profile_reason(scope)
+        if reason is None or not _profile_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(uuid.uuid4().hex, scope["method"], scope["path"], reason)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.profile_id.encode())]}
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            try:
+                await asyncio.to_thread(profile.stop)
+            finally:
+                # Releases the profile lock, even if the request was cancelled meanwhile
+                threading.Thread(target=_write_profile, args=(profile,), name="profile-writer", daemon=True).start()
@@ -1,38 +1,166 @@
 import time
+import threading
 from llama_index.core.llms import ChatMessage
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
+from context_packing import ORIGINAL_TEXT_KEY, context_packer
 from logging_config import get_logger
+from metrics import observe_stage
+# Raised unwrapped (an open circuit or a spent deadline), so the API can answer 503/504
+from resilience import UpstreamUnavailable
 
 logger = get_logger(__name__)
 
+# Query engines (retriever, response synthesizer, prompts, postprocessor chain) are built
+# once per index and configuration and stored on the index itself, so an index evicted
+# from the registry takes its engines with it. Engines keep no per-query state and are
+# shared between concurrent requests.
+_query_engines_lock = threading.Lock()
 
-def handle_general_query(prompt, llm):
+
+def _build_general_messages(prompt, history=None):
+    """Validates a general prompt and builds the chat messages sent to the LLM, with the
+    conversation so far (a session's history) between the system prompt and the question."""
+    if not prompt or not prompt.strip():
+        raise ValueError("Prompt cannot be empty.")
+    return [
+        ChatMessage(role="system", content="You are a helpful assistant."),
+        *(history or []),
+        ChatMessage(role="user", content=prompt.strip()),
+    ]
+
+
+def _transcript(history):
+    """Renders chat messages as "Role: content" lines for prompts about a conversation."""
+    return "\n".join(f"{message.role.value.capitalize()}: {message.content}" for message in history)
+
+
+def _validate_document_query(index, prompt, llm):
+    """Validates the arguments shared by the sync and async document query paths."""
+    if not prompt or not prompt.strip():
+        raise ValueError("Prompt cannot be empty.")
+    if index is None:
+        raise ValueError("Index is required for document query.")
+    if llm is None:
+        raise ValueError("LLM instance is required.")
+
+
+def _build_query_engine(index, llm, reranker=None, streaming=False, mmr=True):
+    """Returns the (cached) query engine for an index: MMR retrieval, optionally followed by
+    the reranker postprocessor, then context packing to the token budget."""
+    # Fetch more candidates when reranking; fewer otherwise to avoid noisy context
+    similarity_top_k = 10 if reranker else 5
+    query_mode = VectorStoreQueryMode.MMR if mmr else VectorStoreQueryMode.DEFAULT
+    # LLM and rerankers are process-wide singletons, so their identity is a stable key
+    key = (id(llm), id(reranker), similarity_top_k, query_mode, streaming)
+
+    with _query_engines_lock:
+        engines = vars(index).get("_query_engines")
+        if engines is None:
+            engines = index._query_engines = {}
+        engine = engines.get(key)
+        if engine is None:
+            engine = index.as_query_engine(
+                llm=llm,
+                similarity_top_k=similarity_top_k,
+                vector_store_query_mode=query_mode,
+                node_postprocessors=[reranker, context_packer] if reranker else [context_packer],
+                streaming=streaming,
+            )
+            engines[key] = engine
+    return engine
+
+
+def _extract_sources(response):
+    """Builds the page/preview citation list from a query engine response. Previews show
+    the retrieved chunk as stored, not the packed text the LLM was given."""
+    sources = []
+    for node in (response.source_nodes or []):
+        page = node.node.metadata.get("page_label", "N/A")
+        text = node.node.metadata.get(ORIGINAL_TEXT_KEY) or node.node.get_content()
+        preview = text[:150].strip()
+        sources.append({"page": page, "preview": preview})
+    return sources
+
+
+async def _timed_tokens(token_gen, label, operation):
+    """Re-yields non-empty tokens and logs (and records under `operation`) time-to-first-token
+    and total stream duration."""
+    start = time.monotonic()
+    first_token_ms = None
+    async for token in token_gen:
+        if not token:
+            continue
+        if first_token_ms is None:
+            first_token_ms = round((time.monotonic() - start) * 1000)
+        yield token
+    duration = time.monotonic() - start
+    if first_token_ms is not None:
+        observe_stage(operation, "first_token", first_token_ms / 1000)
+    observe_stage(operation, "stream", duration)
+    logger.info("%s stream completed. first_token_ms=%s duration_ms=%d", label, first_token_ms, round(duration * 1000))
+
+
+async def _chat_deltas(response_stream):
+    """Extracts the incremental text from a stream of ChatResponse chunks."""
+    async for chunk in response_stream:
+        yield chunk.delta
+
+
+def handle_general_query(prompt, llm, history=None):
     """
     Handles general-purpose queries using the Azure AI model.
 
     Args:
         prompt (str): The general input question.
         llm (AzureAICompletionsModel): Azure AI completions client.
+        history (list[ChatMessage] | None): Earlier turns of the conversation, if any.
 
     Returns:
         str: LLM response text.
     """
-    if not prompt or not prompt.strip():
-        raise ValueError("Prompt cannot be empty.")
+    messages = _build_general_messages(prompt, history)
     if llm is None:
         raise ValueError("LLM instance is required.")
 
     logger.info("Handling general query. prompt_length=%d", len(prompt.strip()))
-    messages = [
-        ChatMessage(role="system", content="You are a helpful assistant."),
-        ChatMessage(role="user", content=prompt.strip()),
-    ]
     try:
         start = time.monotonic()
         assistant_response = llm.chat(messages)
         duration_ms = round((time.monotonic() - start) * 1000)
         logger.info("General query completed. duration_ms=%d", duration_ms)
         return assistant_response.message.content
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error("LLM call failed for general query: %s", e, exc_info=True)
+        raise RuntimeError(f"LLM call failed for general query: {e}") from e
+
+
+async def ahandle_general_query(prompt, llm, history=None):
+    """
+    Async variant of handle_general_query; awaits the LLM without blocking the event loop.
+
+    Args:
+        prompt (str): The general input question.
+        llm (AzureAICompletionsModel): Azure AI completions client.
+        history (list[ChatMessage] | None): Earlier turns of the conversation, if any.
+
+    Returns:
+        str: LLM response text.
+    """
+    messages = _build_general_messages(prompt, history)
+    if llm is None:
+        raise ValueError("LLM instance is required.")
+
+    logger.info("Handling general query (async). prompt_length=%d", len(prompt.strip()))
+    try:
+        start = time.monotonic()
+        assistant_response = await llm.achat(messages)
+        duration_ms = round((time.monotonic() - start) * 1000)
+        logger.info("General query completed. duration_ms=%d", duration_ms)
+        return assistant_response.message.content
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error("LLM call failed for general query: %s", e, exc_info=True)
         raise RuntimeError(f"LLM call failed for general query: {e}") from e
@@ -51,37 +179,169 @@ def handle_document_query(index, prompt, llm, reranker=None):
     Returns:
         dict: {"answer": str, "sources": list[dict]} grounded in the document.
     """
-    if not prompt or not prompt.strip():
-        raise ValueError("Prompt cannot be empty.")
-    if index is None:
-        raise ValueError("Index is required for document query.")
-    if llm is None:
-        raise ValueError("LLM instance is required.")
+    _validate_document_query(index, prompt, llm)
 
     logger.info("Handling document query. prompt_length=%d", len(prompt.strip()))
     try:
-        node_postprocessors = [reranker] if reranker else []
-        # Fetch more candidates when reranking; fewer otherwise to avoid noisy context
-        similarity_top_k = 10 if reranker else 5
-
-        query_engine = index.as_query_engine(
-            llm=llm,
-            similarity_top_k=similarity_top_k,
-            vector_store_query_mode=VectorStoreQueryMode.MMR,
-            node_postprocessors=node_postprocessors,
-        )
+        query_engine = _build_query_engine(index, llm, reranker)
         start = time.monotonic()
         response = query_engine.query(prompt.strip())
         duration_ms = round((time.monotonic() - start) * 1000)
         logger.info("Document query completed. duration_ms=%d", duration_ms)
 
-        sources = []
-        for node in (response.source_nodes or []):
-            page = node.node.metadata.get("page_label", "N/A")
-            preview = node.node.get_content()[:150].strip()
-            sources.append({"page": page, "preview": preview})
+        return {"answer": response.response or "", "sources": _extract_sources(response)}
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error("LLM call failed for document query: %s", e, exc_info=True)
+        raise RuntimeError(f"LLM call failed for document query: {e}") from e
+
+
+async def ahandle_document_query(index, prompt, llm, reranker=None):
+    """
+    Async variant of handle_document_query; embedding, retrieval, reranking and
+    synthesis are all awaited so the event loop stays free for other requests.
+
+    Args:
+        index (VectorStoreIndex): Vectorized form of the input document.
+        prompt (str): The question about the document.
+        llm (AzureAICompletionsModel): Azure AI completions client.
+        reranker (LLMRerank | None): Optional LLM-based reranker postprocessor.
+
+    Returns:
+        dict: {"answer": str, "sources": list[dict]} grounded in the document.
+    """
+    _validate_document_query(index, prompt, llm)
+
+    logger.info("Handling document query (async). prompt_length=%d", len(prompt.strip()))
+    try:
+        query_engine = _build_query_engine(index, llm, reranker)
+        start = time.monotonic()
+        response = await query_engine.aquery(prompt.strip())
+        duration_ms = round((time.monotonic() - start) * 1000)
+        logger.info("Document query completed. duration_ms=%d", duration_ms)
+
+        return {"answer": response.response or "", "sources": _extract_sources(response)}
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error("LLM call failed for document query: %s", e, exc_info=True)
+        raise RuntimeError(f"LLM call failed for document query: {e}") from e
+
+
+async def astream_general_query(prompt, llm, history=None):
+    """
+    Starts a streamed general-purpose completion.
+
+    Args:
+        prompt (str): The general input question.
+        llm (AzureAICompletionsModel): Azure AI completions client.
+        history (list[ChatMessage] | None): Earlier turns of the conversation, if any.
+
+    Returns:
+        AsyncGenerator[str]: Response tokens as they arrive from the LLM.
+    """
+    messages = _build_general_messages(prompt, history)
+    if llm is None:
+        raise ValueError("LLM instance is required.")
+
+    logger.info("Handling general query (stream). prompt_length=%d", len(prompt.strip()))
+    try:
+        response_stream = await llm.astream_chat(messages)
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error("LLM call failed for general query: %s", e, exc_info=True)
+        raise RuntimeError(f"LLM call failed for general query: {e}") from e
+    return _timed_tokens(_chat_deltas(response_stream), "General query", "general_stream")
+
+
+async def astream_document_query(index, prompt, llm, reranker=None):
+    """
+    Starts a streamed document query. Retrieval and reranking complete before this
+    returns, so the sources are known up front; synthesis tokens are streamed after.
+
+    Args:
+        index (VectorStoreIndex): Vectorized form of the input document.
+        prompt (str): The question about the document.
+        llm (AzureAICompletionsModel): Azure AI completions client.
+        reranker (LLMRerank | None): Optional LLM-based reranker postprocessor.
+
+    Returns:
+        tuple[list[dict], AsyncGenerator[str]]: Source citations and the answer tokens.
+    """
+    _validate_document_query(index, prompt, llm)
 
-        return {"answer": response.response or "", "sources": sources}
+    logger.info("Handling document query (stream). prompt_length=%d", len(prompt.strip()))
+    try:
+        query_engine = _build_query_engine(index, llm, reranker, streaming=True)
+        response = await query_engine.aquery(prompt.strip())
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error("LLM call failed for document query: %s", e, exc_info=True)
         raise RuntimeError(f"LLM call failed for document query: {e}") from e
+    return _extract_sources(response), _timed_tokens(response.async_response_gen(), "Document query", "document_stream")
+
+
+async def acondense_question(prompt, history, llm):
+    """
+    Rewrites a follow-up question ("and what about page 4?") as a question that stands
+    on its own, so it can be retrieved, cached and coalesced like any other.
+
+    Args:
+        prompt (str): The follow-up question.
+        history (list[ChatMessage]): The conversation so far.
+        llm (AzureAICompletionsModel): Azure AI completions client.
+
+    Returns:
+        str: The standalone question; the question as asked if the LLM returns nothing.
+    """
+    if not prompt or not prompt.strip():
+        raise ValueError("Prompt cannot be empty.")
+    messages = [
+        ChatMessage(role="system", content=(
+            "Rewrite the user's follow-up question as a standalone question that can be understood "
+            "without the conversation. Keep its language. Reply with the question only."
+        )),
+        ChatMessage(role="user", content=f"Conversation:\n{_transcript(history)}\n\nFollow-up question: {prompt.strip()}"),
+    ]
+    try:
+        response = await llm.achat(messages)
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error("LLM call failed while condensing question: %s", e, exc_info=True)
+        raise RuntimeError(f"LLM call failed while condensing question: {e}") from e
+    return (response.message.content or "").strip() or prompt.strip()
+
+
+async def asummarize_conversation(summary, turns, llm, max_tokens):
+    """
+    Folds conversation turns into a session's rolling summary.
+
+    Args:
+        summary (str): The summary so far; empty for the first compaction.
+        turns (list[tuple[str, str]]): (question, answer) pairs to fold in, oldest first.
+        llm (AzureAICompletionsModel): Azure AI completions client.
+        max_tokens (int): Size the summary should stay under.
+
+    Returns:
+        str: The new summary.
+    """
+    transcript = "\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+    messages = [
+        ChatMessage(role="system", content=(
+            "You keep a running summary of a conversation between a user and an assistant. Merge the new "
+            "turns into the summary. Keep names, numbers, page references and open questions; drop "
+            f"pleasantries. Reply with the summary only, in at most {max_tokens * 3 // 4} words."
+        )),
+        ChatMessage(role="user", content=f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"),
+    ]
+    try:
+        response = await llm.achat(messages)
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"LLM call failed while summarizing conversation: {e}") from e
+    return (response.message.content or "").strip()
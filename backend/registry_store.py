@@ -0,0 +1,134 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class RegistryStore:
+    """
+    Document records, ingestion job states and chat sessions in a SQLite file shared by
+    every worker process, so an upload, clear, job update or conversation turn handled by
+    one worker is seen by the others.
+
+    Readers call `version()` (SQLite's data_version, which changes whenever another
+    connection commits) and only re-read the tables when it has changed.
+    """
+
+    def __init__(self, path: str, job_history_limit: int = 1000):
+        """
+        Args:
+            path: SQLite database file (":memory:" for a process-local registry).
+            job_history_limit: Number of most recent jobs kept.
+        """
+        self.path = path
+        self.job_history_limit = job_history_limit
+        self._lock = threading.Lock()
+        # Workers write concurrently; wait for the other writer instead of failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " document_id TEXT PRIMARY KEY, document_name TEXT NOT NULL, chunk_count INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, content_hash TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._conn.commit()
+
+    def version(self) -> int:
+        """Changes whenever another connection (worker) has committed a change."""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def documents(self) -> list[dict]:
+        """All document records, as DocumentRecord keyword arguments."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT document_id, document_name, chunk_count, created_at, content_hash FROM documents"
+            ).fetchall()
+        return [
+            dict(zip(("document_id", "document_name", "chunk_count", "created_at", "content_hash"), row))
+            for row in rows
+        ]
+
+    def put_document(self, record, replace: bool = True) -> bool:
+        """Stores a DocumentRecord; with replace=False an existing record is kept.
+
+        Returns:
+            True if the record was written.
+        """
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock:
+            cursor = self._conn.execute(
+                f"{verb} INTO documents (document_id, document_name, chunk_count, created_at, content_hash)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (record.document_id, record.document_name, record.chunk_count, record.created_at, record.content_hash),
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def delete_document(self, document_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+            self._conn.commit()
+
+    def put_job(self, job_id: str, state: dict) -> None:
+        """Stores a job's state; new jobs also trim the history to job_history_limit."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE job_id = ?",
+                (json.dumps(state), time.time(), job_id),
+            )
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, state, updated_at) VALUES (?, ?, ?)",
+                    (job_id, json.dumps(state), time.time()),
+                )
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE job_id NOT IN"
+                    " (SELECT job_id FROM jobs ORDER BY updated_at DESC, rowid DESC LIMIT ?)",
+                    (self.job_history_limit,),
+                )
+            self._conn.commit()
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def active_jobs(self) -> list[dict]:
+        """States of the jobs still queued or running, whichever worker recorded them."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state FROM jobs WHERE json_extract(state, '$.status') IN ('queued', 'running')"
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def put_session(self, session_id: str, state: dict, idle_ttl: float) -> None:
+        """Stores a chat session's state and deletes sessions idle for longer than idle_ttl."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), now),
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - idle_ttl,))
+            self._conn.commit()
+
+    def get_session(self, session_id: str, idle_ttl: float) -> dict | None:
+        """A chat session's state, unless it has been idle for longer than idle_ttl."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - idle_ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
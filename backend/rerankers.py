@@ -0,0 +1,140 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import numpy as np
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.llm_rerank import LLMRerank
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from bm25 import BM25Index
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+RERANKER_NAMES = ("llm", "bm25", "none")
+
+
+class ParallelLLMRerank(LLMRerank):
+    """
+    LLMRerank that sends every choice batch at once instead of one after another, so
+    reranking costs one LLM round-trip regardless of the number of batches.
+
+    A batch whose answer cannot be parsed is dropped rather than failing the query; if
+    no batch can be parsed, the retrieval order is kept.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ParallelLLMRerank"
+
+    def _predict_kwargs(self, nodes_batch, query_bundle):
+        return self._get_predict_kwargs(nodes_batch, query_bundle.query_str)
+
+    def _merge(self, nodes, raw_responses, node_batches) -> List[NodeWithScore]:
+        results: List[NodeWithScore] = []
+        for raw_response, nodes_batch in zip(raw_responses, node_batches):
+            try:
+                results.extend(self._parse_raw_response(raw_response, nodes_batch))
+            except (ValueError, IndexError) as e:
+                logger.warning("Could not parse reranker answer, skipping batch. error=%s", e)
+        if not results:
+            return nodes[:self.top_n]
+        return sorted(results, key=lambda x: x.score or 0.0, reverse=True)[:self.top_n]
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Query bundle must be provided.")
+        if not nodes:
+            return []
+        node_batches = self._get_node_batches(nodes)
+        with ThreadPoolExecutor(max_workers=len(node_batches), thread_name_prefix="rerank") as pool:
+            raw_responses = list(pool.map(
+                lambda batch: self.llm.predict(self.choice_select_prompt, **self._predict_kwargs(batch, query_bundle)),
+                node_batches,
+            ))
+        return self._merge(nodes, raw_responses, node_batches)
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Query bundle must be provided.")
+        if not nodes:
+            return []
+        node_batches = self._get_node_batches(nodes)
+        raw_responses = await asyncio.gather(*[
+            self.llm.apredict(self.choice_select_prompt, **self._predict_kwargs(batch, query_bundle))
+            for batch in node_batches
+        ])
+        return self._merge(nodes, raw_responses, node_batches)
+
+
+class BM25Rerank(BaseNodePostprocessor):
+    """
+    CPU-only reranker: scores the retrieved candidates with BM25 against the question
+    and blends that with the retrieval score. Takes well under a millisecond for the
+    ten candidates a query fetches, with no model or network call.
+    """
+
+    top_n: int = Field(default=3, description="Top N nodes to return.")
+    lexical_weight: float = Field(
+        default=0.6, description="Weight of the normalised BM25 score; the rest goes to the retrieval score."
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BM25Rerank"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Query bundle must be provided.")
+        if not nodes:
+            return []
+        lexical = BM25Index([node.node.get_content() for node in nodes]).scores(query_bundle.query_str)
+        retrieval = np.asarray([node.score or 0.0 for node in nodes], dtype=np.float32)
+        blended = self.lexical_weight * _min_max(lexical) + (1 - self.lexical_weight) * _min_max(retrieval)
+        # Stable sort keeps the retrieval order for ties
+        order = np.argsort(-blended, kind="stable")[:self.top_n]
+        return [NodeWithScore(node=nodes[i].node, score=float(blended[i])) for i in order]
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        # Cheaper to run inline than to hop to a worker thread
+        return self._postprocess_nodes(nodes, query_bundle)
+
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    spread = values.max() - values.min()
+    return (values - values.min()) / spread if spread > 0 else np.zeros_like(values)
+
+
+def build_rerankers(llm, top_n: int = 3, choice_batch_size: int = 5) -> dict:
+    """
+    Builds one instance of every reranker backend, keyed by name.
+
+    Args:
+        llm: LLM used by the "llm" backend.
+        top_n: Chunks each reranker keeps.
+        choice_batch_size: Chunks per LLM scoring prompt.
+
+    Returns:
+        dict: {"llm": ParallelLLMRerank, "bm25": BM25Rerank, "none": None}
+    """
+    return {
+        "llm": ParallelLLMRerank(llm=llm, choice_batch_size=choice_batch_size, top_n=top_n),
+        "bm25": BM25Rerank(top_n=top_n),
+        "none": None,
+    }
@@ -0,0 +1,322 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, List, TypeVar
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+from logging_config import get_logger
+from metrics import UPSTREAM_CIRCUIT_STATE, UPSTREAM_HEDGES, UPSTREAM_REJECTED
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class UpstreamUnavailable(RuntimeError):
+    """An Azure call was not attempted, or was cut short, to protect the request's latency."""
+
+    def __init__(self, message: str, client: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.client = client
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """The client's circuit breaker is open: the endpoint failed repeatedly and is not called."""
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """The request's time budget ran out before or during an Azure call."""
+
+
+# --- Circuit breaker ---
+
+class CircuitBreaker:
+    """
+    Fails calls fast while an endpoint is degraded.
+
+    Closed: calls pass, and `failure_threshold` consecutive failures open the circuit.
+    Open: calls raise CircuitOpenError for `reset_timeout` seconds. Half-open: one probe
+    call is let through; its success closes the circuit, its failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            name: Client name, used in logs, metrics and errors.
+            failure_threshold: Consecutive failures that open the circuit.
+            reset_timeout: Seconds the circuit stays open before a probe is let through.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+        UPSTREAM_CIRCUIT_STATE.labels(name).set(0)
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logger.warning("Circuit breaker changed state. client=%s state=%s failures=%d", self.name, state, self.failures)
+            self._state = state
+            UPSTREAM_CIRCUIT_STATE.labels(self.name).set(self._STATE_VALUES[state])
+
+    def check(self) -> None:
+        """Raises CircuitOpenError unless a call may be made now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            retry_after = self._opened_at + self.reset_timeout - time.monotonic()
+            if self._state == self.OPEN and retry_after <= 0:
+                self._set_state(self.HALF_OPEN)
+            # A probe that never reported back (e.g. a cancelled call) is replaced after reset_timeout
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN and (
+                self._probe_started is None or now - self._probe_started >= self.reset_timeout
+            ):
+                self._probe_started = now
+                return
+        UPSTREAM_REJECTED.labels(self.name, "circuit_open").inc()
+        raise CircuitOpenError(
+            f"The {self.name} endpoint is unavailable (circuit open).", self.name, max(retry_after, 1.0)
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_started = None
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_started = None
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+# --- Deadlines ---
+
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: float | None):
+    """Gives the Azure calls made in the block at most `seconds` in total (None: no limit).
+    A nested deadline never extends the enclosing one."""
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> float | None:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def call_timeout(limit: float, client: str) -> float:
+    """The timeout for one call: `limit`, shortened to the request's remaining budget.
+
+    Raises:
+        DeadlineExceeded: The budget is already spent.
+    """
+    remaining = remaining_budget()
+    if remaining is None:
+        return limit
+    if remaining <= 0:
+        UPSTREAM_REJECTED.labels(client, "deadline").inc()
+        raise DeadlineExceeded(f"The request's deadline passed before the {client} call.", client)
+    return min(limit, remaining)
+
+
+# --- Hedging ---
+
+class HedgePolicy:
+    """
+    Decides when to send a duplicate of a slow call: after the `quantile` of recent
+    latencies (clamped to [min_delay, max_delay]), once `min_samples` are known. Each
+    call earns `max_ratio` of a hedge, so at most that fraction of calls is duplicated.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        quantile: float = 0.95,
+        min_delay: float = 0.05,
+        max_delay: float = 2.0,
+        min_samples: int = 20,
+        window: int = 200,
+        max_ratio: float = 0.1,
+    ):
+        self.name = name
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self._latencies = deque(maxlen=window)
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self) -> float | None:
+        """Seconds to wait before hedging the next call, or None to send it only once."""
+        with self._lock:
+            self._tokens = min(self._tokens + self.max_ratio, 10.0)
+            if len(self._latencies) < self.min_samples or self._tokens < 1.0:
+                return None
+            return min(max(float(np.quantile(self._latencies, self.quantile)), self.min_delay), self.max_delay)
+
+    def _spend(self) -> None:
+        with self._lock:
+            self._tokens -= 1.0
+        UPSTREAM_HEDGES.labels(self.name, "sent").inc()
+
+    async def arun(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Awaits call(), starting a second call() if the first is slower than delay();
+        returns whichever succeeds first and cancels the other."""
+
+        async def timed():
+            start = time.perf_counter()
+            result = await call()
+            self.observe(time.perf_counter() - start)
+            return result
+
+        delay = self.delay()
+        primary = asyncio.ensure_future(timed())
+        tasks = [primary]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self._spend()
+                    tasks.append(asyncio.ensure_future(timed()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            UPSTREAM_HEDGES.labels(self.name, "won").inc()
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+    def run(self, call: Callable[[], T]) -> T:
+        """Synchronous arun(): call() runs on a small shared pool; a losing call is left
+        to finish in the background."""
+
+        def timed():
+            start = time.perf_counter()
+            result = call()
+            self.observe(time.perf_counter() - start)
+            return result
+
+        delay = self.delay()
+        # The deadline (a context variable) must reach the pool threads
+        primary = _hedge_pool().submit(contextvars.copy_context().run, timed)
+        futures = [primary]
+        if delay is not None:
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                self._spend()
+                futures.append(_hedge_pool().submit(contextvars.copy_context().run, timed))
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        UPSTREAM_HEDGES.labels(self.name, "won").inc()
+                    return future.result()
+        return primary.result()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+        return _pool
+
+
+class HedgedEmbeddingModel(BaseEmbedding):
+    """
+    Wraps an embedding model so that query embeddings, which a user waits on, are hedged
+    with a HedgePolicy. Text batches (ingestion) are passed through unchanged: they are
+    retried by ingestion instead, and duplicating them would double the embedding bill.
+    """
+
+    _model: BaseEmbedding = PrivateAttr()
+    _hedge: HedgePolicy = PrivateAttr()
+
+    def __init__(self, model: BaseEmbedding, hedge: HedgePolicy, **kwargs: Any):
+        super().__init__(
+            model_name=model.model_name,
+            embed_batch_size=model.embed_batch_size,
+            **kwargs,
+        )
+        self._model = model
+        self._hedge = hedge
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HedgedEmbeddingModel"
+
+    @property
+    def hedge(self) -> HedgePolicy:
+        return self._hedge
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._hedge.run(lambda: self._model.get_query_embedding(query))
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._hedge.arun(lambda: self._model.aget_query_embedding(query))
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._model.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await self._model.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._model.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._model.aget_text_embedding_batch(texts)
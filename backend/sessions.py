@@ -0,0 +1,251 @@
+import asyncio
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable
+from llama_index.core.llms import ChatMessage
+from llama_index.core.utils import get_tokenizer
+from logging_config import get_logger
+from metrics import SESSION_COMPACTIONS
+
+logger = get_logger(__name__)
+
+# A session sends at most SESSION_TOKEN_BUDGET tokens of history with a question:
+# SESSION_SUMMARY_TOKENS for the rolling summary of older turns, the rest for the most
+# recent turns verbatim. Each worker keeps up to SESSION_MAX_COUNT sessions in memory;
+# one unused for SESSION_IDLE_TTL_S is dropped here and in the shared registry.
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "1500"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "300"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+SESSION_IDLE_TTL_S = float(os.getenv("SESSION_IDLE_TTL_S", "1800"))
+
+SESSION_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+_SESSION_ID = re.compile(SESSION_ID_PATTERN)
+
+# summarize(summary, [(question, answer), ...], max_tokens) -> new summary
+Summarizer = Callable[[str, list[tuple[str, str]], int], Awaitable[str]]
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens, in proportion to its length."""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[:len(text) * max_tokens // tokens].rstrip()
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    tokens: int
+
+
+@dataclass
+class ChatSession:
+    """
+    One conversation: a rolling summary of its older turns, the recent turns verbatim,
+    and the turns moved out of the recent window but not yet folded into the summary.
+    """
+
+    session_id: str
+    summary: str = ""
+    turns: list[Turn] = field(default_factory=list)
+    pending: list[Turn] = field(default_factory=list)
+    # Incremented on every change; a worker reloads a session whose shared copy is newer
+    revision: int = 0
+    last_used: float = field(default_factory=time.monotonic, compare=False)
+    compacting: bool = field(default=False, compare=False)
+
+    def history(self) -> list[ChatMessage]:
+        """The summary and recent turns as chat messages, oldest first. Pending turns are
+        left out until they are in the summary, so the history never exceeds the budget."""
+        messages = []
+        if self.summary:
+            messages.append(ChatMessage(role="system", content=f"Summary of the conversation so far: {self.summary}"))
+        for turn in self.turns:
+            messages.append(ChatMessage(role="user", content=turn.question))
+            messages.append(ChatMessage(role="assistant", content=turn.answer))
+        return messages
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "summary": self.summary,
+            "turns": [asdict(turn) for turn in self.turns],
+            "pending": [asdict(turn) for turn in self.pending],
+            "revision": self.revision,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "ChatSession":
+        return cls(
+            session_id=state["session_id"],
+            summary=state["summary"],
+            turns=[Turn(**turn) for turn in state["turns"]],
+            pending=[Turn(**turn) for turn in state["pending"]],
+            revision=state["revision"],
+        )
+
+
+class SessionStore:
+    """
+    Server-side chat sessions in an LRU with idle eviction, so memory stays flat however
+    long or many the conversations are.
+
+    Each new turn is appended verbatim. Once the recent turns exceed their share of the
+    token budget, the oldest are folded into the session's summary by a background task,
+    after the answer has been returned. A failed summary is retried after the next turn;
+    turns waiting for one are dropped, oldest first, beyond the token budget.
+
+    With a shared `store`, sessions are written through to it and reloaded from it when
+    another worker has a newer revision, so a conversation can move between workers.
+    """
+
+    def __init__(
+        self,
+        summarize: Summarizer | None = None,
+        token_budget: int = SESSION_TOKEN_BUDGET,
+        summary_tokens: int = SESSION_SUMMARY_TOKENS,
+        max_sessions: int = SESSION_MAX_COUNT,
+        idle_ttl: float = SESSION_IDLE_TTL_S,
+        store=None,
+    ):
+        """
+        Args:
+            summarize: Folds turns into a summary; without it, older turns are dropped.
+            token_budget: Most history tokens sent with a question.
+            summary_tokens: Part of the budget kept for the summary.
+            max_sessions: Sessions kept in memory; least recently used are evicted.
+            idle_ttl: Seconds after which an unused session is dropped.
+            store: Optional RegistryStore shared with the other workers.
+        """
+        self._summarize = summarize
+        self._store = store
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.hits = 0
+        self.misses = 0
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self._compactions: set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    async def get(self, session_id: str) -> ChatSession:
+        """Returns a session, starting an empty one under that ID if it is unknown or expired.
+
+        Raises:
+            ValueError: The ID is not 1-64 letters, digits, "-" or "_".
+        """
+        if not _SESSION_ID.match(session_id):
+            raise ValueError("session_id must be 1-64 letters, digits, '-' or '_'.")
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id)
+        if self._store is not None:
+            shared = await asyncio.to_thread(self._store.get_session, session_id, self.idle_ttl)
+            if shared is not None and (session is None or shared["revision"] > session.revision):
+                session = ChatSession.from_dict(shared)
+        with self._lock:
+            if session is None:
+                self.misses += 1
+                session = ChatSession(session_id)
+            else:
+                self.hits += 1
+            session.last_used = now
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+        return session
+
+    async def record(self, session: ChatSession, question: str, answer: str) -> None:
+        """Appends a finished turn and starts folding older turns into the summary if the
+        recent ones no longer fit."""
+        recent_budget = self.token_budget - self.summary_tokens
+        # A single turn larger than the window is kept, with its answer cut to fit
+        answer = _truncate(answer, max(recent_budget - count_tokens(question), 0))
+        session.turns.append(Turn(question, answer, count_tokens(question) + count_tokens(answer)))
+        while len(session.turns) > 1 and sum(turn.tokens for turn in session.turns) > recent_budget:
+            session.pending.append(session.turns.pop(0))
+        dropped = 0
+        while session.pending and (
+            self._summarize is None or sum(turn.tokens for turn in session.pending) > self.token_budget
+        ):
+            session.pending.pop(0)
+            dropped += 1
+        if dropped and self._summarize is not None:
+            logger.warning("Dropped turns still waiting for a summary. session_id=%s turns=%d", session.session_id, dropped)
+        session.revision += 1
+        await self._save(session)
+        if session.pending and not session.compacting:
+            session.compacting = True
+            # Own context: not bound by the request's deadline, nor counted in its timings
+            task = asyncio.get_running_loop().create_task(self._compact(session), context=contextvars.Context())
+            self._compactions.add(task)
+            task.add_done_callback(self._compactions.discard)
+
+    async def drain(self) -> None:
+        """Waits for the summaries being written."""
+        while self._compactions:
+            await asyncio.gather(*self._compactions, return_exceptions=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._sessions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "compacting": len(self._compactions),
+            }
+
+    async def _compact(self, session: ChatSession) -> None:
+        try:
+            while session.pending:
+                batch, summary = list(session.pending), session.summary
+                try:
+                    new_summary = await self._summarize(
+                        summary, [(turn.question, turn.answer) for turn in batch], self.summary_tokens
+                    )
+                except Exception as e:
+                    SESSION_COMPACTIONS.labels("failed").inc()
+                    logger.warning("Could not summarize conversation. session_id=%s error=%s", session.session_id, e)
+                    return
+                with self._lock:
+                    current = self._sessions.get(session.session_id)
+                if current is not session or session.summary != summary or session.pending[:len(batch)] != batch:
+                    # Evicted, or reloaded with another worker's newer turns or summary
+                    SESSION_COMPACTIONS.labels("superseded").inc()
+                    return
+                session.summary = _truncate(new_summary, self.summary_tokens)
+                del session.pending[:len(batch)]
+                session.revision += 1
+                await self._save(session)
+                SESSION_COMPACTIONS.labels("done").inc()
+                logger.info(
+                    "Conversation summarized. session_id=%s turns=%d summary_tokens=%d",
+                    session.session_id, len(batch), count_tokens(session.summary),
+                )
+        finally:
+            session.compacting = False
+
+    async def _save(self, session: ChatSession) -> None:
+        if self._store is not None:
+            await asyncio.to_thread(self._store.put_session, session.session_id, session.to_dict(), self.idle_ttl)
+
+    def _evict(self, now: float) -> None:
+        """Drops idle sessions and, beyond max_sessions, the least recently used ones."""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - session.last_used <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+from logging_config import get_logger
+from metrics import COALESCED_REQUESTS
+
+logger = get_logger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent computations: while one is in flight for a key, later
+    callers with the same key await it instead of starting their own, and every caller
+    gets its result (or its exception).
+
+    The computation runs as its own task, so a caller that goes away (a client
+    disconnecting) cancels only its own wait, never the answer the others are waiting
+    for. It runs in the context of the first caller, whose request ID and stage timings
+    it reports under. Keys are per process and per event loop.
+    """
+
+    def __init__(self, operation: str):
+        """
+        Args:
+            operation: Label of the coalesced requests on /metrics.
+        """
+        self.operation = operation
+        self.computed = 0
+        self.coalesced = 0
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns compute()'s result, sharing the computation already in flight for `key`."""
+        task = self._in_flight.get(key)
+        if task is None:
+            self.computed += 1
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+            COALESCED_REQUESTS.labels(self.operation).inc()
+            logger.info("Joined an identical request in flight. operation=%s", self.operation)
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Retrieved here too, so a failure nobody waited for is not reported as unhandled
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"computed": self.computed, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
@@ -1,21 +1,57 @@
 import os
 import sys
+import pytest
 from unittest.mock import MagicMock, patch
 
-# Must be set before any backend module is imported — chat.py validates these at import time
+# Must be set before any backend module is imported — chat.py reads these at import time
 os.environ.setdefault("AZURE_META_API", "test-meta-api-key")
 os.environ.setdefault("AZURE_META_ENDPOINT", "https://test-meta-endpoint.azure.com")
 os.environ.setdefault("AZURE_COHERE_API", "test-cohere-api-key")
 os.environ.setdefault("AZURE_COHERE_ENDPOINT", "https://test-cohere-endpoint.azure.com")
+# Job states go to a process-local registry instead of ./registry.sqlite3
+os.environ.setdefault("REGISTRY_DB_PATH", ":memory:")
 
 # Add the backend directory to sys.path so test files can import backend modules
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
-# Pre-import main with mocked LLM and LLMRerank to prevent Azure HTTP calls at module level.
-# - initialize_llm is mocked so main.llm is a MagicMock (no real Azure client calls)
-# - LLMRerank is mocked so pydantic never validates the mock LLM against the LLM base class,
-#   and no llm.metadata access happens during init
-_mock_llm = MagicMock()
-with patch("chat.initialize_llm", return_value=_mock_llm), \
-     patch("llama_index.core.postprocessor.LLMRerank"):
-    import main  # noqa: E402
+import main  # noqa: E402
+from index_registry import IndexRegistry, DocumentRecord  # noqa: E402
+from answer_cache import AnswerCache  # noqa: E402
+
+
+@pytest.fixture(autouse=True, scope="session")
+def offline_clients():
+    """Create main's lazily built LLM and rerankers up front, offline: the LLM is a MagicMock
+    and ParallelLLMRerank is mocked so pydantic never validates it and llm.metadata is never
+    probed."""
+    with patch("main.initialize_llm", return_value=MagicMock()), \
+         patch("rerankers.ParallelLLMRerank"):
+        main.get_rerankers()
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    """Give every test an empty document registry whose loader never touches Chroma, and an
+    empty exact-match answer cache (semantic matching would call the embedding model)."""
+    original = main.index_registry
+    main.index_registry = IndexRegistry(loader=MagicMock(return_value=MagicMock()))
+    with patch("main.describe_document_collection", return_value=None), \
+         patch("main.answer_cache", AnswerCache()):
+        yield main.index_registry
+    main.index_registry = original
+
+
+@pytest.fixture(autouse=True)
+def numpy_store_dir(tmp_path, monkeypatch):
+    """Keep NumPy vector stores written by tests out of the working directory."""
+    path = str(tmp_path / "vector_store")
+    monkeypatch.setattr("chat.NUMPY_STORE_DIR", path)
+    return path
+
+
+@pytest.fixture
+def loaded_index(registry):
+    """Register 'report.pdf' as document 'doc1' and return its mock index."""
+    index = MagicMock()
+    registry.register(DocumentRecord(document_id="doc1", document_name="report.pdf"), index=index)
+    return index
@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+import httpx
+from fastapi import FastAPI
+from admission import AdmissionMiddleware, AdmissionRejected, ConcurrencyLimiter
+
+
+class TestConcurrencyLimiter:
+    def test_queues_in_order_then_rejects_when_full(self):
+        limiter = ConcurrencyLimiter("test", max_concurrent=1, max_queue=2, queue_timeout=5)
+        order = []
+
+        async def request(name):
+            async with limiter.slot():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            tasks = [asyncio.ensure_future(request(name)) for name in "abc"]
+            await asyncio.sleep(0)
+            assert (limiter.active, limiter.queued) == (1, 2)
+            with pytest.raises(AdmissionRejected) as error:
+                await limiter.acquire()
+            await asyncio.gather(*tasks)
+            return error.value
+
+        error = asyncio.run(run())
+        assert error.reason == "queue_full"
+        assert error.retry_after >= 1
+        assert order == ["a", "b", "c"]
+        assert (limiter.active, limiter.queued) == (0, 0)
+
+    def test_wait_longer_than_the_timeout_is_rejected(self):
+        limiter = ConcurrencyLimiter("test", max_concurrent=1, max_queue=5, queue_timeout=0.02)
+
+        async def run():
+            await limiter.acquire()
+            with pytest.raises(AdmissionRejected) as error:
+                await limiter.acquire()
+            limiter.release()
+            return error.value
+
+        assert asyncio.run(run()).reason == "queue_timeout"
+        assert (limiter.active, limiter.queued) == (0, 0)
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        limiter = ConcurrencyLimiter("test", max_concurrent=1, max_queue=5, queue_timeout=5)
+
+        async def run():
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert limiter.queued == 0
+            limiter.release()
+
+        asyncio.run(run())
+        assert limiter.active == 0
+
+
+class TestAdmissionMiddleware:
+    def _app(self, gate):
+        app = FastAPI()
+        limiters = {
+            "rag": ConcurrencyLimiter("rag", max_concurrent=1, max_queue=0, queue_timeout=1),
+            "general": ConcurrencyLimiter("general", max_concurrent=1, max_queue=0, queue_timeout=1),
+        }
+        app.add_middleware(AdmissionMiddleware, limiters=limiters, routes={"/rag": "rag", "/general": "general"})
+
+        @app.get("/rag")
+        async def rag():
+            await gate.wait()
+            return {"ok": True}
+
+        @app.get("/general")
+        async def general():
+            return {"ok": True}
+
+        @app.get("/status")
+        async def status():
+            return {"ok": True}
+
+        return app
+
+    def test_full_class_answers_429_while_other_classes_pass(self):
+        async def run():
+            gate = asyncio.Event()
+            transport = httpx.ASGITransport(app=self._app(gate))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                slow = asyncio.ensure_future(client.get("/rag"))
+                await asyncio.sleep(0.05)
+                rejected = await client.get("/rag")
+                general = await client.get("/general")
+                status = await client.get("/status")
+                gate.set()
+                return rejected, general, status, await slow
+
+        rejected, general, status, slow = asyncio.run(run())
+        assert rejected.status_code == 429
+        assert int(rejected.headers["retry-after"]) >= 1
+        assert "busy" in rejected.json()["detail"]
+        assert general.status_code == status.status_code == slow.status_code == 200
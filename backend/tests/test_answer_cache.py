@@ -0,0 +1,77 @@
+from unittest.mock import patch
+from answer_cache import AnswerCache, normalize_question
+
+
+class TestNormalizeQuestion:
+    def test_case_punctuation_and_spacing_are_ignored(self):
+        assert normalize_question("  What is the REFUND policy?? ") == normalize_question("what is the refund policy")
+
+    def test_different_questions_stay_different(self):
+        assert normalize_question("refund policy") != normalize_question("return policy")
+
+
+class TestExactMatching:
+    def test_hit_after_put(self):
+        cache = AnswerCache()
+        cache.put("doc", "What is the refund policy?", "30 days")
+        assert cache.get("doc", "what is the refund policy") == "30 days"
+        assert cache.stats()["hits"] == 1
+
+    def test_namespaces_are_isolated(self):
+        cache = AnswerCache()
+        cache.put("document:a:v1", "Q?", "A")
+        assert cache.get("document:a:v2", "Q?") is None
+        assert cache.stats()["misses"] == 1
+
+    def test_expired_answers_are_dropped(self):
+        cache = AnswerCache(ttl_seconds=10)
+        with patch("answer_cache.time.monotonic", return_value=100.0):
+            cache.put("doc", "Q?", "A")
+        with patch("answer_cache.time.monotonic", return_value=111.0):
+            assert cache.get("doc", "Q?") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = AnswerCache(max_entries=2)
+        cache.put("doc", "first", "1")
+        cache.put("doc", "second", "2")
+        cache.get("doc", "first")
+        cache.put("doc", "third", "3")
+        assert cache.get("doc", "second") is None
+        assert cache.get("doc", "first") == "1"
+
+    def test_zero_capacity_disables_caching(self):
+        cache = AnswerCache(max_entries=0)
+        cache.put("doc", "Q?", "A")
+        assert cache.get("doc", "Q?") is None
+
+    def test_invalidate_drops_matching_namespaces(self):
+        cache = AnswerCache()
+        cache.put("document:a:v1", "Q?", "A")
+        cache.put("document:b:v1", "Q?", "B")
+        assert cache.invalidate("document:a:") == 1
+        assert cache.get("document:a:v1", "Q?") is None
+        assert cache.get("document:b:v1", "Q?") == "B"
+
+
+class TestSemanticMatching:
+    def test_similar_question_reuses_answer(self):
+        cache = AnswerCache(semantic_threshold=0.9)
+        cache.put("doc", "What is the refund policy?", "30 days", embedding=[1.0, 0.0, 0.1])
+        assert cache.get("doc", "What's the refund policy", embedding=[1.0, 0.05, 0.1]) == "30 days"
+        assert cache.stats()["semantic_hits"] == 1
+
+    def test_dissimilar_question_misses(self):
+        cache = AnswerCache(semantic_threshold=0.9)
+        cache.put("doc", "What is the refund policy?", "30 days", embedding=[1.0, 0.0, 0.0])
+        assert cache.get("doc", "Who wrote this?", embedding=[0.0, 1.0, 0.0]) is None
+
+    def test_semantic_match_stays_in_namespace(self):
+        cache = AnswerCache(semantic_threshold=0.9)
+        cache.put("document:a:v1", "Q one", "A", embedding=[1.0, 0.0])
+        assert cache.get("document:b:v1", "Q two", embedding=[1.0, 0.0]) is None
+
+    def test_exact_mode_ignores_embeddings(self):
+        cache = AnswerCache()
+        cache.put("doc", "Q one", "A", embedding=[1.0, 0.0])
+        assert cache.get("doc", "Q two", embedding=[1.0, 0.0]) is None
@@ -1,6 +1,12 @@
+import os
+import asyncio
+import json
+import time
+import httpx
 import pytest
 from unittest.mock import MagicMock, patch
 from fastapi.testclient import TestClient
+from index_registry import DocumentRecord
 
 
 @pytest.fixture
@@ -9,34 +15,48 @@ def client():
     return TestClient(main.app)
 
 
-@pytest.fixture(autouse=True)
-def reset_global_state():
-    """Reset global index and document name before and after every test."""
+def _upload_and_wait(client, filename, content, content_type="text/plain"):
+    """Uploads a file and waits for its background ingestion job to finish."""
     import main
-    main.global_index = None
-    main.global_document_name = None
-    yield
-    main.global_index = None
-    main.global_document_name = None
+    response = client.post("/upload-document/", files={"file": (filename, content, content_type)})
+    if response.status_code == 202:
+        main.job_manager.wait(response.json()["job_id"], timeout=5)
+    return response
 
 
 class TestUploadDocument:
-    def test_valid_txt_file_returns_200(self, client):
-        with patch("main.create_index_from_document"):
-            response = client.post(
-                "/upload-document/",
-                files={"file": ("test.txt", b"This is a test document.", "text/plain")}
-            )
-        assert response.status_code == 200
-        assert "uploaded and processed successfully" in response.json()["message"]
+    def test_valid_txt_file_returns_202_with_job(self, client):
+        with patch("main.create_index_from_document", return_value="abc123"):
+            response = _upload_and_wait(client, "test.txt", b"This is a test document.")
+            job = client.get(f"/jobs/{response.json()['job_id']}").json()
+        assert response.status_code == 202
+        assert "processing has started" in response.json()["message"]
+        assert job["status"] == "completed"
+        assert job["document_id"] == "abc123"
 
-    def test_valid_pdf_file_returns_200(self, client):
-        with patch("main.create_index_from_document"):
-            response = client.post(
-                "/upload-document/",
-                files={"file": ("report.pdf", b"%PDF-1.4 fake content", "application/pdf")}
-            )
-        assert response.status_code == 200
+    def test_original_filename_is_passed_to_indexing(self, client):
+        with patch("main.create_index_from_document", return_value="abc123") as mock_create:
+            _upload_and_wait(client, "manual.txt", b"This is a test document.")
+        assert mock_create.call_args[0][1] == "manual.txt"
+
+    def test_temp_file_is_removed_after_ingestion(self, client):
+        with patch("main.create_index_from_document", return_value="abc123") as mock_create:
+            _upload_and_wait(client, "manual.txt", b"This is a test document.")
+        assert not os.path.exists(mock_create.call_args[0][0])
+
+    def test_failed_ingestion_is_reported_on_job(self, client):
+        from fastapi import HTTPException
+        error = HTTPException(status_code=422, detail="Cannot create index: document list is empty.")
+        with patch("main.create_index_from_document", side_effect=error):
+            response = _upload_and_wait(client, "empty.txt", b" ")
+            job = client.get(f"/jobs/{response.json()['job_id']}").json()
+        assert job["status"] == "failed"
+        assert "document list is empty" in job["error"]
+
+    def test_valid_pdf_file_returns_202(self, client):
+        with patch("main.create_index_from_document", return_value="abc123"):
+            response = _upload_and_wait(client, "report.pdf", b"%PDF-1.4 fake content", "application/pdf")
+        assert response.status_code == 202
 
     def test_unsupported_file_type_returns_400(self, client):
         response = client.post(
@@ -47,22 +67,98 @@ class TestUploadDocument:
         assert "Unsupported file type" in response.json()["detail"]
 
     def test_oversized_file_returns_413(self, client):
-        large_content = b"x" * (5 * 1024 * 1024 + 1)  # 1 byte over 5MB
-        response = client.post(
-            "/upload-document/",
-            files={"file": ("big.txt", large_content, "text/plain")}
-        )
-        assert response.status_code == 413
-        assert "5MB limit" in response.json()["detail"]
-
-    def test_file_at_exact_size_limit_is_accepted(self, client):
-        exact_content = b"x" * (5 * 1024 * 1024)  # exactly 5MB
-        with patch("main.create_index_from_document"):
+        with patch("main.MAX_FILE_SIZE_BYTES", 3 * 1024), patch("main.MAX_UPLOAD_MB", 0):
             response = client.post(
                 "/upload-document/",
-                files={"file": ("exact.txt", exact_content, "text/plain")}
+                files={"file": ("big.txt", b"x" * (3 * 1024 + 1), "text/plain")}
             )
-        assert response.status_code == 200
+        assert response.status_code == 413
+        assert "limit" in response.json()["detail"]
+
+    def test_oversized_upload_leaves_no_temp_file(self, client, tmp_path):
+        with patch("main.MAX_FILE_SIZE_BYTES", 1024), patch("tempfile.tempdir", str(tmp_path)):
+            client.post("/upload-document/", files={"file": ("big.txt", b"x" * 4096, "text/plain")})
+        assert list(tmp_path.iterdir()) == []
+
+    def test_file_at_exact_size_limit_is_accepted(self, client):
+        with patch("main.MAX_FILE_SIZE_BYTES", 3 * 1024), \
+             patch("main.create_index_from_document", return_value="abc123"):
+            response = _upload_and_wait(client, "exact.txt", b"x" * (3 * 1024))
+        assert response.status_code == 202
+
+    def test_default_limit_allows_large_manuals(self):
+        import main
+        assert main.MAX_FILE_SIZE_BYTES >= 100 * 1024 * 1024
+
+    def test_content_hash_is_computed_while_streaming(self, client):
+        import hashlib
+        content = b"Refund policy: 30 days." * 1000
+        with patch("main.create_index_from_document", return_value="abc123") as mock_create:
+            _upload_and_wait(client, "policy.txt", content)
+        assert mock_create.call_args[0][2] == hashlib.sha256(content).hexdigest()
+
+    def test_file_is_written_in_batches_off_the_event_loop(self, client):
+        import threading
+        import main
+        content = bytes(range(256)) * 64
+        receiving, writing, stored = set(), set(), []
+        on_part_data, write = main._UploadedFile._on_part_data, main._UploadedFile.write
+
+        def record_part_data(self, *args):
+            receiving.add(threading.current_thread().name)
+            on_part_data(self, *args)
+
+        def record_write(self, data):
+            writing.add(threading.current_thread().name)
+            write(self, data)
+
+        def ingest(path, *args, **kwargs):
+            with open(path, "rb") as f:
+                stored.append(f.read())
+            return "abc123"
+
+        with patch("main.UPLOAD_WRITE_BUFFER_BYTES", 1024), \
+             patch.object(main._UploadedFile, "_on_part_data", record_part_data), \
+             patch.object(main._UploadedFile, "write", record_write), \
+             patch("main.create_index_from_document", side_effect=ingest):
+            response = _upload_and_wait(client, "manual.txt", content)
+        assert response.status_code == 202
+        assert stored == [content]
+        assert receiving and writing and not receiving & writing
+
+    def test_declared_oversized_body_is_rejected_before_it_is_read(self):
+        import main
+        from fastapi import HTTPException
+        from starlette.requests import Request
+
+        async def receive():
+            raise AssertionError("the body must not be read")
+
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "headers": [
+                (b"content-type", b"multipart/form-data; boundary=xyz"),
+                (b"content-length", str(main.MAX_FILE_SIZE_BYTES + main.MULTIPART_OVERHEAD_BYTES + 1).encode()),
+            ],
+        }
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(main.receive_upload(Request(scope, receive)))
+        assert excinfo.value.status_code == 413
+
+    def test_upload_without_file_field_returns_422(self, client):
+        response = client.post("/upload-document/", files={"notes": ("a.txt", b"text", "text/plain")})
+        assert response.status_code == 422
+
+    def test_non_multipart_body_returns_400(self, client):
+        response = client.post("/upload-document/", content=b"raw", headers={"Content-Type": "text/plain"})
+        assert response.status_code == 400
+
+
+class TestJobStatus:
+    def test_unknown_job_returns_404(self, client):
+        response = client.get("/jobs/missing")
+        assert response.status_code == 404
 
 
 class TestDocumentQuery:
@@ -79,18 +175,48 @@ class TestDocumentQuery:
         response = client.post("/document-query/")
         assert response.status_code == 422
 
-    def test_valid_question_with_document_returns_answer(self, client):
-        import main
-        main.global_index = MagicMock()
-        with patch("main.handle_document_query", return_value={"answer": "The answer", "sources": []}):
+    def test_valid_question_with_document_returns_answer(self, client, loaded_index):
+        with patch("main.ahandle_document_query", return_value={"answer": "The answer", "sources": []}):
             response = client.post("/document-query/", params={"question": "What is this about?"})
         assert response.status_code == 200
         assert response.json()["answer"] == "The answer"
 
+    def test_document_id_selects_the_queried_index(self, client, registry, loaded_index):
+        other_index = MagicMock()
+        registry.register(DocumentRecord(document_id="doc2", document_name="other.pdf"), index=other_index)
+        with patch("main.ahandle_document_query", return_value={"answer": "A", "sources": []}) as mock_query:
+            client.post("/document-query/", params={"question": "Q?", "document_id": "doc1"})
+        assert mock_query.call_args[0][0] is loaded_index
+
+    def test_unknown_document_id_returns_404(self, client, loaded_index):
+        response = client.post("/document-query/", params={"question": "Q?", "document_id": "missing"})
+        assert response.status_code == 404
+
+    def test_reranker_is_selected_per_request(self, client, loaded_index):
+        import main
+        with patch("main.ahandle_document_query", return_value={"answer": "A", "sources": []}) as mock_query:
+            client.post("/document-query/", params={"question": "Q?", "reranker": "bm25"})
+            client.post("/document-query/", params={"question": "Q?", "reranker": "none"})
+            client.post("/document-query/", params={"question": "Q?"})
+        used = [call.args[3] for call in mock_query.call_args_list]
+        assert used == [main.get_rerankers()["bm25"], None, main.get_rerankers()[main.DEFAULT_RERANKER]]
+
+    def test_unknown_reranker_returns_422(self, client, loaded_index):
+        response = client.post("/document-query/", params={"question": "Q?", "reranker": "magic"})
+        assert response.status_code == 422
+        assert "llm, bm25, none" in response.json()["detail"]
+
+    def test_timings_are_returned_on_request(self, client, loaded_index):
+        with patch("main.ahandle_document_query", return_value={"answer": "A", "sources": []}):
+            plain = client.post("/document-query/", params={"question": "Q?"}).json()
+            timed = client.post("/document-query/", params={"question": "Other Q?", "timings": "true"}).json()
+        assert "timings" not in plain
+        assert {"cache_lookup_ms", "index_load_ms", "total_ms"} <= set(timed["timings"])
+
 
 class TestGeneralQuery:
     def test_valid_question_returns_answer(self, client):
-        with patch("main.handle_general_query", return_value="General answer"):
+        with patch("main.ahandle_general_query", return_value="General answer"):
             response = client.post("/general-query/", params={"question": "What is Python?"})
         assert response.status_code == 200
         assert response.json()["answer"] == "General answer"
@@ -104,6 +230,177 @@ class TestGeneralQuery:
         assert response.status_code == 422
 
 
+async def _tokens(*tokens):
+    for token in tokens:
+        yield token
+
+
+async def _failing_tokens():
+    yield "partial"
+    raise RuntimeError("stream dropped")
+
+
+def _events(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+class TestStreamingQueries:
+    def test_general_stream_sends_sources_then_tokens(self, client):
+        with patch("main.astream_general_query", return_value=_tokens("Hel", "lo")):
+            response = client.post("/general-query/stream/", params={"question": "Hi?"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert _events(response) == [
+            {"type": "sources", "sources": []},
+            {"type": "token", "content": "Hel"},
+            {"type": "token", "content": "lo"},
+            {"type": "done"},
+        ]
+
+    def test_document_stream_sends_sources_first(self, client, loaded_index):
+        sources = [{"page": "2", "preview": "Refunds are issued"}]
+        with patch("main.astream_document_query", return_value=(sources, _tokens("Within", " 30 days"))):
+            response = client.post("/document-query/stream/", params={"question": "Refunds?"})
+        events = _events(response)
+        assert events[0] == {"type": "sources", "sources": sources}
+        assert [e["content"] for e in events if e["type"] == "token"] == ["Within", " 30 days"]
+        assert events[-1] == {"type": "done"}
+
+    def test_repeated_stream_is_replayed_from_cache(self, client, loaded_index):
+        sources = [{"page": "2", "preview": "Refunds are issued"}]
+        with patch("main.astream_document_query", return_value=(sources, _tokens("Within", " 30 days"))) as mock:
+            client.post("/document-query/stream/", params={"question": "Refunds?"})
+            response = client.post("/document-query/stream/", params={"question": "refunds"})
+        mock.assert_called_once()
+        events = _events(response)
+        assert events[0] == {"type": "sources", "sources": sources}
+        assert [e["content"] for e in events if e["type"] == "token"] == ["Within 30 days"]
+
+    def test_failed_stream_is_not_cached(self, client):
+        with patch("main.astream_general_query", side_effect=[_failing_tokens(), _tokens("Hi")]) as mock:
+            client.post("/general-query/stream/", params={"question": "Hi?"})
+            client.post("/general-query/stream/", params={"question": "Hi?"})
+        assert mock.call_count == 2
+
+    def test_document_stream_without_document_returns_400(self, client):
+        response = client.post("/document-query/stream/", params={"question": "Refunds?"})
+        assert response.status_code == 400
+
+    def test_blank_question_returns_422(self, client):
+        response = client.post("/general-query/stream/", params={"question": "   "})
+        assert response.status_code == 422
+
+    def test_error_mid_stream_is_reported_as_event(self, client):
+        with patch("main.astream_general_query", return_value=_failing_tokens()):
+            response = client.post("/general-query/stream/", params={"question": "Hi?"})
+        events = _events(response)
+        assert events[1] == {"type": "token", "content": "partial"}
+        assert events[-1]["type"] == "error"
+        assert "stream dropped" in events[-1]["detail"]
+
+
+class TestChatSessions:
+    def test_streamed_answer_is_added_to_the_session(self, client):
+        from sessions import SessionStore
+        with patch("main.chat_sessions", SessionStore()) as sessions, \
+             patch("main.astream_general_query", side_effect=[_tokens("Hel", "lo"), _tokens("Bye")]) as mock:
+            client.post("/general-query/stream/", params={"question": "Hi?", "session_id": "chat-1"})
+            client.post("/general-query/stream/", params={"question": "Bye?", "session_id": "chat-1"})
+        history = mock.call_args.args[2]
+        assert [message.content for message in history] == ["Hi?", "Hello"]
+        assert [turn.answer for turn in sessions._sessions["chat-1"].turns] == ["Hello", "Bye"]
+
+    def test_invalid_session_id_returns_422(self, client):
+        response = client.post("/general-query/", params={"question": "Hi?", "session_id": "not a valid id"})
+        assert response.status_code == 422
+
+
+class TestConcurrency:
+    def test_concurrent_queries_overlap_on_one_worker(self):
+        """Five 0.3s LLM calls must finish in roughly one call's time, not five."""
+        import main
+
+        async def slow_llm(question, llm, history=None):
+            await asyncio.sleep(0.3)
+            return "answer"
+
+        async def run_burst():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                start = time.monotonic()
+                responses = await asyncio.gather(*[
+                    ac.post("/general-query/", params={"question": f"Question {i}?"})
+                    for i in range(5)
+                ])
+                return responses, time.monotonic() - start
+
+        with patch("main.ahandle_general_query", side_effect=slow_llm):
+            responses, elapsed = asyncio.run(run_burst())
+
+        assert all(r.status_code == 200 for r in responses)
+        assert elapsed < 1.0
+
+    def test_status_responds_while_query_in_flight(self):
+        import main
+
+        async def slow_llm(question, llm, history=None):
+            await asyncio.sleep(0.5)
+            return "answer"
+
+        async def run():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                query = asyncio.create_task(ac.post("/general-query/", params={"question": "Slow?"}))
+                await asyncio.sleep(0.05)
+                start = time.monotonic()
+                status_response = await ac.get("/status/")
+                status_elapsed = time.monotonic() - start
+                await query
+                return status_response, status_elapsed
+
+        with patch("main.ahandle_general_query", side_effect=slow_llm):
+            status_response, status_elapsed = asyncio.run(run())
+
+        assert status_response.status_code == 200
+        assert status_elapsed < 0.25
+
+    def test_status_responds_during_slow_chroma_query(self, monkeypatch):
+        import main
+        from chat import ThreadedChromaVectorStore
+        from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+
+        def slow_query(self, query, **kwargs):
+            time.sleep(0.5)  # HNSW/SQLite lookup holding its thread
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        monkeypatch.setattr(ChromaVectorStore, "query", slow_query)
+        store = ThreadedChromaVectorStore(chroma_collection=MagicMock())
+
+        async def retrieve(question, llm, history=None):
+            await store.aquery(VectorStoreQuery(query_embedding=[0.1, 0.2], similarity_top_k=5))
+            return "answer"
+
+        async def run():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                # Timed from the query's start: a query blocking the loop would delay the
+                # status request itself, not only its response
+                start = time.monotonic()
+                query = asyncio.create_task(ac.post("/general-query/", params={"question": "Slow?"}))
+                await asyncio.sleep(0.05)
+                status_response = await ac.get("/status/")
+                status_elapsed = time.monotonic() - start
+                await query
+                return status_response, status_elapsed
+
+        with patch("main.ahandle_general_query", side_effect=retrieve):
+            status_response, status_elapsed = asyncio.run(run())
+
+        assert status_response.status_code == 200
+        assert status_elapsed < 0.3
+
+
 class TestStatus:
     def test_no_document_returns_false_status(self, client):
         response = client.get("/status/")
@@ -111,13 +408,20 @@ class TestStatus:
         assert response.json()["status"] is False
         assert response.json()["message"] == "No Document uploaded."
 
-    def test_document_loaded_returns_true_status(self, client):
-        import main
-        main.global_document_name = "report.pdf"
+    def test_document_loaded_returns_true_status(self, client, loaded_index):
         response = client.get("/status/")
         assert response.status_code == 200
         assert response.json()["status"] is True
         assert "report.pdf" in response.json()["message"]
+        assert response.json()["document_id"] == "doc1"
+
+    def test_unknown_document_id_returns_false_status(self, client, loaded_index):
+        response = client.get("/status/", params={"document_id": "missing"})
+        assert response.json()["status"] is False
+
+    def test_request_id_is_echoed(self, client):
+        response = client.get("/status/", headers={"X-Request-ID": "trace-42"})
+        assert response.headers["x-request-id"] == "trace-42"
 
 
 class TestClearIndex:
@@ -127,16 +431,45 @@ class TestClearIndex:
         assert response.status_code == 200
         assert "cleared" in response.json()["message"]
 
-    def test_clear_index_resets_global_state(self, client):
-        import main
-        main.global_index = MagicMock()
-        main.global_document_name = "test.pdf"
-        with patch("main.clear_chromadb_db"):
-            client.get("/clear-index/")
-        assert main.global_index is None
-        assert main.global_document_name is None
+    def test_clear_index_removes_only_that_document(self, client, registry, loaded_index):
+        registry.register(DocumentRecord(document_id="doc2", document_name="other.pdf"), index=MagicMock())
+        with patch("main.clear_chromadb_db") as mock_clear:
+            client.get("/clear-index/", params={"document_id": "doc1"})
+        mock_clear.assert_called_once_with("doc1")
+        assert registry.record("doc1") is None
+        assert registry.record("doc2") is not None
+
+    def test_clear_index_invalidates_cached_answers(self, client, registry, loaded_index):
+        with patch("main.ahandle_document_query", return_value={"answer": "A", "sources": []}) as mock_query, \
+             patch("main.clear_chromadb_db"):
+            client.post("/document-query/", params={"question": "Q?", "document_id": "doc1"})
+            client.get("/clear-index/", params={"document_id": "doc1"})
+            registry.register(DocumentRecord(document_id="doc1", document_name="report.pdf"), index=MagicMock())
+            client.post("/document-query/", params={"question": "Q?", "document_id": "doc1"})
+        assert mock_query.call_count == 2
 
-    def test_clear_index_chroma_error_returns_500(self, client):
+    def test_clear_index_chroma_error_returns_500(self, client, loaded_index):
         with patch("main.clear_chromadb_db", side_effect=RuntimeError("DB error")):
             response = client.get("/clear-index/")
         assert response.status_code == 500
+
+
+class TestHealth:
+    def test_health_reports_warm_clients(self, client):
+        response = client.get("/health/")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok", "warm": True}
+
+
+class TestMetrics:
+    def test_exposes_prometheus_text(self, client, loaded_index):
+        with patch("main.ahandle_document_query", return_value={"answer": "A", "sources": []}):
+            client.post("/document-query/", params={"question": "Q?"})
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert 'rag_stage_duration_seconds_count{operation="document_query",stage="total"}' in body
+        assert 'rag_http_request_duration_seconds_count{method="POST",route="/document-query/",status="200"}' in body
+        assert 'rag_http_requests_in_flight{route="/metrics"} 1.0' in body
+        assert 'rag_cache_misses_total{cache="answer"} 1.0' in body
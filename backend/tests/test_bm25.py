@@ -0,0 +1,38 @@
+from bm25 import BM25Index, tokenize
+
+
+class TestTokenize:
+    def test_lowercases_and_drops_stopwords(self):
+        assert tokenize("What is the Refund policy?") == ["refund", "policy"]
+
+    def test_plural_s_is_stripped(self):
+        assert tokenize("refunds") == tokenize("refund")
+
+
+class TestBM25Index:
+    corpus = [
+        "Refunds are issued within 30 days of purchase.",
+        "The warranty covers manufacturing defects for two years.",
+        "Shipping is free for orders above 50 euros.",
+    ]
+
+    def test_matching_document_scores_highest(self):
+        index = BM25Index(self.corpus)
+        assert index.top_k("how do refunds work", 3)[0][0] == 0
+
+    def test_documents_without_query_terms_are_excluded(self):
+        index = BM25Index(self.corpus)
+        assert [idx for idx, _ in index.top_k("warranty defects", 3)] == [1]
+
+    def test_rare_terms_weigh_more(self):
+        index = BM25Index(["refund refund policy", "policy", "policy"])
+        scores = index.scores("refund policy")
+        assert scores[0] > scores[1]
+
+    def test_unknown_terms_score_zero(self):
+        index = BM25Index(self.corpus)
+        assert not index.scores("kangaroo").any()
+        assert index.top_k("kangaroo", 3) == []
+
+    def test_empty_corpus(self):
+        assert BM25Index([]).top_k("refund", 3) == []
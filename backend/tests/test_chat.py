@@ -3,64 +3,328 @@ from unittest.mock import MagicMock, patch
 import chromadb
 
 
+class TestGetChromaClient:
+    def test_chroma_host_routes_every_worker_through_one_server(self, monkeypatch):
+        import chat
+        monkeypatch.setattr("chat._chroma_client", None)
+        monkeypatch.setattr("chat.CHROMA_HOST", "chroma")
+        with patch("chat.chromadb.HttpClient") as http_client, patch("chat.chromadb.PersistentClient") as embedded:
+            assert chat.get_chroma_client() is http_client.return_value
+        http_client.assert_called_once_with(host="chroma", port=chat.CHROMA_PORT)
+        embedded.assert_not_called()
+
+
 class TestConnectChromadbCreateIndex:
+    @pytest.fixture(autouse=True)
+    def chroma_backend(self, monkeypatch):
+        monkeypatch.setattr("chat.VECTOR_BACKEND", "chroma")
+
     def test_empty_list_raises_value_error(self):
         from chat import connect_chromadb_create_index
         with pytest.raises(ValueError, match="document list is empty"):
-            connect_chromadb_create_index([])
+            connect_chromadb_create_index([], "doc1")
 
     def test_none_raises_value_error(self):
         from chat import connect_chromadb_create_index
         with pytest.raises(ValueError, match="document list is empty"):
-            connect_chromadb_create_index(None)
+            connect_chromadb_create_index(None, "doc1")
 
     def test_chroma_error_raises_runtime_error(self):
         from chat import connect_chromadb_create_index
-        with patch("chat.chroma_client") as mock_client, \
-             patch("chat.initialize_embed_model"):
+        with patch("chat._chroma_client") as mock_client, \
+             patch("chat.configure_index_settings"), \
+             patch("chat.split_documents", return_value=["node"]):
             mock_client.get_or_create_collection.side_effect = chromadb.errors.ChromaError("DB error")
             with pytest.raises(RuntimeError, match="ChromaDB error while creating index"):
-                connect_chromadb_create_index([MagicMock()])
+                connect_chromadb_create_index([MagicMock()], "doc1")
 
     def test_unexpected_error_raises_runtime_error(self):
         from chat import connect_chromadb_create_index
-        with patch("chat.chroma_client") as mock_client, \
-             patch("chat.initialize_embed_model"):
+        with patch("chat._chroma_client") as mock_client, \
+             patch("chat.configure_index_settings"), \
+             patch("chat.split_documents", return_value=["node"]):
             mock_client.get_or_create_collection.side_effect = Exception("Unexpected failure")
             with pytest.raises(RuntimeError, match="Unexpected error creating index"):
-                connect_chromadb_create_index([MagicMock()])
+                connect_chromadb_create_index([MagicMock()], "doc1")
 
     def test_returns_index_on_success(self):
         from chat import connect_chromadb_create_index
         mock_index = MagicMock()
-        with patch("chat.chroma_client") as mock_client, \
-             patch("chat.initialize_embed_model"), \
-             patch("chat.Settings"), \
-             patch("chat.ChromaVectorStore"), \
-             patch("chat.StorageContext"), \
+        with patch("chat._chroma_client") as mock_client, \
+             patch("chat.configure_index_settings"), \
+             patch("chat.ThreadedChromaVectorStore") as mock_store, \
+             patch("chat.split_documents", return_value=["node"]), \
+             patch("chat.embed_and_store") as mock_embed, \
+             patch("chat.LexicalIndex") as mock_lexical, \
+             patch("chat.VectorStoreIndex") as mock_vector_index:
+            mock_vector_index.from_vector_store.return_value = mock_index
+            mock_client.get_or_create_collection.return_value.count.return_value = 7
+            index, chunk_count = connect_chromadb_create_index([MagicMock()], "doc1", "manual.pdf", content_hash="abc")
+        assert chunk_count == 7
+        assert index.vector_index is mock_index
+        assert index.lexical_index is mock_lexical.return_value
+        mock_lexical.assert_called_once_with(["node"])
+        assert mock_embed.call_args[0][0] == ["node"]
+        assert mock_embed.call_args[0][2] is mock_store.return_value
+        args, kwargs = mock_client.get_or_create_collection.call_args
+        assert args == ("doc_doc1",)
+        assert kwargs["metadata"]["document_name"] == "manual.pdf"
+        assert "created_at" in kwargs["metadata"]
+        assert kwargs["metadata"]["content_hash"] == "abc"
+        assert kwargs["metadata"]["complete"] is False
+        collection = mock_client.get_or_create_collection.return_value
+        assert collection.modify.call_args.kwargs["metadata"]["complete"] is True
+
+    def test_failed_ingestion_leaves_no_document_behind(self, tmp_path, monkeypatch):
+        from chat import connect_chromadb_create_index, describe_document_collection, list_document_collections
+        from llama_index.core.schema import TextNode
+        monkeypatch.setattr("chat._chroma_client", chromadb.PersistentClient(path=str(tmp_path)))
+        with patch("chat.configure_index_settings"), \
+             patch("chat.split_documents", return_value=[TextNode(text="chunk")]), \
+             patch("chat.embed_and_store", side_effect=RuntimeError("embedding endpoint down")):
+            with pytest.raises(RuntimeError):
+                connect_chromadb_create_index([MagicMock()], "deadbeef", "a.pdf")
+        assert list_document_collections() == []
+        assert describe_document_collection("deadbeef") is None
+
+
+    def test_progress_reports_pipeline_stages(self):
+        from chat import connect_chromadb_create_index
+        stages = []
+        with patch("chat._chroma_client"), \
+             patch("chat.configure_index_settings"), \
+             patch("chat.ThreadedChromaVectorStore"), \
+             patch("chat.split_documents", return_value=["n1", "n2"]), \
+             patch("chat.embed_and_store"), \
+             patch("chat.LexicalIndex"), \
+             patch("chat.VectorStoreIndex"):
+            connect_chromadb_create_index(
+                [MagicMock()], "doc1", progress=lambda stage, **counts: stages.append((stage, counts))
+            )
+        assert [stage for stage, _ in stages] == ["chunk", "embed", "store"]
+        assert stages[1][1] == {"chunks_total": 2, "chunks_done": 0}
+
+
+class TestConfigureIndexSettings:
+    def test_embed_model_is_wrapped_in_cache_once(self, tmp_path):
+        import chat
+        with patch("chat._embed_model", None), \
+             patch("chat.EMBEDDING_CACHE_PATH", str(tmp_path / "cache.sqlite3")), \
+             patch("chat.initialize_embed_model") as mock_init, \
+             patch("chat.CachedEmbeddingModel") as mock_cached, \
+             patch("chat.Settings") as mock_settings:
+            chat.configure_index_settings()
+            chat.configure_index_settings()
+            mock_init.assert_called_once()
+            assert mock_settings.embed_model is mock_cached.return_value
+
+    def test_concurrent_first_calls_create_one_model(self, tmp_path):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        import chat
+
+        def slow_init():
+            time.sleep(0.05)
+            return MagicMock()
+
+        with patch("chat._embed_model", None), \
+             patch("chat.EMBEDDING_CACHE_PATH", str(tmp_path / "cache.sqlite3")), \
+             patch("chat.initialize_embed_model", side_effect=slow_init) as mock_init, \
+             patch("chat.EmbeddingCache") as mock_cache, \
+             patch("chat.CachedEmbeddingModel"), \
+             patch("chat.Settings"):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                models = list(pool.map(lambda _: chat.configure_index_settings(), range(4)))
+            mock_init.assert_called_once()
+            mock_cache.assert_called_once()
+            assert all(model is models[0] for model in models)
+
+
+class TestLoadIndexFromChromadb:
+    def test_builds_index_from_existing_collection(self):
+        from chat import load_index_from_chromadb
+        mock_index = MagicMock()
+        with patch("chat._chroma_client") as mock_client, \
+             patch("chat.configure_index_settings"), \
+             patch("chat.ThreadedChromaVectorStore"), \
+             patch("chat.lexical_index_from_collection") as mock_lexical, \
              patch("chat.VectorStoreIndex") as mock_vector_index:
-            mock_vector_index.from_documents.return_value = mock_index
-            result = connect_chromadb_create_index([MagicMock()])
-        assert result == mock_index
+            mock_vector_index.from_vector_store.return_value = mock_index
+            result = load_index_from_chromadb("doc1")
+        assert result.vector_index == mock_index
+        mock_client.get_collection.assert_called_once_with("doc_doc1")
+        mock_lexical.assert_called_once_with(mock_client.get_collection.return_value)
+        mock_vector_index.from_documents.assert_not_called()
+
+    def test_missing_collection_raises_runtime_error(self):
+        from chat import load_index_from_chromadb
+        with patch("chat._chroma_client") as mock_client:
+            mock_client.get_collection.side_effect = chromadb.errors.ChromaError("not found")
+            with pytest.raises(RuntimeError, match="ChromaDB error while loading index"):
+                load_index_from_chromadb("doc1")
+
+
+def _mock_collection(name, metadata, count):
+    collection = MagicMock()
+    collection.name = name
+    collection.metadata = metadata
+    collection.count.return_value = count
+    return collection
+
+
+class TestListDocumentCollections:
+    def test_describes_document_collections_only(self):
+        from chat import list_document_collections
+        with patch("chat._chroma_client") as mock_client:
+            mock_client.list_collections.return_value = [
+                _mock_collection("doc_abc", {"document_name": "manual.pdf", "created_at": 5.0}, 42),
+                _mock_collection("given_doc", None, 3),
+            ]
+            result = list_document_collections()
+        assert result == [
+            {
+                "document_id": "abc", "document_name": "manual.pdf", "created_at": 5.0,
+                "chunk_count": 42, "content_hash": "",
+            }
+        ]
+
+    def test_incomplete_collections_are_skipped(self):
+        from chat import describe_document_collection, list_document_collections
+        partial = _mock_collection("doc_abc", {"document_name": "a.pdf", "complete": False}, 0)
+        with patch("chat._chroma_client") as mock_client:
+            mock_client.list_collections.return_value = [partial]
+            mock_client.get_collection.return_value = partial
+            assert list_document_collections() == []
+            assert describe_document_collection("abc") is None
+
+    def test_chroma_error_raises_runtime_error(self):
+        from chat import list_document_collections
+        with patch("chat._chroma_client") as mock_client:
+            mock_client.list_collections.side_effect = chromadb.errors.ChromaError("DB error")
+            with pytest.raises(RuntimeError, match="ChromaDB error while listing collections"):
+                list_document_collections()
+
+
+class TestDescribeDocumentCollection:
+    def test_missing_collection_returns_none(self):
+        from chat import describe_document_collection
+        with patch("chat._chroma_client") as mock_client:
+            mock_client.get_collection.side_effect = chromadb.errors.NotFoundError("missing")
+            assert describe_document_collection("abc") is None
+
+    def test_collection_without_metadata_falls_back_to_id(self):
+        from chat import describe_document_collection
+        with patch("chat._chroma_client") as mock_client:
+            mock_client.get_collection.return_value = _mock_collection("doc_abc", None, 2)
+            result = describe_document_collection("abc")
+        assert result["document_name"] == "abc"
+        assert result["chunk_count"] == 2
 
 
 class TestClearChromadbDb:
     def test_success_calls_delete_collection(self):
         from chat import clear_chromadb_db
-        with patch("chat.chroma_client") as mock_client:
-            clear_chromadb_db()
-            mock_client.delete_collection.assert_called_once_with("given_doc")
+        with patch("chat._chroma_client") as mock_client:
+            clear_chromadb_db("doc1")
+            mock_client.delete_collection.assert_called_once_with("doc_doc1")
 
     def test_chroma_error_raises_runtime_error(self):
         from chat import clear_chromadb_db
-        with patch("chat.chroma_client") as mock_client:
+        with patch("chat._chroma_client") as mock_client:
             mock_client.delete_collection.side_effect = chromadb.errors.ChromaError("Delete failed")
             with pytest.raises(RuntimeError, match="ChromaDB error while clearing collection"):
-                clear_chromadb_db()
+                clear_chromadb_db("doc1")
 
     def test_unexpected_error_raises_runtime_error(self):
         from chat import clear_chromadb_db
-        with patch("chat.chroma_client") as mock_client:
+        with patch("chat._chroma_client") as mock_client:
             mock_client.delete_collection.side_effect = Exception("Unexpected failure")
             with pytest.raises(RuntimeError, match="Unexpected error clearing ChromaDB"):
-                clear_chromadb_db()
+                clear_chromadb_db("doc1")
+
+    def test_numpy_store_error_raises_runtime_error(self):
+        from chat import clear_chromadb_db
+        with patch("chat.NumpyVectorStore.exists", return_value=True), \
+             patch("chat.NumpyVectorStore.open", side_effect=OSError("Permission denied")):
+            with pytest.raises(RuntimeError, match="Error clearing NumPy vector store"):
+                clear_chromadb_db("doc1")
+
+
+def _store_with_embeddings(nodes, embed_model, vector_store, on_stored=None):
+    for i, node in enumerate(nodes):
+        node.embedding = [float(i == j) for j in range(4)]
+    vector_store.add(nodes)
+
+
+class TestNumpyBackend:
+    @pytest.fixture(autouse=True)
+    def auto_backend(self, monkeypatch):
+        monkeypatch.setattr("chat.VECTOR_BACKEND", "auto")
+
+    def _create(self, document_id="doc1"):
+        from llama_index.core.schema import TextNode
+        from chat import connect_chromadb_create_index
+        nodes = [TextNode(text=f"chunk {i}", id_=f"n{i}") for i in range(3)]
+        with patch("chat._chroma_client") as mock_client, \
+             patch("chat.configure_index_settings"), \
+             patch("chat.split_documents", return_value=nodes), \
+             patch("chat.embed_and_store", side_effect=_store_with_embeddings), \
+             patch("chat.VectorStoreIndex"):
+            index, chunk_count = connect_chromadb_create_index([MagicMock()], document_id, "manual.pdf", content_hash="abc")
+        mock_client.get_or_create_collection.assert_not_called()
+        return index, chunk_count
+
+    def test_auto_picks_numpy_for_small_documents(self, monkeypatch):
+        import chat
+        monkeypatch.setattr("chat.NUMPY_BACKEND_MAX_CHUNKS", 10)
+        assert chat.choose_vector_backend(10) == "numpy"
+        assert chat.choose_vector_backend(11) == "chroma"
+        monkeypatch.setattr("chat.VECTOR_BACKEND", "chroma")
+        assert chat.choose_vector_backend(1) == "chroma"
+
+    def test_numpy_only_worker_never_opens_chroma(self, monkeypatch):
+        from chat import (
+            chroma_enabled, clear_chromadb_db, describe_document_collection, list_document_collections,
+            load_index_from_chromadb,
+        )
+        self._create()
+        monkeypatch.setattr("chat.VECTOR_BACKEND", "numpy")
+        monkeypatch.setattr("chat.CHROMA_HOST", "")
+        assert not chroma_enabled()
+        with patch("chat.get_chroma_client", side_effect=AssertionError("Chroma opened")):
+            assert [d["document_id"] for d in list_document_collections()] == ["doc1"]
+            assert describe_document_collection("chroma-doc") is None
+            clear_chromadb_db("chroma-doc")
+            with pytest.raises(RuntimeError, match="Chroma is disabled"):
+                load_index_from_chromadb("chroma-doc")
+        monkeypatch.setattr("chat.CHROMA_HOST", "chroma")
+        assert chroma_enabled()
+
+    def test_create_load_list_and_clear(self):
+        from chat import (
+            clear_chromadb_db, describe_document_collection, list_document_collections, load_index_from_chromadb,
+        )
+        index, chunk_count = self._create()
+        assert chunk_count == 3
+        assert len(index.lexical_index) == 3
+
+        with patch("chat.configure_index_settings"), \
+             patch("chat.VectorStoreIndex") as mock_vector_index, \
+             patch("chat._chroma_client") as mock_client:
+            loaded = load_index_from_chromadb("doc1")
+            mock_client.list_collections.return_value = []
+            listed = list_document_collections()
+            described = describe_document_collection("doc1")
+            mock_client.get_collection.assert_not_called()
+        assert len(loaded.lexical_index) == 3
+        assert mock_vector_index.from_vector_store.call_args[0][0].count() == 3
+        assert listed == [described]
+        assert described["document_name"] == "manual.pdf"
+        assert described["chunk_count"] == 3
+        assert described["content_hash"] == "abc"
+
+        with patch("chat._chroma_client") as mock_client:
+            clear_chromadb_db("doc1")
+            mock_client.delete_collection.assert_not_called()
+            mock_client.get_collection.side_effect = chromadb.errors.NotFoundError("missing")
+            assert describe_document_collection("doc1") is None
@@ -0,0 +1,67 @@
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.utils import get_tokenizer
+from context_packing import ORIGINAL_TEXT_KEY, ContextPacker
+from metrics import track_stages
+
+OVERLAP = "The battery must be charged for eight hours before first use."
+FIRST = "Unpack the device and check every part against the list. " + OVERLAP
+SECOND = OVERLAP + " Refunds are paid within 14 days of the returned order arriving."
+FILLER = " ".join(f"Section {i} describes the shipping carton and the foam inserts." for i in range(40))
+
+
+def _nodes(*texts):
+    return [
+        NodeWithScore(node=TextNode(text=text, metadata={"page_label": str(page)}), score=1.0 - page / 10)
+        for page, text in enumerate(texts, start=1)
+    ]
+
+
+def _tokens(nodes):
+    tokenizer = get_tokenizer()
+    return sum(len(tokenizer(node.node.get_content())) for node in nodes)
+
+
+class TestContextPacker:
+    def test_overlap_between_chunks_is_sent_once(self):
+        packed = ContextPacker(token_budget=10_000).postprocess_nodes(
+            _nodes(FIRST, SECOND), QueryBundle("When is my refund paid?")
+        )
+        context = " ".join(node.node.get_content() for node in packed)
+        assert context.count(OVERLAP) == 1
+        assert "Refunds are paid within 14 days" in context
+
+    def test_least_relevant_sentences_go_first_and_every_citation_stays(self):
+        nodes = _nodes(FILLER, SECOND, FILLER + " The warranty covers the charger for two years.")
+        packed = ContextPacker(token_budget=120).postprocess_nodes(nodes, QueryBundle("How long is the warranty?"))
+
+        assert [node.node.metadata["page_label"] for node in packed] == ["1", "2", "3"]
+        assert [node.score for node in packed] == [node.score for node in nodes]
+        assert _tokens(packed) <= 120
+        assert "warranty covers the charger" in packed[2].node.get_content()
+        assert all(node.node.get_content() for node in packed)
+        # The retrieved nodes themselves are left untouched
+        assert nodes[0].node.get_content() == FILLER
+
+    def test_retrieved_text_is_kept_for_previews_but_not_sent_to_the_llm(self):
+        from query_type import _extract_sources
+        packed = ContextPacker(token_budget=10_000).postprocess_nodes(
+            _nodes(FIRST, SECOND), QueryBundle("When is my refund paid?")
+        )
+        assert packed[1].node.metadata[ORIGINAL_TEXT_KEY] == SECOND
+        assert SECOND not in packed[1].node.get_content(metadata_mode=MetadataMode.LLM)
+        assert SECOND not in packed[1].node.get_content(metadata_mode=MetadataMode.EMBED)
+
+        class Response:
+            source_nodes = packed
+
+        assert _extract_sources(Response())[1] == {"page": "2", "preview": SECOND[:150]}
+
+    def test_saved_tokens_are_reported_in_the_request_timings(self):
+        with track_stages("document_query") as timings:
+            ContextPacker(token_budget=50).postprocess_nodes(_nodes(FILLER), QueryBundle("shipping carton"))
+        assert timings.tokens["context_saved"] > 0
+        assert timings.to_dict()["context_saved_tokens"] == timings.tokens["context_saved"]
+
+    def test_zero_budget_disables_packing(self):
+        nodes = _nodes(FIRST, SECOND)
+        assert ContextPacker(token_budget=0).postprocess_nodes(nodes, QueryBundle("refund")) is nodes
@@ -0,0 +1,73 @@
+import pytest
+from unittest.mock import patch
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+
+def _write_pdf(path, page_count):
+    """Writes a PDF whose page N contains the text 'Page N body'."""
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for number in range(1, page_count + 1):
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)}),
+        })
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 712 Td (Page {number} body) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    return _write_pdf(tmp_path / "sample.pdf", 7)
+
+
+class TestExtractPageRange:
+    def test_returns_labels_and_text_for_the_range(self, pdf_path):
+        from document_parser import extract_page_range
+        pages = extract_page_range(pdf_path, 2, 4)
+        assert [label for label, _ in pages] == ["3", "4"]
+        assert "Page 3 body" in pages[0][1]
+
+
+class TestLoadDocument:
+    def test_small_pdf_uses_single_process_reader(self, pdf_path):
+        import document_parser
+        with patch.object(document_parser, "PARSE_PARALLEL_MIN_PAGES", 100), \
+             patch.object(document_parser, "_get_pool") as get_pool:
+            documents = document_parser.load_document(pdf_path)
+        get_pool.assert_not_called()
+        assert len(documents) == 7
+
+    def test_parallel_parse_matches_single_process_reader(self, pdf_path):
+        import document_parser
+        from llama_index.core.schema import MetadataMode
+        with patch.object(document_parser, "PARSE_PARALLEL_MIN_PAGES", 100):
+            expected = document_parser.load_document(pdf_path)
+        with patch.object(document_parser, "PARSE_PARALLEL_MIN_PAGES", 2), \
+             patch.object(document_parser, "PARSE_PAGES_PER_SHARD", 3), \
+             patch.object(document_parser, "PARSE_WORKERS", 2):
+            documents = document_parser.load_document(pdf_path)
+
+        assert [d.metadata["page_label"] for d in documents] == [str(n) for n in range(1, 8)]
+        assert [d.text for d in documents] == [d.text for d in expected]
+        for got, want in zip(documents, expected):
+            assert got.metadata["file_name"] == want.metadata["file_name"]
+            assert got.get_content(MetadataMode.EMBED) == want.get_content(MetadataMode.EMBED)
+
+    def test_text_files_are_read_whole(self, tmp_path):
+        import document_parser
+        path = tmp_path / "notes.txt"
+        path.write_text("plain text body")
+        with patch.object(document_parser, "_get_pool") as get_pool:
+            documents = document_parser.load_document(str(path))
+        get_pool.assert_not_called()
+        assert documents[0].text == "plain text body"
@@ -0,0 +1,113 @@
+import asyncio
+from typing import List
+import pytest
+from llama_index.core import Document, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from embedding_cache import EmbeddingCache, CachedEmbeddingModel
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Deterministic fake embedding model that records every text it is asked to embed."""
+
+    calls: List[str] = []
+
+    def _vector(self, text: str) -> List[float]:
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.calls.append(query)
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        self.calls.append(text)
+        return self._vector(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+
+
+class TestEmbeddingCache:
+    def test_miss_then_hit(self, cache):
+        assert cache.get_many("m", ["a"]) == [None]
+        cache.put_many("m", ["a"], [[1.0, 2.0]])
+        assert cache.get_many("m", ["a"]) == [[1.0, 2.0]]
+        assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    def test_key_includes_model(self, cache):
+        cache.put_many("model-a", ["text"], [[1.0]])
+        assert cache.get_many("model-b", ["text"]) == [None]
+
+    def test_least_recently_used_entries_are_evicted(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path / "lru.sqlite3"), max_entries=2)
+        cache.put_many("m", ["a"], [[1.0]])
+        cache.put_many("m", ["b"], [[2.0]])
+        cache.get_many("m", ["a"])  # a is now more recently used than b
+        cache.put_many("m", ["c"], [[3.0]])
+        assert cache.get_many("m", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+    def test_hits_batch_their_access_time_updates(self, cache):
+        cache.put_many("m", ["a"], [[1.0]])
+        (before,) = cache._conn.execute("SELECT last_access FROM embeddings").fetchone()
+        cache.get_many("m", ["a"])
+        assert cache._conn.execute("SELECT last_access FROM embeddings").fetchone() == (before,)
+        for _ in range(EmbeddingCache.ACCESS_FLUSH_KEYS):
+            cache.get_many("m", ["a"] * 2)
+        cache.ACCESS_FLUSH_S = 0
+        cache.get_many("m", ["a"])
+        assert cache._conn.execute("SELECT last_access FROM embeddings").fetchone()[0] > before
+
+    def test_entry_count_ignores_duplicates_and_sees_other_workers(self, tmp_path):
+        path = str(tmp_path / "shared.sqlite3")
+        first = EmbeddingCache(path, max_entries=3)
+        other = EmbeddingCache(path, max_entries=3)
+        first.put_many("m", ["a", "b"], [[1.0], [2.0]])
+        first.put_many("m", ["a"], [[1.0]])
+        assert first.stats()["entries"] == 2
+        other.put_many("m", ["c", "d"], [[3.0], [4.0]])
+        first.RECOUNT_S = 0
+        first.put_many("m", ["e"], [[5.0]])
+        (count,) = first._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        assert count <= 3
+        assert first.stats()["entries"] == count
+
+    def test_entries_persist_across_instances(self, tmp_path):
+        path = str(tmp_path / "persist.sqlite3")
+        EmbeddingCache(path).put_many("m", ["a"], [[0.5]])
+        assert EmbeddingCache(path).get_many("m", ["a"]) == [[0.5]]
+
+
+class TestCachedEmbeddingModel:
+    def test_only_misses_reach_the_model(self, cache):
+        inner = CountingEmbedding(calls=[])
+        model = CachedEmbeddingModel(inner, cache)
+        model.get_text_embedding_batch(["a", "b"])
+        inner.calls.clear()
+        result = model.get_text_embedding_batch(["a", "b", "c"])
+        assert inner.calls == ["c"]
+        assert result[0] == inner._vector("a")
+
+    def test_repeated_query_is_embedded_once(self, cache):
+        inner = CountingEmbedding(calls=[])
+        model = CachedEmbeddingModel(inner, cache)
+        first = model.get_query_embedding("what is the refund policy?")
+        second = asyncio.run(model.aget_query_embedding("what is the refund policy?"))
+        assert first == second
+        assert inner.calls == ["what is the refund policy?"]
+
+    def test_reindexing_unchanged_document_makes_no_embedding_calls(self, cache):
+        inner = CountingEmbedding(calls=[])
+        model = CachedEmbeddingModel(inner, cache)
+        text = " ".join(f"Sentence number {i} about refunds and returns." for i in range(300))
+        VectorStoreIndex.from_documents([Document(text=text)], embed_model=model)
+        assert inner.calls
+        inner.calls.clear()
+        VectorStoreIndex.from_documents([Document(text=text)], embed_model=model)
+        assert inner.calls == []
@@ -0,0 +1,127 @@
+import asyncio
+from typing import List
+import chromadb
+import pytest
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQueryMode
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from hybrid_retrieval import HybridIndex, LexicalIndex, lexical_index_from_collection, reciprocal_rank_fusion
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Deterministic bag-of-letters embedding that counts query embeddings."""
+
+    query_calls: int = 0
+
+    def _vector(self, text: str) -> List[float]:
+        counts = [0.0] * 26
+        for char in text.lower():
+            if "a" <= char <= "z":
+                counts[ord(char) - ord("a")] += 1.0
+        return counts if any(counts) else [1.0] * 26
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.query_calls += 1
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+
+CHUNKS = [
+    "Refunds are issued within 30 days of delivery to the original payment method.",
+    "Replacement part XJ-2044 fits all models built after 2019.",
+    "The warranty covers manufacturing defects for two years.",
+    "Clause 14.2 limits liability to the purchase price.",
+    "Shipping is free for orders above 50 euros.",
+]
+
+
+def _nodes():
+    return [TextNode(text=text, id_=f"chunk{i}", metadata={"page_label": str(i + 1)}) for i, text in enumerate(CHUNKS)]
+
+
+@pytest.fixture
+def embed_model():
+    return CountingEmbedding(model_name="counting")
+
+
+@pytest.fixture
+def hybrid_index(embed_model):
+    nodes = _nodes()
+    vector_index = VectorStoreIndex(nodes, embed_model=embed_model)
+    embed_model.query_calls = 0
+    return HybridIndex(vector_index, LexicalIndex(nodes))
+
+
+class TestReciprocalRankFusion:
+    def test_chunks_ranked_well_in_both_lists_win(self):
+        a, b, c = (TextNode(text=t, id_=t) for t in "abc")
+        fused = reciprocal_rank_fusion([
+            [NodeWithScore(node=a), NodeWithScore(node=b)],
+            [NodeWithScore(node=b), NodeWithScore(node=c)],
+        ], k=60)
+        assert [hit.node.node_id for hit in fused] == ["b", "a", "c"]
+        assert fused[0].score == pytest.approx(1 / 62 + 1 / 61)
+
+
+class TestLexicalIndex:
+    def test_rare_exact_term_is_confident(self):
+        hits, confident = LexicalIndex(_nodes()).search("part XJ-2044", 5)
+        assert hits[0].node.node_id == "chunk1"
+        assert confident
+
+    def test_vague_question_is_not_confident(self):
+        _, confident = LexicalIndex(_nodes()).search("how long until I get my money back", 5)
+        assert not confident
+
+    def test_embeddings_are_not_kept(self):
+        nodes = _nodes()
+        nodes[0].embedding = [0.1] * 26
+        assert LexicalIndex(nodes).nodes[0].embedding is None
+
+
+class TestHybridRetriever:
+    def test_confident_lexical_query_skips_embedding(self, hybrid_index, embed_model):
+        retriever = hybrid_index.as_retriever(similarity_top_k=3)
+        hits = retriever.retrieve("What does clause 14.2 say?")
+        assert hits[0].node.node_id == "chunk3"
+        assert embed_model.query_calls == 0
+
+    def test_other_queries_fuse_vector_and_lexical_hits(self, hybrid_index, embed_model):
+        retriever = hybrid_index.as_retriever(similarity_top_k=3)
+        hits = retriever.retrieve("how long until I get my money back")
+        assert embed_model.query_calls == 1
+        assert len(hits) == 3
+
+    def test_async_retrieval_with_mmr(self, hybrid_index, embed_model):
+        retriever = hybrid_index.as_retriever(similarity_top_k=2, vector_store_query_mode=VectorStoreQueryMode.MMR)
+        hits = asyncio.run(retriever.aretrieve("warranty for defects"))
+        assert hits[0].node.node_id == "chunk2"
+
+    def test_query_engine_accepts_vector_index_arguments(self, hybrid_index):
+        from llama_index.core.llms import MockLLM
+        engine = hybrid_index.as_query_engine(
+            llm=MockLLM(), similarity_top_k=2, vector_store_query_mode=VectorStoreQueryMode.MMR,
+            node_postprocessors=[], streaming=False,
+        )
+        response = engine.query("Replacement part XJ-2044")
+        assert response.source_nodes[0].node.metadata["page_label"] == "2"
+
+
+class TestLexicalIndexFromCollection:
+    def test_rebuilds_from_persisted_chunks(self, embed_model):
+        collection = chromadb.EphemeralClient().get_or_create_collection("doc_test")
+        storage_context = StorageContext.from_defaults(vector_store=ChromaVectorStore(chroma_collection=collection))
+        VectorStoreIndex(_nodes(), storage_context=storage_context, embed_model=embed_model)
+
+        lexical = lexical_index_from_collection(collection)
+        hits, _ = lexical.search("XJ-2044", 1)
+        assert len(lexical) == len(CHUNKS)
+        assert hits[0].node.node_id == "chunk1"
+        assert hits[0].node.metadata["page_label"] == "2"
@@ -0,0 +1,113 @@
+import pytest
+from unittest.mock import MagicMock
+from index_registry import IndexRegistry, DocumentRecord, APPROX_BYTES_PER_CHUNK
+from registry_store import RegistryStore
+
+
+def _record(document_id, chunk_count=1):
+    return DocumentRecord(document_id=document_id, document_name=f"{document_id}.pdf", chunk_count=chunk_count)
+
+
+class TestIndexRegistry:
+    def test_get_returns_registered_index_without_loading(self):
+        loader = MagicMock()
+        registry = IndexRegistry(loader=loader)
+        index = MagicMock()
+        registry.register(_record("a"), index=index)
+        assert registry.get("a") is index
+        loader.assert_not_called()
+
+    def test_get_unknown_document_raises_key_error(self):
+        registry = IndexRegistry(loader=MagicMock())
+        with pytest.raises(KeyError):
+            registry.get("missing")
+
+    def test_least_recently_used_handle_is_evicted_by_count(self):
+        loader = MagicMock(return_value="reloaded")
+        registry = IndexRegistry(loader=loader, max_entries=2)
+        registry.register(_record("a"), index="index-a")
+        registry.register(_record("b"), index="index-b")
+        registry.get("a")  # touch a, so b becomes least recently used
+        registry.register(_record("c"), index="index-c")
+        assert registry.stats()["loaded"] == 2
+        assert registry.get("a") == "index-a"
+        assert registry.get("b") == "reloaded"
+        loader.assert_called_once_with("b")
+        assert registry.stats()["hits"] == 2
+        assert registry.stats()["misses"] == 1
+
+    def test_handles_are_evicted_by_memory_budget(self):
+        registry = IndexRegistry(loader=MagicMock(), max_entries=10, max_bytes=3 * APPROX_BYTES_PER_CHUNK)
+        registry.register(_record("a", chunk_count=2), index="index-a")
+        registry.register(_record("b", chunk_count=2), index="index-b")
+        stats = registry.stats()
+        assert stats["loaded"] == 1
+        assert stats["loaded_bytes"] == 2 * APPROX_BYTES_PER_CHUNK
+        assert stats["documents"] == 2
+
+    def test_evicted_document_keeps_its_record(self):
+        registry = IndexRegistry(loader=MagicMock(), max_entries=1)
+        registry.register(_record("a"), index="index-a")
+        registry.register(_record("b"), index="index-b")
+        assert registry.record("a").document_name == "a.pdf"
+
+    def test_remove_forgets_document(self):
+        registry = IndexRegistry(loader=MagicMock())
+        registry.register(_record("a"), index="index-a")
+        registry.remove("a")
+        assert registry.record("a") is None
+        assert registry.stats() == {"documents": 0, "loaded": 0, "loaded_bytes": 0, "hits": 0, "misses": 0}
+
+    def test_latest_returns_most_recent_upload(self):
+        registry = IndexRegistry(loader=MagicMock())
+        registry.register(DocumentRecord(document_id="old", document_name="old.pdf", created_at=1.0))
+        registry.register(DocumentRecord(document_id="new", document_name="new.pdf", created_at=2.0))
+        assert registry.latest().document_id == "new"
+
+    def test_restore_adds_record_without_loading(self):
+        loader = MagicMock()
+        registry = IndexRegistry(loader=loader)
+        assert registry.restore(_record("a")) is True
+        assert registry.stats()["loaded"] == 0
+        loader.assert_not_called()
+
+    def test_restore_keeps_existing_record(self):
+        registry = IndexRegistry(loader=MagicMock())
+        registry.register(_record("a"), index="index-a")
+        assert registry.restore(DocumentRecord(document_id="a", document_name="stale.pdf")) is False
+        assert registry.record("a").document_name == "a.pdf"
+
+
+class TestSharedRegistry:
+    """Two registries on one SQLite file behave like two gunicorn workers."""
+
+    def _workers(self, tmp_path):
+        path = str(tmp_path / "registry.sqlite3")
+        first = IndexRegistry(loader=MagicMock(return_value="loaded-1"), store=RegistryStore(path))
+        second = IndexRegistry(loader=MagicMock(return_value="loaded-2"), store=RegistryStore(path))
+        return first, second
+
+    def test_upload_in_one_worker_is_loaded_lazily_by_another(self, tmp_path):
+        first, second = self._workers(tmp_path)
+        first.register(_record("a", chunk_count=4), index="index-a")
+        assert second.latest().document_id == "a"
+        assert second.record("a").chunk_count == 4
+        assert second.get("a") == "loaded-2"
+        second._loader.assert_called_once_with("a")
+
+    def test_clear_in_one_worker_drops_the_others_handle(self, tmp_path):
+        first, second = self._workers(tmp_path)
+        first.register(_record("a"), index="index-a")
+        second.get("a")
+        first.remove("a")
+        assert second.record("a") is None
+        with pytest.raises(KeyError):
+            second.get("a")
+        assert second.stats()["loaded"] == 0
+
+    def test_restore_keeps_the_shared_record(self, tmp_path):
+        first, second = self._workers(tmp_path)
+        first.register(_record("a"))
+        stale = DocumentRecord(document_id="a", document_name="stale.pdf")
+        assert not second.restore(stale)
+        assert second.record("a").document_name == "a.pdf"
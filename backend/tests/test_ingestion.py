@@ -0,0 +1,98 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+from azure.core.exceptions import HttpResponseError
+from llama_index.core.schema import TextNode
+from ingestion import embed_and_store
+from resilience import CircuitOpenError
+
+
+class FakeEmbedModel:
+    """Embedding stand-in that records batch sizes and peak concurrency."""
+
+    def __init__(self, latency=0.02, failures=None):
+        self.latency = latency
+        self.failures = list(failures or [])
+        self.batches = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_text_embedding_batch(self, texts):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            failure = self.failures.pop(0) if self.failures else None
+        try:
+            time.sleep(self.latency)
+            if failure:
+                raise failure
+            with self._lock:
+                self.batches.append(len(texts))
+            return [[float(len(text))] for text in texts]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _throttled():
+    error = HttpResponseError(message="Too many requests")
+    error.status_code = 429
+    return error
+
+
+def _nodes(count):
+    return [TextNode(text=f"chunk {i}") for i in range(count)]
+
+
+class TestEmbedAndStore:
+    def test_batches_run_concurrently_up_to_limit(self):
+        model = FakeEmbedModel()
+        embed_and_store(_nodes(40), model, MagicMock(), batch_size=4, max_in_flight=3)
+        assert model.batches == [4] * 10
+        assert model.peak_in_flight == 3
+
+    def test_every_node_gets_its_embedding(self):
+        nodes = _nodes(5)
+        embed_and_store(nodes, FakeEmbedModel(), MagicMock(), batch_size=2)
+        assert all(node.embedding == [float(len(node.text))] for node in nodes)
+
+    def test_store_writes_are_bulked(self):
+        store = MagicMock()
+        stored = embed_and_store(_nodes(10), FakeEmbedModel(), store, batch_size=2, flush_size=6)
+        assert stored == 10
+        assert [len(call.args[0]) for call in store.add.call_args_list] == [6, 4]
+
+    def test_progress_reports_running_stored_count(self):
+        progress = []
+        embed_and_store(
+            _nodes(10), FakeEmbedModel(), MagicMock(), batch_size=2, flush_size=4, on_stored=progress.append
+        )
+        assert progress == [4, 8, 10]
+
+    def test_throttled_batch_is_retried(self):
+        model = FakeEmbedModel(failures=[_throttled()])
+        stored = embed_and_store(_nodes(4), model, MagicMock(), batch_size=4, base_delay=0.001)
+        assert stored == 4
+        assert model.batches == [4]
+
+    def test_open_circuit_is_waited_out(self):
+        model = FakeEmbedModel(failures=[CircuitOpenError("circuit open", "embeddings", retry_after=0.01)])
+        stored = embed_and_store(_nodes(4), model, MagicMock(), batch_size=4, base_delay=10)
+        assert stored == 4
+
+    def test_non_retryable_error_is_raised(self):
+        model = FakeEmbedModel(failures=[ValueError("bad input")])
+        with pytest.raises(ValueError):
+            embed_and_store(_nodes(4), model, MagicMock(), batch_size=4, base_delay=0.001)
+
+    def test_retries_are_bounded(self):
+        model = FakeEmbedModel(failures=[_throttled() for _ in range(3)])
+        with pytest.raises(HttpResponseError):
+            embed_and_store(_nodes(2), model, MagicMock(), max_retries=2, base_delay=0.001)
+
+    def test_empty_input_stores_nothing(self):
+        store = MagicMock()
+        assert embed_and_store([], FakeEmbedModel(), store) == 0
+        store.add.assert_not_called()
@@ -0,0 +1,127 @@
+import threading
+import pytest
+from fastapi import HTTPException
+from jobs import JobManager, IngestionJob
+from registry_store import RegistryStore
+
+
+class TestIngestionJob:
+    def test_update_tracks_stage_and_counts(self):
+        job = IngestionJob(job_id="j1", document_name="a.pdf")
+        job.update("embed", chunks_total=100, chunks_done=0)
+        job.update("embed", chunks_done=40)
+        data = job.to_dict()
+        assert data["stage"] == "embed"
+        assert (data["chunks_total"], data["chunks_done"]) == (100, 40)
+        assert data["eta_seconds"] is not None
+
+    def test_eta_unknown_before_embedding(self):
+        job = IngestionJob(job_id="j1", document_name="a.pdf")
+        job.update("parse")
+        assert job.eta_seconds() is None
+
+
+class TestJobManager:
+    def test_completed_job_records_document_id(self):
+        manager = JobManager(max_workers=1)
+        job = manager.submit("a.pdf", lambda job: "doc1")
+        finished = manager.wait(job.job_id, timeout=5)
+        assert finished.status == "completed"
+        assert finished.stage == "done"
+        assert finished.document_id == "doc1"
+
+    def test_failed_job_records_error(self):
+        def fail(job):
+            raise HTTPException(status_code=422, detail="empty document")
+
+        manager = JobManager(max_workers=1)
+        job = manager.submit("a.pdf", fail)
+        finished = manager.wait(job.job_id, timeout=5)
+        assert finished.status == "failed"
+        assert finished.error == "empty document"
+
+    def test_concurrent_ingestions_are_capped(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+        release = threading.Event()
+
+        def work(job):
+            with lock:
+                running.append(job.job_id)
+                peak.append(len(running))
+            release.wait(timeout=5)
+            with lock:
+                running.remove(job.job_id)
+            return job.job_id
+
+        manager = JobManager(max_workers=2, max_pending=10)
+        jobs = [manager.submit(f"{i}.pdf", work) for i in range(5)]
+        release.set()
+        for job in jobs:
+            manager.wait(job.job_id, timeout=5)
+        assert max(peak) <= 2
+
+    def test_full_queue_is_rejected_with_429(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def block(job):
+            started.set()
+            release.wait(timeout=5)
+            return "doc"
+
+        manager = JobManager(max_workers=1, max_pending=1)
+        manager.submit("running.pdf", block)
+        started.wait(timeout=5)
+        manager.submit("queued.pdf", lambda job: "doc")
+        with pytest.raises(HTTPException) as exc_info:
+            manager.submit("rejected.pdf", lambda job: "doc")
+        release.set()
+        assert exc_info.value.status_code == 429
+        assert "Retry-After" in exc_info.value.headers
+
+    def test_job_can_be_polled_through_another_worker(self, tmp_path):
+        path = str(tmp_path / "registry.sqlite3")
+        running = JobManager(max_workers=1, store=RegistryStore(path))
+        polling = JobManager(max_workers=1, store=RegistryStore(path))
+
+        def work(job):
+            job.update("embed", chunks_total=10, chunks_done=4)
+            assert polling.get(job.job_id).to_dict()["chunks_done"] == 4
+            return "doc1"
+
+        job = running.submit("a.pdf", work)
+        running.wait(job.job_id, timeout=5)
+        polled = polling.get(job.job_id).to_dict()
+        assert (polled["status"], polled["document_id"]) == ("completed", "doc1")
+        assert polling.get("missing") is None
+
+    def test_job_of_a_stopped_worker_is_reported_failed(self, tmp_path, monkeypatch):
+        store = RegistryStore(str(tmp_path / "registry.sqlite3"))
+        now = [1000.0]
+        monkeypatch.setattr("jobs.time.time", lambda: now[0])
+        # Workers that are not this process; only "live" has beaten within JOB_STALE_S
+        live = IngestionJob(job_id="live", document_name="a.pdf", status="running", owner_pid=-1, heartbeat_at=1100.0)
+        orphan = IngestionJob(job_id="orphan", document_name="b.pdf", status="running", owner_pid=-2, heartbeat_at=1000.0)
+        store.put_job("live", live.state())
+        store.put_job("orphan", orphan.state())
+        now[0] += 120
+        manager = JobManager(store=store)
+
+        assert manager.get("live").status == "running"
+        polled = manager.get("orphan").to_dict()
+        assert polled["status"] == "failed"
+        assert "stopped" in polled["error"]
+        assert store.get_job("orphan")["status"] == "failed"
+
+    def test_restarted_worker_fails_the_jobs_left_under_its_pid(self, tmp_path):
+        import os
+        store = RegistryStore(str(tmp_path / "registry.sqlite3"))
+        left = IngestionJob(job_id="left", document_name="a.pdf", status="running", owner_pid=os.getpid())
+        store.put_job("left", left.state())
+        manager = JobManager(store=store)
+
+        assert manager.fail_orphaned_jobs() == 1
+        assert store.get_job("left")["status"] == "failed"
+        assert store.active_jobs() == []
@@ -0,0 +1,90 @@
+import json
+import logging
+import queue
+import sys
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import logging_config
+from logging_config import JsonFormatter, RateLimitFilter, RequestIdMiddleware, _AsyncHandler, request_id_var
+
+
+def _record(msg="Hello %s", args=("world",), level=logging.INFO, **kwargs):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, kwargs.get("exc_info"))
+
+
+class TestAsyncHandler:
+    def test_captures_message_request_id_and_traceback_on_the_caller(self):
+        log_queue = queue.Queue()
+        handler = _AsyncHandler(log_queue)
+        token = request_id_var.set("req-1")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            handler.handle(_record(exc_info=sys.exc_info()))
+        finally:
+            request_id_var.reset(token)
+
+        entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+        assert entry["message"] == "Hello world"
+        assert entry["request_id"] == "req-1"
+        assert "ValueError: boom" in entry["exception"]
+
+    def test_full_queue_drops_and_reports_the_count(self):
+        log_queue = queue.Queue(maxsize=2)
+        handler = _AsyncHandler(log_queue)
+        for _ in range(4):
+            handler.handle(_record())
+        assert handler.dropped == 2
+        log_queue.get_nowait()
+        log_queue.get_nowait()
+
+        handler.handle(_record())
+        warning = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+        assert warning["level"] == "WARNING"
+        assert "dropped=2" in warning["message"]
+        assert log_queue.get_nowait().getMessage() == "Hello world"
+        assert handler.dropped == 0
+
+
+class TestRateLimitFilter:
+    def test_limits_each_message_template_and_counts_suppressed(self, mocker):
+        clock = mocker.patch("logging_config.time.monotonic", return_value=100.0)
+        limiter = RateLimitFilter(per_second=1.0)
+        assert limiter.filter(_record("Status %s"))
+        assert not limiter.filter(_record("Status %s"))
+        assert not limiter.filter(_record("Status %s"))
+        assert limiter.filter(_record("Other"))
+        assert limiter.filter(_record("Status %s", level=logging.WARNING))
+
+        clock.return_value = 101.0
+        record = _record("Status %s")
+        assert limiter.filter(record)
+        assert record.suppressed == 2
+        assert json.loads(JsonFormatter().format(record))["suppressed"] == 2
+
+    def test_get_logger_attaches_the_filter(self):
+        logger = logging_config.get_logger("test.rate_limited", rate_limit=2.0)
+        assert any(isinstance(f, RateLimitFilter) and f.per_second == 2.0 for f in logger.filters)
+
+
+class TestRequestIdMiddleware:
+    def _client(self):
+        app = FastAPI()
+        app.add_middleware(RequestIdMiddleware)
+
+        @app.get("/id")
+        async def current():
+            return {"request_id": request_id_var.get()}
+
+        return TestClient(app)
+
+    def test_generates_id_and_echoes_it(self):
+        response = self._client().get("/id")
+        assert response.headers["x-request-id"] == response.json()["request_id"]
+        assert len(response.json()["request_id"]) == 32
+        assert request_id_var.get() is None
+
+    def test_keeps_incoming_id_but_not_invalid_ones(self):
+        client = self._client()
+        assert client.get("/id", headers={"X-Request-ID": "abc-123"}).json()["request_id"] == "abc-123"
+        assert client.get("/id", headers={"X-Request-ID": "x" * 200}).json()["request_id"] != "x" * 200
@@ -1,61 +1,369 @@
+import asyncio
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi import HTTPException
+from resilience import CircuitOpenError, DeadlineExceeded
 
 
 class TestGetDocumentAnswer:
     def test_no_document_loaded_raises_400(self):
         import main
-        main.global_index = None
         with pytest.raises(HTTPException) as exc_info:
-            main.get_document_answer("What is this?")
+            asyncio.run(main.get_document_answer("What is this?"))
         assert exc_info.value.status_code == 400
         assert "No document" in exc_info.value.detail
 
-    def test_valid_question_returns_answer(self):
+    def test_valid_question_returns_answer(self, loaded_index):
         import main
-        main.global_index = MagicMock()
-        with patch("main.handle_document_query", return_value="The answer"):
-            result = main.get_document_answer("What is this about?")
-        assert result == "The answer"
-        main.global_index = None
+        answer = {"answer": "The answer", "sources": []}
+        with patch("main.ahandle_document_query", return_value=answer):
+            result = asyncio.run(main.get_document_answer("What is this about?"))
+        assert result == answer
 
-    def test_value_error_raises_422(self):
+    def test_value_error_raises_422(self, loaded_index):
         import main
-        main.global_index = MagicMock()
-        with patch("main.handle_document_query", side_effect=ValueError("bad input")):
+        with patch("main.ahandle_document_query", side_effect=ValueError("bad input")):
             with pytest.raises(HTTPException) as exc_info:
-                main.get_document_answer("What is this?")
+                asyncio.run(main.get_document_answer("What is this?"))
         assert exc_info.value.status_code == 422
-        main.global_index = None
 
-    def test_runtime_error_raises_500(self):
+    def test_runtime_error_raises_500(self, loaded_index):
         import main
-        main.global_index = MagicMock()
-        with patch("main.handle_document_query", side_effect=RuntimeError("LLM failed")):
+        with patch("main.ahandle_document_query", side_effect=RuntimeError("LLM failed")):
             with pytest.raises(HTTPException) as exc_info:
-                main.get_document_answer("What is this?")
+                asyncio.run(main.get_document_answer("What is this?"))
         assert exc_info.value.status_code == 500
-        main.global_index = None
+
+    def test_open_circuit_raises_503_with_retry_after(self, loaded_index):
+        import main
+        error = CircuitOpenError("circuit open", "llm", retry_after=12.4)
+        with patch("main.ahandle_document_query", side_effect=error):
+            with pytest.raises(HTTPException) as exc_info:
+                asyncio.run(main.get_document_answer("What is this?"))
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers == {"Retry-After": "12"}
+
+    def test_concurrent_identical_questions_are_answered_once(self, loaded_index):
+        import main
+        calls = []
+
+        async def answer(*args):
+            calls.append(args)
+            await asyncio.sleep(0.02)
+            return {"answer": "The answer", "sources": []}
+
+        async def ask():
+            questions = ["What is this?", "what is this", "WHAT IS THIS?!", "Something else?"]
+            return await asyncio.gather(*(main.get_document_answer(q) for q in questions))
+
+        with patch("main.ahandle_document_query", side_effect=answer):
+            results = asyncio.run(ask())
+        assert len(calls) == 2
+        assert all(result["answer"] == "The answer" for result in results)
+        assert results[0] is not results[1]
+
+    def test_spent_deadline_raises_504(self, loaded_index):
+        import main
+        with patch("main.ahandle_document_query", side_effect=DeadlineExceeded("too slow", "llm")):
+            with pytest.raises(HTTPException) as exc_info:
+                asyncio.run(main.get_document_answer("What is this?"))
+        assert exc_info.value.status_code == 504
+
+
+class TestCreateIndexFromDocument:
+    def test_registers_document_with_its_index(self, registry):
+        import main
+        mock_index = MagicMock()
+        with patch("main.load_document", return_value=[]), \
+             patch("main.connect_chromadb_create_index", return_value=(mock_index, 12)):
+            document_id = main.create_index_from_document("/tmp/tmpab12.pdf", "manual.pdf")
+        record = registry.record(document_id)
+        assert record.document_name == "manual.pdf"
+        assert record.chunk_count == 12
+        assert registry.get(document_id) is mock_index
+
+    def test_each_upload_gets_its_own_document_id(self, registry):
+        import main
+        with patch("main.load_document", return_value=[]), \
+             patch("main.connect_chromadb_create_index", return_value=(MagicMock(), 1)):
+            first = main.create_index_from_document("/tmp/a.pdf", "a.pdf")
+            second = main.create_index_from_document("/tmp/b.pdf", "b.pdf")
+        assert first != second
+        assert len(registry.records()) == 2
+
+
+class TestNormaliseDocumentMetadata:
+    def test_temp_path_is_dropped_and_name_restored(self):
+        import main
+        from llama_index.core import Document
+        from llama_index.core.schema import MetadataMode
+        document = Document(text="Body", metadata={
+            "file_path": "/tmp/tmpab12.pdf", "file_name": "tmpab12.pdf", "page_label": "3",
+        })
+        main.normalise_document_metadata([document], "manual.pdf")
+        assert document.metadata["file_name"] == "manual.pdf"
+        assert "tmpab12" not in document.get_content(MetadataMode.EMBED)
+        assert document.metadata["page_label"] == "3"
+
+
+class TestRehydrateRegistry:
+    def _descriptions(self):
+        return [
+            {"document_id": "old", "document_name": "old.pdf", "created_at": 1.0, "chunk_count": 3},
+            {"document_id": "new", "document_name": "new.pdf", "created_at": 2.0, "chunk_count": 5},
+        ]
+
+    def test_restores_records_from_persisted_collections(self, registry):
+        import main
+        with patch("main.list_document_collections", return_value=self._descriptions()):
+            main.rehydrate_registry()
+        assert registry.record("old").document_name == "old.pdf"
+        assert registry.latest().document_id == "new"
+        assert registry.latest().chunk_count == 5
+
+    def test_preloads_only_the_most_recent_handles(self, registry):
+        import main
+        with patch("main.list_document_collections", return_value=self._descriptions()), \
+             patch("main.WARM_START_PRELOAD", 1):
+            main.rehydrate_registry()
+        registry._loader.assert_called_once_with("new")
+
+    def test_does_not_override_documents_uploaded_meanwhile(self, registry, loaded_index):
+        import main
+        persisted = [{"document_id": "doc1", "document_name": "stale.pdf", "created_at": 0.0, "chunk_count": 1}]
+        with patch("main.list_document_collections", return_value=persisted):
+            main.rehydrate_registry()
+        assert registry.record("doc1").document_name == "report.pdf"
+
+    def test_listing_failure_is_logged_not_raised(self, registry):
+        import main
+        with patch("main.list_document_collections", side_effect=RuntimeError("DB error")):
+            main.rehydrate_registry()
+        assert registry.records() == []
+
+
+class TestLookupDocument:
+    def test_unrestored_document_is_found_in_persisted_store(self, registry):
+        import main
+        description = {"document_id": "abc", "document_name": "manual.pdf", "created_at": 1.0, "chunk_count": 4}
+        with patch("main.describe_document_collection", return_value=description):
+            record = main.lookup_document("abc")
+        assert record.document_name == "manual.pdf"
+        assert registry.record("abc") is record
+
+    def test_requests_look_documents_up_off_the_event_loop(self, registry):
+        import main
+        import threading
+        threads = []
+
+        def describe(document_id):
+            threads.append(threading.current_thread())
+            return {"document_id": document_id, "document_name": "manual.pdf", "created_at": 1.0, "chunk_count": 4}
+
+        with patch("main.describe_document_collection", side_effect=describe):
+            record = asyncio.run(main.resolve_document("abc"))
+        assert record.document_name == "manual.pdf"
+        assert threads and threads[0] is not threading.main_thread()
 
 
 class TestGetGeneralAnswer:
     def test_valid_question_returns_answer(self):
         import main
-        with patch("main.handle_general_query", return_value="General answer"):
-            result = main.get_general_answer("What is Python?")
+        with patch("main.ahandle_general_query", return_value="General answer"):
+            result = asyncio.run(main.get_general_answer("What is Python?"))
         assert result == "General answer"
 
     def test_value_error_raises_422(self):
         import main
-        with patch("main.handle_general_query", side_effect=ValueError("bad input")):
+        with patch("main.ahandle_general_query", side_effect=ValueError("bad input")):
             with pytest.raises(HTTPException) as exc_info:
-                main.get_general_answer("What is Python?")
+                asyncio.run(main.get_general_answer("What is Python?"))
         assert exc_info.value.status_code == 422
 
     def test_runtime_error_raises_500(self):
         import main
-        with patch("main.handle_general_query", side_effect=RuntimeError("LLM failed")):
+        with patch("main.ahandle_general_query", side_effect=RuntimeError("LLM failed")):
             with pytest.raises(HTTPException) as exc_info:
-                main.get_general_answer("What is Python?")
+                asyncio.run(main.get_general_answer("What is Python?"))
         assert exc_info.value.status_code == 500
+
+
+class TestAnswerCaching:
+    def test_repeated_document_question_is_answered_from_cache(self, loaded_index):
+        import main
+        answer = {"answer": "30 days", "sources": [{"page": "2", "preview": "Refunds"}]}
+        with patch("main.ahandle_document_query", return_value=answer) as mock_query:
+            asyncio.run(main.get_document_answer("What is the refund policy?"))
+            result = asyncio.run(main.get_document_answer("what is the refund policy"))
+        assert result == answer
+        mock_query.assert_called_once()
+
+    def test_new_document_version_misses(self, registry, loaded_index):
+        import main
+        from index_registry import DocumentRecord
+        with patch("main.ahandle_document_query", return_value={"answer": "A", "sources": []}) as mock_query:
+            asyncio.run(main.get_document_answer("Q?", "doc1"))
+            registry.register(DocumentRecord("doc1", "report.pdf", content_hash="v2"), index=MagicMock())
+            asyncio.run(main.get_document_answer("Q?", "doc1"))
+        assert mock_query.call_count == 2
+
+    def test_empty_answers_are_not_cached(self, loaded_index):
+        import main
+        with patch("main.ahandle_document_query", return_value={"answer": "", "sources": []}) as mock_query:
+            asyncio.run(main.get_document_answer("Q?"))
+            asyncio.run(main.get_document_answer("Q?"))
+        assert mock_query.call_count == 2
+
+    def test_repeated_general_question_is_answered_from_cache(self):
+        import main
+        with patch("main.ahandle_general_query", return_value="General answer") as mock_query:
+            asyncio.run(main.get_general_answer("What is Python?"))
+            result = asyncio.run(main.get_general_answer("What is Python"))
+        assert result == "General answer"
+        mock_query.assert_called_once()
+
+    def test_semantic_mode_matches_paraphrases(self):
+        import main
+        from answer_cache import AnswerCache
+        embeddings = {"What is the refund policy?": [1.0, 0.0], "What's the refund policy": [0.99, 0.05]}
+
+        async def embed(question):
+            return embeddings[question]
+
+        with patch("main.answer_cache", AnswerCache(semantic_threshold=0.95)), \
+             patch("main.embed_question", side_effect=embed), \
+             patch("main.ahandle_general_query", return_value="30 days") as mock_query:
+            asyncio.run(main.get_general_answer("What is the refund policy?"))
+            result = asyncio.run(main.get_general_answer("What's the refund policy"))
+        assert result == "30 days"
+        mock_query.assert_called_once()
+
+
+class TestLexicalFastPathWithSemanticCache:
+    def _run(self, registry, question):
+        import main
+        from answer_cache import AnswerCache
+        from llama_index.core.schema import TextNode
+        from hybrid_retrieval import HybridIndex, LexicalIndex
+        from index_registry import DocumentRecord
+        chunks = [
+            "Refunds are issued within 30 days of delivery.",
+            "Replacement part XJ-2044 fits all models built after 2019.",
+            "The warranty covers manufacturing defects for two years.",
+        ]
+        index = HybridIndex(MagicMock(), LexicalIndex([TextNode(text=text) for text in chunks]))
+        registry.register(DocumentRecord(document_id="doc1", document_name="manual.pdf"), index=index)
+        model = MagicMock(aget_query_embedding=AsyncMock(return_value=[1.0, 0.0]))
+        answer = {"answer": "Yes.", "sources": []}
+        with patch("main.answer_cache", AnswerCache(semantic_threshold=0.95)), \
+             patch("main.get_embed_model", AsyncMock(return_value=model)), \
+             patch("main.ahandle_document_query", return_value=answer):
+            assert asyncio.run(main.get_document_answer(question, reranker="none")) == answer
+        return model
+
+    def test_confident_lexical_hit_is_never_embedded(self, registry):
+        model = self._run(registry, "Does part XJ-2044 fit?")
+        model.aget_query_embedding.assert_not_called()
+
+    def test_other_questions_are_embedded_for_the_cache(self, registry):
+        model = self._run(registry, "How long until I get my money back?")
+        model.aget_query_embedding.assert_awaited_once()
+
+
+class TestEmbedQuestion:
+    def test_first_call_builds_the_model_off_the_event_loop(self):
+        import threading
+        import main
+        model = MagicMock(aget_query_embedding=AsyncMock(return_value=[1.0, 0.0]))
+        threads = []
+
+        def build():
+            threads.append(threading.current_thread())
+            return model
+
+        with patch("main.answer_cache", MagicMock(semantic=True)), \
+             patch("main.embed_model_ready", return_value=False), \
+             patch("main.configure_index_settings", side_effect=build):
+            assert asyncio.run(main.embed_question("Q?")) == [1.0, 0.0]
+        assert threads and threads[0] is not threading.main_thread()
+
+
+class TestChatSessions:
+    @pytest.fixture(autouse=True)
+    def sessions(self):
+        from sessions import SessionStore
+        with patch("main.chat_sessions", SessionStore()) as sessions:
+            yield sessions
+
+    def test_document_follow_up_is_rewritten_with_the_history(self, loaded_index, sessions):
+        import main
+        answer = {"answer": "30 days", "sources": [{"page": "4", "preview": "Refunds"}]}
+
+        async def run():
+            session = await sessions.get("chat-1")
+            await main.get_document_answer("What is the refund policy?", session=session)
+            await main.get_document_answer("And on page 4?", session=session)
+            return session
+
+        with patch("main.ahandle_document_query", return_value=answer) as mock_query, \
+             patch("main.acondense_question", return_value="What is the refund policy on page 4?") as mock_condense:
+            session = asyncio.run(run())
+
+        mock_condense.assert_called_once()
+        assert mock_condense.call_args.args[0] == "And on page 4?"
+        assert mock_query.call_args.args[1] == "What is the refund policy on page 4?"
+        assert [turn.question for turn in session.turns] == ["What is the refund policy?", "And on page 4?"]
+
+    def test_general_follow_up_sends_the_history_and_skips_the_cache(self, sessions):
+        import main
+
+        async def run():
+            session = await sessions.get("chat-1")
+            await main.get_general_answer("What is Python?", session)
+            await main.get_general_answer("What is Python?", session)
+
+        with patch("main.ahandle_general_query", return_value="A language.") as mock_query:
+            asyncio.run(run())
+
+        assert mock_query.call_count == 2
+        history = mock_query.call_args.args[2]
+        assert [message.content for message in history] == ["What is Python?", "A language."]
+
+
+class TestLazyClients:
+    def test_clients_are_created_once_on_first_use(self, monkeypatch):
+        import main
+        monkeypatch.setattr(main, "_llm", None)
+        monkeypatch.setattr(main, "_rerankers", None)
+        llm = MagicMock()
+        with patch("main.initialize_llm", return_value=llm) as mock_init, \
+             patch("main.build_rerankers", return_value={"bm25": "bm25"}) as mock_build:
+            assert not main.clients_ready()
+            assert asyncio.run(main.get_clients()) == (llm, {"bm25": "bm25"})
+            asyncio.run(main.get_clients())
+        mock_init.assert_called_once()
+        mock_build.assert_called_once()
+        assert main.clients_ready()
+
+    def test_warm_up_failure_is_logged_not_raised(self, monkeypatch):
+        import main
+        monkeypatch.setattr(main, "_rerankers", None)
+        with patch("main.get_rerankers", side_effect=RuntimeError("unreachable")):
+            main.warm_up()
+        assert not main.clients_ready()
+
+    def test_numpy_only_warm_up_skips_chroma(self, monkeypatch):
+        import main
+        monkeypatch.setattr(main, "_rerankers", None)
+        with patch("main.get_rerankers"), patch("main.configure_index_settings"), \
+             patch("main.chroma_enabled", return_value=False), patch("main.get_chroma_client") as mock_chroma:
+            main.warm_up()
+        mock_chroma.assert_not_called()
+
+    def test_startup_fails_without_azure_settings(self):
+        import main
+        from fastapi.testclient import TestClient
+        with patch("main.validate_environment", side_effect=EnvironmentError("missing")), \
+             pytest.raises(EnvironmentError):
+            with TestClient(main.app):
+                pass
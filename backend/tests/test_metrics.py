@@ -0,0 +1,83 @@
+import asyncio
+import os
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent
+from llama_index.core.llms import ChatMessage, ChatResponse
+from prometheus_client import REGISTRY
+import metrics
+from metrics import IngestionTimer, StageTimings, track_stages
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestStageTimings:
+    def test_outermost_spans_and_rerank_gap(self):
+        timings = StageTimings("document_query")
+        for name, at in [
+            ("RetrievalStartEvent", 0.0),
+            ("EmbeddingStartEvent", 0.1),
+            ("EmbeddingStartEvent", 0.15),  # wrapped model
+            ("EmbeddingEndEvent", 0.25),
+            ("EmbeddingEndEvent", 0.3),
+            ("RetrievalStartEvent", 0.35),  # nested vector retriever
+            ("RetrievalEndEvent", 0.45),
+            ("RetrievalEndEvent", 0.5),
+            ("SynthesizeStartEvent", 0.7),
+            ("SynthesizeEndEvent", 1.7),
+        ]:
+            timings.event(name, at)
+        assert timings.seconds == {
+            "embed": 0.3 - 0.1, "retrieve": 0.5, "rerank": 0.7 - 0.5, "synthesize": 1.0,
+        }
+
+    def test_track_stages_records_histograms_per_task(self):
+        async def request(name, delay):
+            with track_stages("test_op") as timings:
+                with metrics.stage(name):
+                    await asyncio.sleep(delay)
+            return timings
+
+        async def both():
+            return await asyncio.gather(request("first", 0.01), request("second", 0.02))
+
+        before = _sample("rag_stage_duration_seconds_count", operation="test_op", stage="total")
+        first, second = asyncio.run(both())
+        assert set(first.seconds) == {"first", "total"}
+        assert set(second.seconds) == {"second", "total"}
+        assert _sample("rag_stage_duration_seconds_count", operation="test_op", stage="total") == before + 2
+
+    def test_llm_tokens_from_reported_usage(self):
+        before = _sample("rag_llm_tokens_total", kind="completion")
+        response = ChatResponse(
+            message=ChatMessage(role="assistant", content="Hi"),
+            raw={"usage": {"prompt_tokens": 12, "completion_tokens": 5}},
+        )
+        with track_stages("test_tokens") as timings:
+            metrics._EventHandler().handle(LLMChatEndEvent(messages=[], response=response))
+        assert timings.to_dict()["completion_tokens"] == 5
+        assert timings.to_dict()["prompt_tokens"] == 12
+        assert _sample("rag_llm_tokens_total", kind="completion") == before + 5
+
+
+class TestIngestionTimer:
+    def test_records_each_stage_once_and_chunk_counts(self):
+        seen = []
+        timer = IngestionTimer(lambda stage, **counts: seen.append(stage))
+        before = _sample("rag_stage_duration_seconds_count", operation="ingest", stage="embed")
+        chunks_before = _sample("rag_ingested_chunks_total")
+        for stage in ("parse", "chunk", "embed", "embed", "embed", "store"):
+            timer(stage)
+        timer.finish(42)
+        assert seen == ["parse", "chunk", "embed", "embed", "embed", "store"]
+        assert _sample("rag_stage_duration_seconds_count", operation="ingest", stage="embed") == before + 1
+        assert _sample("rag_ingested_chunks_total") == chunks_before + 42
+
+
+class TestRenderMetrics:
+    def test_multiprocess_mode_labels_per_process_caches_with_pid(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+        monkeypatch.setattr(metrics, "MULTIPROCESS", True)
+        monkeypatch.setitem(metrics._cache_collector.sources, "test", lambda: {"hits": 3, "misses": 1, "entries": 2})
+        body = metrics.render_metrics().decode()
+        assert f'rag_cache_hits_total{{cache="test",pid="{os.getpid()}"}} 3.0' in body
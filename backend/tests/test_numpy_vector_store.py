@@ -0,0 +1,121 @@
+import os
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import (
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+)
+from numpy_vector_store import MANIFEST_FILE, NumpyVectorStore, mmr_select, top_k_indices
+
+
+def _nodes(vectors):
+    return [
+        TextNode(text=f"chunk {i}", id_=f"n{i}", metadata={"page_label": str(i + 1)}, embedding=list(vector))
+        for i, vector in enumerate(vectors)
+    ]
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(200, 16)).astype(np.float32)
+
+
+@pytest.fixture
+def store(tmp_path, vectors):
+    store = NumpyVectorStore.create(str(tmp_path / "doc_1"), {"document_name": "manual.pdf"})
+    store.add(_nodes(vectors[:120]))
+    store.add(_nodes(vectors)[120:])
+    store.flush()
+    return store
+
+
+class TestTopKIndices:
+    def test_matches_full_sort(self):
+        scores = np.random.default_rng(1).normal(size=500)
+        assert list(top_k_indices(scores, 7)) == list(np.argsort(-scores)[:7])
+
+    def test_k_larger_than_scores(self):
+        assert list(top_k_indices(np.array([0.1, 0.9]), 5)) == [1, 0]
+
+
+class TestMMRSelect:
+    def test_skips_near_duplicates(self):
+        angles = np.radians([0.0, 2.0, 60.0])
+        embeddings = np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+        similarities = embeddings @ np.array([np.cos(np.radians(26)), np.sin(np.radians(26))], dtype=np.float32)
+        # Chunk 0 is the second most similar, but nearly a copy of chunk 1
+        assert list(mmr_select(similarities, embeddings, 2, lambda_mult=0.5)) == [1, 2]
+
+    def test_lambda_one_is_plain_top_k(self, vectors):
+        unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarities = unit @ unit[0]
+        assert list(mmr_select(similarities, unit, 5, lambda_mult=1.0)) == list(top_k_indices(similarities, 5))
+
+
+class TestNumpyVectorStore:
+    def test_query_returns_exact_top_k(self, store, vectors):
+        query = vectors[3] + 0.1
+        result = store.query(VectorStoreQuery(query_embedding=list(query), similarity_top_k=5))
+        unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(unit @ (query / np.linalg.norm(query))))[:5]
+        assert result.ids == [f"n{i}" for i in expected]
+        assert result.nodes[0].metadata["page_label"] == str(expected[0] + 1)
+        assert result.similarities == sorted(result.similarities, reverse=True)
+
+    def test_mmr_query(self, store, vectors):
+        result = store.query(VectorStoreQuery(
+            query_embedding=list(vectors[0]), similarity_top_k=4, mode=VectorStoreQueryMode.MMR, mmr_threshold=0.5,
+        ))
+        assert result.ids[0] == "n0"
+        assert len(set(result.ids)) == 4
+
+    def test_reopened_store_is_memory_mapped(self, store, vectors):
+        reopened = NumpyVectorStore.open(store.path)
+        assert isinstance(reopened._embeddings, np.memmap)
+        assert reopened.count() == 200
+        assert reopened.manifest == {"document_name": "manual.pdf", "chunk_count": 200}
+        result = reopened.query(VectorStoreQuery(query_embedding=list(vectors[42]), similarity_top_k=1))
+        assert result.ids == ["n42"]
+        assert [node.text for node in reopened.nodes()][:2] == ["chunk 0", "chunk 1"]
+
+    def test_unflushed_store_does_not_exist(self, tmp_path, vectors):
+        store = NumpyVectorStore.create(str(tmp_path / "doc_2"), {})
+        store.add(_nodes(vectors[:3]))
+        assert not NumpyVectorStore.exists(store.path)
+        store.flush()
+        assert os.path.exists(os.path.join(store.path, MANIFEST_FILE))
+        assert NumpyVectorStore.read_manifest(store.path)["chunk_count"] == 3
+
+    def test_filters_are_rejected(self, store, vectors):
+        filters = MetadataFilters(filters=[MetadataFilter(key="page_label", value="1")])
+        with pytest.raises(NotImplementedError):
+            store.query(VectorStoreQuery(query_embedding=list(vectors[0]), similarity_top_k=1, filters=filters))
+
+    def test_clear_removes_files(self, store):
+        store.clear()
+        assert not os.path.exists(store.path)
+        assert store.count() == 0
+
+    def test_async_query_of_a_large_store_runs_on_a_thread(self, store, vectors, monkeypatch):
+        import asyncio
+        import threading
+        query = VectorStoreQuery(query_embedding=list(vectors[7]), similarity_top_k=1)
+        threads = []
+        search = NumpyVectorStore.query
+
+        def query_on(self, *args, **kwargs):
+            threads.append(threading.current_thread())
+            return search(self, *args, **kwargs)
+
+        monkeypatch.setattr(NumpyVectorStore, "query", query_on)
+        monkeypatch.setattr("numpy_vector_store.ASYNC_QUERY_THREAD_MIN_CHUNKS", 100)
+        result = asyncio.run(store.aquery(query))
+        monkeypatch.setattr("numpy_vector_store.ASYNC_QUERY_THREAD_MIN_CHUNKS", 1000)
+        asyncio.run(store.aquery(query))
+
+        assert result.ids == ["n7"]
+        assert threads[0] is not threading.main_thread()
+        assert threads[1] is threading.main_thread()
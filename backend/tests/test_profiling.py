@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import profiling
+from profiling import ProfilingMiddleware, StackSampler
+
+
+def _busy_work():
+    end = time.perf_counter() + 0.1
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(profiling, "PROFILE_INTERVAL_MS", 1.0)
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+
+    @app.get("/work")
+    def work():
+        _busy_work()
+        return {"ok": True}
+
+    @app.get("/loop")
+    async def loop():
+        return {"thread": threading.current_thread().name}
+
+    return TestClient(app)
+
+
+def _wait_for_writer():
+    # The writer releases the lock once the artifacts are on disk
+    assert profiling._profile_lock.acquire(timeout=5)
+    profiling._profile_lock.release()
+
+
+class TestStackSampler:
+    def test_samples_other_threads_wall_clock_stacks(self):
+        sampler = StackSampler(0.001)
+        worker = threading.Thread(target=_busy_work, name="worker")
+        sampler.start()
+        worker.start()
+        worker.join()
+        sampler.stop()
+        assert sampler.samples > 0
+        assert any(stack.startswith("worker;") and "_busy_work (test_profiling.py" in stack for stack in sampler.stacks)
+        assert not any(stack.startswith("profiler;") for stack in sampler.stacks)
+
+
+class TestProfilingMiddleware:
+    def test_unprofiled_request_writes_nothing(self, client, tmp_path):
+        response = client.get("/work")
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+        assert list(tmp_path.iterdir()) == []
+
+    def test_header_requires_the_configured_token(self, client, tmp_path):
+        response = client.get("/work", headers={"X-Profile": "wrong"})
+        assert "x-profile-id" not in response.headers
+        profiling.PROFILE_TOKEN = ""
+        response = client.get("/work", headers={"X-Profile": ""})
+        assert "x-profile-id" not in response.headers
+
+    def test_header_profiles_request_to_files(self, client, tmp_path):
+        response = client.get("/work", headers={"X-Profile": "secret"})
+        assert response.status_code == 200
+        request_id = response.headers["x-profile-id"]
+        _wait_for_writer()
+
+        summary = json.loads((tmp_path / f"{request_id}.json").read_text())
+        assert summary["path"] == "/work"
+        assert summary["status"] == 200
+        assert summary["reason"] == "header"
+        assert summary["samples"] > 0
+        wall = (tmp_path / f"{request_id}.wall.collapsed").read_text().splitlines()
+        assert any("_busy_work (test_profiling.py" in line for line in wall)
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in wall)
+        assert (tmp_path / f"{request_id}.alloc.collapsed").exists()
+
+    def test_sample_rate_profiles_without_header(self, client, tmp_path):
+        profiling.PROFILE_SAMPLE_RATE = 1.0
+        response = client.get("/work")
+        request_id = response.headers["x-profile-id"]
+        _wait_for_writer()
+        assert json.loads((tmp_path / f"{request_id}.json").read_text())["reason"] == "sampled"
+
+    def test_only_one_request_is_profiled_at_a_time(self, client, tmp_path):
+        assert profiling._profile_lock.acquire(blocking=False)
+        try:
+            response = client.get("/work", headers={"X-Profile": "secret"})
+        finally:
+            profiling._profile_lock.release()
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+        assert list(tmp_path.iterdir()) == []
+
+    def test_snapshot_is_taken_off_the_event_loop(self, client, monkeypatch):
+        threads = []
+        stop = profiling.RequestProfile.stop
+
+        def stop_on(self):
+            threads.append(threading.current_thread().name)
+            stop(self)
+
+        monkeypatch.setattr(profiling.RequestProfile, "stop", stop_on)
+        response = client.get("/loop", headers={"X-Profile": "secret"})
+        _wait_for_writer()
+        assert threads and threads[0] != response.json()["thread"]
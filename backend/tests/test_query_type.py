@@ -1,6 +1,15 @@
+import asyncio
 import pytest
-from unittest.mock import MagicMock
-from query_type import handle_general_query, handle_document_query
+from unittest.mock import AsyncMock, MagicMock
+from query_type import (
+    handle_general_query,
+    handle_document_query,
+    ahandle_general_query,
+    ahandle_document_query,
+    astream_general_query,
+    astream_document_query,
+    acondense_question,
+)
 
 
 class TestHandleGeneralQuery:
@@ -105,3 +114,159 @@ class TestHandleDocumentQuery:
         mock_engine.query.return_value = self._make_mock_response("Answer")
         handle_document_query(mock_index, "  Question?  ", mock_llm)
         mock_engine.query.assert_called_once_with("Question?")
+
+
+class TestAsyncHandleGeneralQuery:
+    def test_valid_prompt_awaits_achat(self):
+        mock_llm = MagicMock()
+        mock_llm.achat = AsyncMock(return_value=MagicMock(message=MagicMock(content="Hello!")))
+        result = asyncio.run(ahandle_general_query("What is Python?", mock_llm))
+        assert result == "Hello!"
+        mock_llm.chat.assert_not_called()
+
+    def test_empty_prompt_raises_value_error(self):
+        with pytest.raises(ValueError, match="Prompt cannot be empty"):
+            asyncio.run(ahandle_general_query("  ", MagicMock()))
+
+    def test_llm_exception_raises_runtime_error(self):
+        mock_llm = MagicMock()
+        mock_llm.achat = AsyncMock(side_effect=Exception("API connection error"))
+        with pytest.raises(RuntimeError, match="LLM call failed for general query"):
+            asyncio.run(ahandle_general_query("What is Python?", mock_llm))
+
+
+class TestCondenseQuestion:
+    def test_follow_up_is_rewritten_with_the_conversation(self):
+        from llama_index.core.llms import ChatMessage
+        mock_llm = MagicMock()
+        mock_llm.achat = AsyncMock(return_value=MagicMock(message=MagicMock(content=" What is on page 4? ")))
+        history = [
+            ChatMessage(role="user", content="Summarize the report."),
+            ChatMessage(role="assistant", content="It covers refunds."),
+        ]
+        result = asyncio.run(acondense_question("And page 4?", history, mock_llm))
+        assert result == "What is on page 4?"
+        prompt = mock_llm.achat.call_args.args[0][-1].content
+        assert "User: Summarize the report." in prompt and "Follow-up question: And page 4?" in prompt
+
+    def test_empty_rewrite_falls_back_to_the_question(self):
+        mock_llm = MagicMock()
+        mock_llm.achat = AsyncMock(return_value=MagicMock(message=MagicMock(content="")))
+        assert asyncio.run(acondense_question("And page 4?", [], mock_llm)) == "And page 4?"
+
+
+class TestAsyncHandleDocumentQuery:
+    def test_valid_params_awaits_aquery(self):
+        mock_index = MagicMock()
+        mock_engine = MagicMock()
+        mock_index.as_query_engine.return_value = mock_engine
+        mock_response = MagicMock(response="Hello World", source_nodes=[])
+        mock_engine.aquery = AsyncMock(return_value=mock_response)
+        result = asyncio.run(ahandle_document_query(mock_index, "  Question?  ", MagicMock()))
+        assert result == {"answer": "Hello World", "sources": []}
+        mock_engine.aquery.assert_awaited_once_with("Question?")
+        mock_engine.query.assert_not_called()
+
+    def test_none_index_raises_value_error(self):
+        with pytest.raises(ValueError, match="Index is required"):
+            asyncio.run(ahandle_document_query(None, "Question?", MagicMock()))
+
+    def test_engine_exception_raises_runtime_error(self):
+        mock_index = MagicMock()
+        mock_index.as_query_engine.return_value.aquery = AsyncMock(side_effect=Exception("boom"))
+        with pytest.raises(RuntimeError, match="LLM call failed for document query"):
+            asyncio.run(ahandle_document_query(mock_index, "Question?", MagicMock()))
+
+
+async def _collect(token_gen):
+    return [token async for token in token_gen]
+
+
+class TestStreamQueries:
+    def test_general_stream_yields_deltas(self):
+        async def chunks():
+            for delta in ["Hel", "", "lo"]:
+                yield MagicMock(delta=delta)
+
+        async def run():
+            mock_llm = MagicMock()
+            mock_llm.astream_chat = AsyncMock(return_value=chunks())
+            return await _collect(await astream_general_query("Hi?", mock_llm))
+
+        assert asyncio.run(run()) == ["Hel", "lo"]
+
+    def test_general_stream_start_failure_raises_runtime_error(self):
+        mock_llm = MagicMock()
+        mock_llm.astream_chat = AsyncMock(side_effect=Exception("API down"))
+        with pytest.raises(RuntimeError, match="LLM call failed for general query"):
+            asyncio.run(astream_general_query("Hi?", mock_llm))
+
+    def test_document_stream_returns_sources_before_tokens(self):
+        async def tokens():
+            yield "Answer"
+
+        node = MagicMock()
+        node.node.metadata = {"page_label": "4"}
+        node.node.get_content.return_value = "Page four text"
+        mock_index = MagicMock()
+        mock_engine = mock_index.as_query_engine.return_value
+        mock_engine.aquery = AsyncMock(return_value=MagicMock(
+            source_nodes=[node], async_response_gen=lambda: tokens()
+        ))
+
+        async def run():
+            sources, token_gen = await astream_document_query(mock_index, "Question?", MagicMock())
+            return sources, await _collect(token_gen)
+
+        sources, tokens_out = asyncio.run(run())
+        assert sources == [{"page": "4", "preview": "Page four text"}]
+        assert tokens_out == ["Answer"]
+        assert mock_index.as_query_engine.call_args.kwargs["streaming"] is True
+
+
+class TestQueryEngineCache:
+    def test_engine_is_built_once_per_index_and_configuration(self):
+        mock_index = MagicMock()
+        mock_llm = MagicMock()
+        handle_document_query(mock_index, "First?", mock_llm)
+        handle_document_query(mock_index, "Second?", mock_llm)
+        mock_index.as_query_engine.assert_called_once()
+
+    def test_different_configurations_get_their_own_engines(self):
+        from query_type import _build_query_engine
+        mock_index = MagicMock()
+        mock_llm = MagicMock()
+        reranker = MagicMock()
+        plain = _build_query_engine(mock_index, mock_llm)
+        _build_query_engine(mock_index, mock_llm, reranker)
+        _build_query_engine(mock_index, mock_llm, streaming=True)
+        _build_query_engine(mock_index, mock_llm, mmr=False)
+        assert mock_index.as_query_engine.call_count == 4
+        assert _build_query_engine(mock_index, mock_llm) is plain
+
+    def test_engines_live_on_their_index(self):
+        from query_type import _build_query_engine
+        first, second = MagicMock(), MagicMock()
+        assert _build_query_engine(first, MagicMock()) is not _build_query_engine(second, MagicMock())
+        assert len(first._query_engines) == 1
+
+    def test_concurrent_requests_share_one_engine(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from query_type import _build_query_engine
+        mock_index = MagicMock()
+        mock_llm = MagicMock()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            engines = list(pool.map(lambda _: _build_query_engine(mock_index, mock_llm), range(32)))
+        assert all(engine is engines[0] for engine in engines)
+        mock_index.as_query_engine.assert_called_once()
+
+    def test_failed_build_is_not_cached(self):
+        mock_index = MagicMock()
+        engine = MagicMock()
+        engine.query.return_value.response = "A"
+        engine.query.return_value.source_nodes = []
+        mock_index.as_query_engine.side_effect = [Exception("boom"), engine]
+        mock_llm = MagicMock()
+        with pytest.raises(RuntimeError):
+            handle_document_query(mock_index, "Q?", mock_llm)
+        assert handle_document_query(mock_index, "Q?", mock_llm)["answer"] == "A"
@@ -0,0 +1,40 @@
+from index_registry import DocumentRecord
+from registry_store import RegistryStore
+
+
+class TestRegistryStore:
+    def test_version_changes_on_other_connections_commits(self, tmp_path):
+        path = str(tmp_path / "registry.sqlite3")
+        reader, writer = RegistryStore(path), RegistryStore(path)
+        before = reader.version()
+        writer.put_document(DocumentRecord(document_id="a", document_name="a.pdf", chunk_count=2, content_hash="h"))
+        assert reader.version() != before
+        assert reader.documents() == [{
+            "document_id": "a", "document_name": "a.pdf", "chunk_count": 2,
+            "created_at": writer.documents()[0]["created_at"], "content_hash": "h",
+        }]
+
+    def test_put_document_without_replace_keeps_existing(self):
+        store = RegistryStore(":memory:")
+        assert store.put_document(DocumentRecord(document_id="a", document_name="a.pdf"))
+        assert not store.put_document(DocumentRecord(document_id="a", document_name="b.pdf"), replace=False)
+        assert store.documents()[0]["document_name"] == "a.pdf"
+        store.delete_document("a")
+        assert store.documents() == []
+
+    def test_job_history_is_trimmed(self):
+        store = RegistryStore(":memory:", job_history_limit=2)
+        for job_id in ("j1", "j2", "j3"):
+            store.put_job(job_id, {"job_id": job_id})
+        store.put_job("j3", {"job_id": "j3", "status": "completed"})
+        assert store.get_job("j1") is None
+        assert store.get_job("j3") == {"job_id": "j3", "status": "completed"}
+
+    def test_idle_sessions_expire(self, monkeypatch):
+        store = RegistryStore(":memory:")
+        store.put_session("old", {"turns": []}, idle_ttl=60)
+        monkeypatch.setattr("registry_store.time.time", lambda: 10_000_000_000.0)
+        assert store.get_session("old", idle_ttl=60) is None
+        store.put_session("new", {"turns": []}, idle_ttl=60)
+        assert store.get_session("new", idle_ttl=60) == {"turns": []}
+        assert store._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 1
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Any
+import pytest
+from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from rerankers import BM25Rerank, ParallelLLMRerank, build_rerankers
+
+
+class SlowChoiceLLM(CustomLLM):
+    """Answers every choice-select prompt after `delay` seconds, preferring the batch's 2nd chunk."""
+
+    delay: float = 0.0
+    answer: str = "Doc: 2, Relevance: 9\nDoc: 1, Relevance: 4"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata()
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.delay)
+        return CompletionResponse(text=self.answer)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await asyncio.sleep(self.delay)
+        return CompletionResponse(text=self.answer)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        raise NotImplementedError
+
+
+def _nodes(*texts):
+    return [NodeWithScore(node=TextNode(text=text, id_=f"n{i}"), score=1.0 - i * 0.01) for i, text in enumerate(texts)]
+
+
+class TestParallelLLMRerank:
+    def test_batches_run_concurrently(self):
+        reranker = ParallelLLMRerank(llm=SlowChoiceLLM(delay=0.2), choice_batch_size=2, top_n=3)
+        nodes = _nodes("a", "b", "c", "d", "e", "f")
+        start = time.perf_counter()
+        result = reranker.postprocess_nodes(nodes, QueryBundle("q"))
+        assert time.perf_counter() - start < 0.45
+        assert [n.node.id_ for n in result] == ["n1", "n3", "n5"]
+
+    def test_async_batches_run_concurrently(self):
+        reranker = ParallelLLMRerank(llm=SlowChoiceLLM(delay=0.2), choice_batch_size=2, top_n=2)
+        start = time.perf_counter()
+        result = asyncio.run(reranker.apostprocess_nodes(_nodes("a", "b", "c", "d", "e", "f"), QueryBundle("q")))
+        assert time.perf_counter() - start < 0.45
+        assert len(result) == 2
+
+    def test_unparseable_answers_keep_retrieval_order(self):
+        reranker = ParallelLLMRerank(llm=SlowChoiceLLM(answer="Doc: 9, Relevance: 9"), choice_batch_size=2, top_n=2)
+        result = reranker.postprocess_nodes(_nodes("a", "b", "c"), QueryBundle("q"))
+        assert [n.node.id_ for n in result] == ["n0", "n1"]
+
+    def test_requires_query(self):
+        reranker = ParallelLLMRerank(llm=SlowChoiceLLM(), top_n=2)
+        with pytest.raises(ValueError):
+            reranker.postprocess_nodes(_nodes("a"))
+
+
+class TestBM25Rerank:
+    def test_lexical_match_is_promoted(self):
+        nodes = _nodes(
+            "Our office is open Monday to Friday.",
+            "Shipping is free for large orders.",
+            "Refunds are issued within 30 days of purchase.",
+        )
+        result = BM25Rerank(top_n=2).postprocess_nodes(nodes, QueryBundle("How long do refunds take?"))
+        assert result[0].node.id_ == "n2"
+        assert len(result) == 2
+
+    def test_no_lexical_overlap_keeps_retrieval_order(self):
+        result = BM25Rerank(top_n=3).postprocess_nodes(_nodes("a b", "c d", "e f"), QueryBundle("zzz"))
+        assert [n.node.id_ for n in result] == ["n0", "n1", "n2"]
+
+    def test_empty_candidates(self):
+        assert BM25Rerank().postprocess_nodes([], QueryBundle("q")) == []
+
+
+class TestBuildRerankers:
+    def test_all_backends_are_built(self):
+        rerankers = build_rerankers(SlowChoiceLLM(), top_n=3)
+        assert isinstance(rerankers["llm"], ParallelLLMRerank)
+        assert isinstance(rerankers["bm25"], BM25Rerank)
+        assert rerankers["none"] is None
@@ -0,0 +1,212 @@
+import asyncio
+import time
+import pytest
+from llama_index.core.llms import ChatMessage
+from llama_index.embeddings.azure_inference import AzureAIEmbeddingsModel
+from azure_clients import PooledCompletionsModel, close_sessions, resilient_client_kwargs
+from benchmarks.fakes import start_fake_embedding_server
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    HedgedEmbeddingModel,
+    HedgePolicy,
+    call_timeout,
+    remaining_budget,
+    request_deadline,
+)
+
+
+@pytest.fixture
+def fake_server():
+    """Starts fake Azure inference servers; all are shut down after the test."""
+    servers = []
+
+    def start(latency_s=0.005, **kwargs):
+        server, url = start_fake_embedding_server(latency_s, 0.0, **kwargs)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _embed_model(url, breaker, read_timeout=5.0):
+    return AzureAIEmbeddingsModel(
+        endpoint=url, credential="fake", model_name="fake-embed",
+        client_kwargs=resilient_client_kwargs(breaker, 1.0, read_timeout, retry_total=0),
+    )
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=10)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.check()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError) as error:
+            breaker.check()
+        assert error.value.client == "test"
+        assert 1.0 <= error.value.retry_after <= 10
+
+    def test_half_open_lets_one_probe_through(self, mocker):
+        clock = mocker.patch("resilience.time.monotonic", return_value=100.0)
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+        breaker.record_failure()
+        clock.return_value = 110.0
+        breaker.check()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+        clock.return_value = 120.0
+        breaker.check()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.check()
+
+
+class TestDeadline:
+    def test_timeout_is_cut_to_the_remaining_budget(self):
+        assert call_timeout(5.0, "test") == 5.0
+        with request_deadline(1.0):
+            assert 0.9 < call_timeout(5.0, "test") <= 1.0
+            assert call_timeout(0.5, "test") == 0.5
+            with request_deadline(10.0):
+                assert remaining_budget() <= 1.0
+        assert remaining_budget() is None
+
+    def test_spent_budget_raises(self):
+        with request_deadline(0.0):
+            with pytest.raises(DeadlineExceeded):
+                call_timeout(5.0, "test")
+
+
+class TestHedgePolicy:
+    def test_delay_needs_samples_and_is_clamped(self):
+        hedge = HedgePolicy("test", min_delay=0.05, max_delay=1.0, min_samples=5, max_ratio=1.0)
+        assert hedge.delay() is None
+        for seconds in (0.1, 0.1, 0.1, 0.1, 0.3):
+            hedge.observe(seconds)
+        assert 0.1 < hedge.delay() <= 0.3
+        hedge.observe(30.0)
+        assert hedge.delay() == 1.0
+
+    def test_hedges_at_most_max_ratio_of_calls(self):
+        hedge = HedgePolicy("test", min_samples=1, max_ratio=0.25)
+        hedge.observe(0.1)
+        hedges = 0
+        for _ in range(40):
+            if hedge.delay() is not None:
+                hedge._spend()
+                hedges += 1
+        assert hedges <= 11
+
+    def test_slow_call_is_answered_by_the_hedge(self):
+        hedge = HedgePolicy("test", min_delay=0.01, min_samples=1)
+        hedge.observe(0.01)
+        delays = iter([1.0, 0.0])
+
+        async def call():
+            delay = next(delays)
+            await asyncio.sleep(delay)
+            return delay
+
+        start = time.perf_counter()
+        assert asyncio.run(hedge.arun(call)) == 0.0
+        assert time.perf_counter() - start < 0.5
+
+    def test_failed_call_falls_back_to_the_other(self):
+        hedge = HedgePolicy("test", min_delay=0.01, min_samples=1)
+        hedge.observe(0.01)
+        calls = []
+
+        def call():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.05)
+                raise ValueError("boom")
+            time.sleep(0.1)
+            return "ok"
+
+        assert hedge.run(call) == "ok"
+        assert len(calls) == 2
+
+    def test_raises_when_every_call_fails(self):
+        hedge = HedgePolicy("test")
+
+        async def call():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            asyncio.run(hedge.arun(call))
+
+
+class TestAzureClients:
+    def test_hedging_cuts_latency_spikes(self, fake_server):
+        """Every 10th request stalls for 1 s; hedged query embeddings do not wait for it."""
+        server, url = fake_server(spike_every=10, spike_s=1.0)
+        hedge = HedgePolicy("embeddings", min_samples=5, max_ratio=0.5)
+        model = HedgedEmbeddingModel(_embed_model(url, CircuitBreaker("embeddings")), hedge)
+
+        async def run():
+            latencies = []
+            for i in range(30):
+                start = time.perf_counter()
+                await model.aget_query_embedding(f"question {i}")
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        latencies = asyncio.run(run())
+        assert max(latencies[5:]) < 0.8
+        assert server.request_counter["requests"] > 30
+
+    def test_open_circuit_fails_fast_without_calling_the_endpoint(self, fake_server):
+        server, url = fake_server(fail_every=1)
+        breaker = CircuitBreaker("embeddings", failure_threshold=2, reset_timeout=60)
+        model = _embed_model(url, breaker)
+        for _ in range(2):
+            with pytest.raises(Exception):
+                model.get_query_embedding("question")
+        requests = server.request_counter["requests"]
+
+        with pytest.raises(CircuitOpenError):
+            model.get_query_embedding("question")
+        assert server.request_counter["requests"] == requests
+
+    def test_deadline_cuts_a_slow_call_short(self, fake_server):
+        _, url = fake_server(latency_s=2.0)
+        model = _embed_model(url, CircuitBreaker("embeddings"))
+        start = time.perf_counter()
+        with request_deadline(0.2), pytest.raises(DeadlineExceeded):
+            model.get_query_embedding("question")
+        assert time.perf_counter() - start < 1.5
+
+    def test_async_llm_calls_reuse_connections(self, fake_server):
+        server, url = fake_server()
+        llm = PooledCompletionsModel(
+            endpoint=url, credential="fake", model_name="fake-llm",
+            client_kwargs=resilient_client_kwargs(CircuitBreaker("llm"), 1.0, 5.0, retry_total=0),
+        )
+
+        async def run():
+            try:
+                return [await llm.achat([ChatMessage(role="user", content="hi")]) for _ in range(5)]
+            finally:
+                await close_sessions()
+
+        responses = asyncio.run(run())
+        assert responses[-1].message.content == "fake answer"
+        assert server.request_counter["connections"] <= 2
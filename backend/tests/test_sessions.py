@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from registry_store import RegistryStore
+from sessions import SessionStore, count_tokens
+
+ANSWER = "The warranty covers parts and labour for two years from the date of purchase."
+
+
+class TestSessionStore:
+    def test_history_stays_within_budget_as_older_turns_are_summarized(self):
+        calls = []
+
+        async def summarize(summary, turns, max_tokens):
+            calls.append(len(turns))
+            return f"{summary} {len(turns)} earlier questions about the warranty.".strip()
+
+        sessions = SessionStore(summarize=summarize, token_budget=120, summary_tokens=40)
+
+        async def run():
+            session = await sessions.get("chat-1")
+            for i in range(20):
+                await sessions.record(session, f"Question {i} about the warranty?", ANSWER)
+                await sessions.drain()
+            return session
+
+        session = asyncio.run(run())
+        history = session.history()
+        assert calls
+        assert "earlier questions" in session.summary
+        assert history[0].role.value == "system"
+        assert history[-1].content == ANSWER
+        # The budget, plus the "Summary of the conversation so far:" label
+        assert sum(count_tokens(message.content) for message in history) <= 120 + 10
+        assert session.pending == []
+
+    def test_failed_summary_keeps_the_pending_turns_bounded(self):
+        async def summarize(summary, turns, max_tokens):
+            raise RuntimeError("LLM down")
+
+        sessions = SessionStore(summarize=summarize, token_budget=100, summary_tokens=20)
+
+        async def run():
+            session = await sessions.get("chat-1")
+            for i in range(30):
+                await sessions.record(session, f"Question {i}?", ANSWER)
+                await sessions.drain()
+            return session
+
+        session = asyncio.run(run())
+        assert session.summary == ""
+        assert 0 < sum(turn.tokens for turn in session.pending) <= 100
+
+    def test_idle_and_least_recently_used_sessions_are_evicted(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr("sessions.time.monotonic", lambda: now[0])
+        sessions = SessionStore(max_sessions=2, idle_ttl=60)
+
+        async def run():
+            for session_id in ("a", "b", "c"):
+                await sessions.get(session_id)
+            evicted_by_size = "a" not in sessions._sessions
+            now[0] += 61
+            await sessions.get("d")
+            return evicted_by_size
+
+        assert asyncio.run(run())
+        assert list(sessions._sessions) == ["d"]
+        assert sessions.stats()["misses"] == 4
+
+    def test_invalid_session_id_is_rejected(self):
+        with pytest.raises(ValueError):
+            asyncio.run(SessionStore().get("../etc/passwd"))
+
+    def test_another_worker_continues_the_conversation(self, tmp_path):
+        path = str(tmp_path / "registry.sqlite3")
+        first = SessionStore(store=RegistryStore(path))
+        second = SessionStore(store=RegistryStore(path))
+
+        async def run():
+            await first.record(await first.get("chat-1"), "What does the warranty cover?", ANSWER)
+            session = await second.get("chat-1")
+            await second.record(session, "For how long?", "Two years.")
+            return await first.get("chat-1")
+
+        session = asyncio.run(run())
+        assert [turn.question for turn in session.turns] == ["What does the warranty cover?", "For how long?"]
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    def test_concurrent_identical_calls_share_one_computation(self):
+        flight = SingleFlight("test")
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"answer": 42}
+
+        async def run():
+            return await asyncio.gather(*(flight.run("key", compute) for _ in range(10)))
+
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(result == {"answer": 42} for result in results)
+        assert flight.stats() == {"computed": 1, "coalesced": 9, "in_flight": 0}
+
+    def test_different_keys_and_later_calls_compute_again(self):
+        flight = SingleFlight("test")
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0)
+            return len(calls)
+
+        async def run():
+            await asyncio.gather(flight.run("a", compute), flight.run("b", compute))
+            return await flight.run("a", compute)
+
+        assert asyncio.run(run()) == 3
+        assert flight.coalesced == 0
+
+    def test_every_caller_gets_the_exception(self):
+        flight = SingleFlight("test")
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def run():
+            return await asyncio.gather(*(flight.run("key", compute) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert all(isinstance(result, ValueError) for result in results)
+
+    def test_cancelled_caller_does_not_cancel_the_others(self):
+        flight = SingleFlight("test")
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def run():
+            first = asyncio.ensure_future(flight.run("key", compute))
+            second = asyncio.ensure_future(flight.run("key", compute))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            return await second
+
+        assert asyncio.run(run()) == "done"
@@ -1,7 +1,16 @@
 import os
+import json
+import time
+import uuid
 import streamlit as st
 import requests
 
+# (connect, read) timeouts for streamed answers: the read timeout applies between
+# tokens, not to the whole answer, so long RAG responses are no longer cut off.
+STREAM_TIMEOUT = (10, 60)
+# Longest wait for a document's background ingestion before the sidebar gives up on it
+INGESTION_TIMEOUT_S = float(os.getenv("INGESTION_TIMEOUT_S", "1800"))
+
 def display_sources(sources):
     """Renders a collapsible sources expander for RAG responses."""
     if not sources:
@@ -12,11 +21,61 @@ def display_sources(sources):
             st.caption(src["preview"] + "…")
 
 
+def iter_stream_events(response):
+    """Parses the backend's NDJSON answer stream into event dicts."""
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            yield json.loads(line)
+
+
+def stream_tokens(events, sources):
+    """Yields answer tokens for st.write_stream; collects the sources event into `sources`."""
+    for event in events:
+        if event["type"] == "sources":
+            sources.extend(event["sources"])
+        elif event["type"] == "token":
+            yield event["content"]
+        elif event["type"] == "error":
+            raise RuntimeError(event["detail"])
+
+
+def poll_ingestion_job(base_url, job_id):
+    """Shows a sidebar progress bar for a background ingestion job until it finishes, or
+    until INGESTION_TIMEOUT_S has passed; then the job is returned as failed."""
+    progress_bar = st.progress(0.0, text="Queued…")
+    deadline = time.monotonic() + INGESTION_TIMEOUT_S
+    while True:
+        if time.monotonic() > deadline:
+            progress_bar.empty()
+            return {
+                "job_id": job_id,
+                "status": "failed",
+                "error": f"still not processed after {INGESTION_TIMEOUT_S / 60:.0f} minutes; gave up waiting.",
+            }
+        response = requests.get(f"{base_url}/jobs/{job_id}", timeout=10)
+        response.raise_for_status()
+        job = response.json()
+        if job["status"] in ("completed", "failed"):
+            progress_bar.empty()
+            return job
+        if job["stage"] == "embed" and job["chunks_total"]:
+            fraction = job["chunks_done"] / job["chunks_total"]
+            eta = f" · ~{job['eta_seconds']:.0f}s left" if job["eta_seconds"] is not None else ""
+            text = f"Embedding {job['chunks_done']}/{job['chunks_total']} chunks{eta}"
+        else:
+            fraction = {"queued": 0.0, "parse": 0.05, "chunk": 0.1, "store": 0.95}.get(job["stage"], 0.0)
+            text = f"{job['stage'].capitalize()}…"
+        progress_bar.progress(min(fraction, 1.0), text=text)
+        time.sleep(0.5)
+
+
 def display_chat():
     """Displays chat messages stored in session state."""
     if "messages" not in st.session_state or not st.session_state.messages:
         # Initialize default general chat messages
         st.session_state.messages = [{"role": "assistant", "content": "Hello, How can i help you?"}]
+    # The backend keeps the conversation under this ID, so follow-up questions have context
+    st.session_state.setdefault("session_id", uuid.uuid4().hex)
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.write(message["content"])
@@ -26,8 +85,10 @@ def display_chat():
 def clear_chat_history():
     """Clears the chat history and resets the session state."""
     st.session_state.messages = []
+    st.session_state.pop("session_id", None)
     if "chat_engine" in st.session_state:
         del st.session_state.chat_engine
+    st.session_state.pop("document_id", None)
     if "uploaded_file_path" in st.session_state:
         try:
             os.remove(st.session_state.uploaded_file_path)
@@ -53,21 +114,33 @@ def main():
         # File uploader for document (supports PDF and text files)
         uploaded_document = st.file_uploader("Upload Document (PDF or Text)", type=["pdf", "txt"])
 
-        if uploaded_document is not None:
+        # Upload once per selected file, not on every rerun; the backend keys each
+        # upload by its own document ID, which this session then queries.
+        if uploaded_document is not None and st.session_state.get("uploaded_file_id") != uploaded_document.file_id:
             try:
                 files = {"file": (uploaded_document.name, uploaded_document.getvalue())}
-                response = requests.post(f"{FASTAPI_BASE_URL}/upload-document/", files=files, timeout=120)
+                response = requests.post(f"{FASTAPI_BASE_URL}/upload-document/", files=files, timeout=(10, 300))
                 response.raise_for_status()  # Raises an exception for bad status codes
-                st.success(response.json()['message'])
+                st.session_state.uploaded_file_id = uploaded_document.file_id
+                job = poll_ingestion_job(FASTAPI_BASE_URL, response.json()["job_id"])
+                if job["status"] == "completed":
+                    st.session_state.document_id = job["document_id"]
+                    st.success(f"Document '{job['document_name']}' uploaded and processed successfully.")
+                else:
+                    st.error(f"Error processing document: {job['error']}")
             except requests.exceptions.RequestException as e:
                 st.error(f"Error uploading or processing document: {e}")
 
         if st.sidebar.button('Clear Chat History'):
             try:
-                if uploaded_document is None:
+                if "document_id" not in st.session_state:
                     clear_chat_history()
                 else:
-                    response = requests.get(f"{FASTAPI_BASE_URL}/clear-index/", timeout=10)
+                    response = requests.get(
+                        f"{FASTAPI_BASE_URL}/clear-index/",
+                        params={"document_id": st.session_state.document_id},
+                        timeout=10,
+                    )
                     response.raise_for_status()
                     data = response.json()
                     st.success(data['message'])
@@ -78,10 +151,13 @@ def main():
 
     # Main app logic
     try:
-        status_response = requests.get(f"{FASTAPI_BASE_URL}/status/", timeout=10)
+        document_id = st.session_state.get("document_id")
+        status_response = requests.get(
+            f"{FASTAPI_BASE_URL}/status/", params={"document_id": document_id} if document_id else None, timeout=10
+        )
         status_response.raise_for_status()
         status_data = status_response.json()
-        is_document_uploaded = status_data['status']
+        is_document_uploaded = document_id is not None and status_data['status']
 
         display_chat()
 
@@ -91,26 +167,28 @@ def main():
             with st.chat_message("user"):
                 st.write(prompt)  # Display the user's message in the chat
 
+            endpoint = "/document-query/stream/" if is_document_uploaded else "/general-query/stream/"
+            error_label = "Error querying document" if is_document_uploaded else "Error with general query"
+            params = {"question": prompt, "session_id": st.session_state.session_id}
             if is_document_uploaded:
-                response = requests.post(f"{FASTAPI_BASE_URL}/document-query/", params={"question": prompt}, timeout=10)
+                params["document_id"] = document_id
+            with requests.post(
+                f"{FASTAPI_BASE_URL}{endpoint}", params=params, stream=True, timeout=STREAM_TIMEOUT
+            ) as response:
                 if response.status_code == 200:
-                    data = response.json()
-                    sources = data.get("sources", [])
-                    with st.chat_message("assistant"):
-                        st.write(data['answer'])
-                        display_sources(sources)
-                    st.session_state.messages.append({"role": "assistant", "content": data['answer'], "sources": sources})
-                else:
-                    st.error(f"Error querying document: {response.text}")
-            else:
-                response = requests.post(f"{FASTAPI_BASE_URL}/general-query/", params={"question": prompt}, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    with st.chat_message("assistant"):
-                        st.write(data['answer'])
-                    st.session_state.messages.append({"role": "assistant", "content": data['answer']})
+                    sources = []
+                    try:
+                        with st.chat_message("assistant"):
+                            answer = st.write_stream(stream_tokens(iter_stream_events(response), sources))
+                            display_sources(sources)
+                        st.session_state.messages.append({"role": "assistant", "content": answer, "sources": sources})
+                    except RuntimeError as e:
+                        st.error(f"{error_label}: {e}")
+                elif response.status_code == 429:
+                    retry_after = response.headers.get("Retry-After", "a few")
+                    st.warning(f"The server is busy. Please try again in {retry_after} seconds.")
                 else:
-                    st.error(f"Error with general query: {response.text}")
+                    st.error(f"{error_label}: {response.text}")
     except requests.exceptions.RequestException as e:
                 st.error(f"Error with general status check: {e}")
 